@@ -3,6 +3,9 @@ import numpy as np
 import time
 import threading
 
+from backend_apps.common.frame_broadcaster import FrameBroadcaster
+from backend_apps.common.metrics import REGISTRY
+
 class ArgnegService:
     def __init__(self, camera_index=1):
         print(f"[INFO] Inicializando ArgnegService para la cámara {camera_index}...")
@@ -20,8 +23,13 @@ class ArgnegService:
         }
 
         self._running = False
-        self._frame_lock = threading.Lock()
-        self._current_frame = None
+        self.metric_labels = {"app": "arneg", "camera": str(camera_index)}
+        self._stage_hist = {stage: REGISTRY.histogram("antares_stage_seconds", FrameBroadcaster.STAGE_HELP,
+                                                      stage=stage, **self.metric_labels)
+                            for stage in ("read", "process", "draw")}
+        self.read_failures = 0
+        self.broadcaster = FrameBroadcaster("arneg", labels=self.metric_labels)
+        REGISTRY.register_collector("arneg", self._metric_samples)
 
         if not self.cap.isOpened():
             print(f"Error al abrir la cámara {self.camera_index}")
@@ -33,13 +41,19 @@ class ArgnegService:
     def _process_frames(self):
         prev_time = time.time()
         while self._running:
+            read_t0 = time.perf_counter()
             ret, frame = self.cap.read()
+            capture_ts = time.time()
+            read_s = time.perf_counter() - read_t0
+            self._stage_hist["read"].observe(read_s)
             if not ret:
+                self.read_failures += 1
                 print("No se pudo leer el frame")
                 time.sleep(0.1)
                 continue
 
             # Aplicar transformaciones
+            t0 = time.perf_counter()
             alpha = self.params["Contraste"] / 50.0
             beta = (self.params["Brillo"] - 50) * 2
             adjusted = cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
@@ -55,6 +69,8 @@ class ArgnegService:
             # Combinar frame original con los bordes
             output_frame = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
             final_frame = cv2.addWeighted(output_frame, 0.5, adjusted, 0.5, 0)
+            t1 = time.perf_counter()
+            self._stage_hist["process"].observe(t1 - t0)
 
             # FPS
             curr_time = time.time()
@@ -64,29 +80,25 @@ class ArgnegService:
             # Overlay
             text = f"FPS: {fps:.2f} | Th1:{self.params['Canny Th1']} Th2:{self.params['Canny Th2']} Blur:{self.params['Blur']} B:{self.params['Brillo']} C:{self.params['Contraste']}"
             cv2.putText(final_frame, text, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,0), 1, cv2.LINE_AA)
+            t2 = time.perf_counter()
+            self._stage_hist["draw"].observe(t2 - t1)
 
-            with self._frame_lock:
-                self._current_frame = final_frame.copy()
+            self.broadcaster.publish(final_frame, {
+                "capture_ts": capture_ts,
+                "publish_ts": time.time(),
+                "stages_ms": {"read": round(read_s * 1000, 2), "process": round((t1 - t0) * 1000, 2),
+                              "draw": round((t2 - t1) * 1000, 2)},
+            })
 
-            time.sleep(0.01)
+    def generate_frames(self, options=None):
+        try:
+            yield from self.broadcaster.mjpeg_stream(options)
+        except (GeneratorExit, BrokenPipeError):
+            print("[INFO] Cliente de streaming de Argneg desconectado.")
 
-    def generate_frames(self):
-        while self._running:
-            try:
-                with self._frame_lock:
-                    if self._current_frame is None:
-                        time.sleep(0.01)
-                        continue
-                    ret, buffer = cv2.imencode('.jpg', self._current_frame)
-                    if not ret:
-                        continue
-                    frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                time.sleep(0.03)
-            except (GeneratorExit, BrokenPipeError):
-                print("[INFO] Cliente de streaming de Argneg desconectado.")
-                break
+    def _metric_samples(self):
+        return [("antares_capture_read_failures_total", "counter", "Lecturas fallidas de la cámara",
+                 self.metric_labels, self.read_failures)] + self.broadcaster.metric_samples()
 
     def get_status(self):
         return self.params
@@ -99,6 +111,9 @@ class ArgnegService:
 
     def release_resources(self):
         self._running = False
+        self.broadcaster.close()
+        REGISTRY.unregister_collector("arneg")
+        REGISTRY.remove(**self.metric_labels)
         if self.thread.is_alive():
             self.thread.join()
         self.cap.release()
@@ -1,5 +1,10 @@
+import os
+import sys
 import cv2
 import time
+
+# Permitir ejecutar este script directamente: el servicio importa `backend_apps.common`.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 from argneg_service import ArgnegService
 
 if __name__ == "__main__":
@@ -12,9 +17,9 @@ if __name__ == "__main__":
     print("Servicio Arneg inicializado. Presiona 'q' para salir.")
 
     while True:
-        with service._frame_lock:
-            if service._current_frame is not None:
-                cv2.imshow("Arneg Contornos", service._current_frame)
+        frame = service.broadcaster.latest_frame()
+        if frame is not None:
+            cv2.imshow("Arneg Contornos", frame)
         
         key = cv2.waitKey(1) & 0xFF
         if key == ord('q'):
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+
+
+class EventBroadcaster:
+    """Reparte metadatos (dicts JSON) a varios clientes, como FrameBroadcaster con los frames.
+
+    Cada evento se serializa a JSON una sola vez y los clientes esperan en una
+    condición hasta que llega un evento con secuencia nueva. Pensado para
+    consumidores que solo necesitan los datos (ej. detecciones para el MES) y no
+    deben pagar la codificación ni el transporte de JPEG.
+
+    `sse_stream_async` sirve a clientes ASGI (corrutinas): `publish` despierta
+    a cada event loop con una sola llamada.
+    """
+
+    def __init__(self, name="events"):
+        self.name = name
+        self._cond = threading.Condition()
+        self._event = None
+        self._json = None
+        self._seq = 0
+        self._running = True
+        self._loop_events = {} # event loop -> asyncio.Event de sus clientes async
+
+    def publish(self, event):
+        with self._cond:
+            self._event = event
+            self._json = None
+            self._seq += 1
+            self._cond.notify_all()
+        self._wake_loops()
+
+    def _wake_loops(self):
+        for loop in list(self._loop_events):
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError: # Event loop ya cerrado
+                self._loop_events.pop(loop, None)
+
+    def _wake_loop(self, loop):
+        event = self._loop_events.get(loop)
+        if event is not None:
+            self._loop_events[loop] = asyncio.Event()
+            event.set()
+
+    def latest(self):
+        with self._cond:
+            return self._event
+
+    def wait_for_event(self, last_seq, timeout=1.0):
+        """Devuelve (seq, json) del siguiente evento, o (last_seq, None) si vence el timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq or not self._running, timeout)
+            return self._current(last_seq)
+
+    def _current(self, last_seq):
+        # Se llama con self._cond tomado.
+        if self._seq == last_seq or self._event is None:
+            return last_seq, None
+        if self._json is None:
+            self._json = json.dumps(self._event, separators=(",", ":"))
+        return self._seq, self._json
+
+    def sse_stream(self, keepalive=15.0):
+        """Generador text/event-stream (Server-Sent Events) para un cliente."""
+        last_seq = 0
+        idle = 0.0
+        while self._running:
+            seq, data = self.wait_for_event(last_seq, timeout=1.0)
+            if data is None:
+                idle += 1.0
+                if idle >= keepalive:
+                    idle = 0.0
+                    yield ": keepalive\n\n" # Evita que proxies cierren la conexión
+                continue
+            idle = 0.0
+            last_seq = seq
+            yield f"id: {seq}\nevent: {self.name}\ndata: {data}\n\n"
+
+    async def sse_stream_async(self, keepalive=15.0):
+        """Como sse_stream, pero como generador asíncrono para el servidor ASGI."""
+        loop = asyncio.get_running_loop()
+        last_seq = 0
+        idle = 0.0
+        while self._running:
+            with self._cond:
+                seq, data = self._current(last_seq)
+            if data is None:
+                event = self._loop_events.get(loop)
+                if event is None:
+                    event = self._loop_events[loop] = asyncio.Event()
+                try:
+                    await asyncio.wait_for(event.wait(), 1.0)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+                idle += 1.0
+                if idle >= keepalive:
+                    idle = 0.0
+                    yield ": keepalive\n\n"
+                continue
+            idle = 0.0
+            last_seq = seq
+            yield f"id: {seq}\nevent: {self.name}\ndata: {data}\n\n"
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._wake_loops()
@@ -0,0 +1,579 @@
+import asyncio
+import itertools
+import json
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+
+import cv2
+
+from backend_apps.common.metrics import REGISTRY
+
+DEFAULT_QUALITY = 95 # Calidad JPEG por defecto de OpenCV
+MIN_QUALITY = 30
+MIN_WIDTH = 160
+MAX_VARIANTS = 6 # Codificaciones distintas (calidad, ancho, formato) que se mantienen por frame
+# Escalones globales: la calidad y el ancho de cada cliente se redondean a uno de ellos,
+# así los clientes con peticiones parecidas comparten la misma codificación.
+QUALITY_LADDER = (100, 95, 85, 75, 60, 45, MIN_QUALITY)
+WIDTH_LADDER = (1920, 1280, 960, 640, 480, 320, MIN_WIDTH) # Múltiplos de 16, como los bloques JPEG
+FORMATS = {"jpeg": ('.jpg', cv2.IMWRITE_JPEG_QUALITY), "webp": ('.webp', cv2.IMWRITE_WEBP_QUALITY)}
+WS_HEADER = struct.Struct(">IIdHHB3x") # Cabecera fija de cada frame por WebSocket (ver ws_stream)
+WS_WINDOW = 2 # Frames enviados por WebSocket sin confirmar antes de esperar al cliente
+QUEUE_SIZE = 2 # Frames pendientes por cliente; al llenarse se descarta el más antiguo
+EVICT_AFTER_S = 15.0 # Un cliente con frames pendientes sin recoger durante este tiempo se da por muerto
+
+
+class StreamOptions:
+    """Lo que pide un cliente: fps máximos, calidad, ancho, si se adapta solo y formato.
+
+    Se construye con `from_query(request.args)`: `?fps=5&quality=60&width=640&adaptive=0`.
+    `format=webp` solo aplica al WebSocket (el multipart MJPEG siempre es JPEG).
+    """
+
+    def __init__(self, max_fps=None, quality=DEFAULT_QUALITY, width=None, adaptive=True, fmt="jpeg"):
+        self.max_fps = max_fps
+        self.quality = quality
+        self.width = width
+        self.adaptive = adaptive
+        self.format = fmt
+
+    @classmethod
+    def from_query(cls, args):
+        """Lanza ValueError si algún valor no es válido."""
+        options = cls()
+        if args.get("fps"):
+            options.max_fps = float(args["fps"])
+            if options.max_fps <= 0:
+                raise ValueError("fps debe ser mayor que 0")
+        if args.get("quality"):
+            options.quality = int(args["quality"])
+            if not MIN_QUALITY <= options.quality <= 100: # Por debajo el escalón mínimo la subiría sin avisar
+                raise ValueError(f"quality debe estar entre {MIN_QUALITY} y 100")
+        if args.get("width"):
+            options.width = int(args["width"])
+            if options.width < MIN_WIDTH:
+                raise ValueError(f"width debe ser al menos {MIN_WIDTH}")
+        if args.get("adaptive"):
+            options.adaptive = args["adaptive"].lower() not in ("0", "false", "no")
+        if args.get("format"):
+            options.format = args["format"].lower()
+            if options.format not in FORMATS:
+                raise ValueError(f"format debe ser uno de {', '.join(FORMATS)}")
+        return options
+
+
+class _AdaptiveRate:
+    """Baja calidad, ancho y fps de un cliente cuando su socket se atasca, y los recupera despacio.
+
+    Un envío es lento si tarda más que el intervalo entre frames que el cliente
+    pidió (o SLOW_SEND_S): el búfer del socket está lleno y el cliente no da
+    abasto. Cada nivel baja la calidad; con la calidad al mínimo se reduce el
+    ancho y, después, los fps. Tras RECOVER_AFTER envíos rápidos seguidos se
+    sube un nivel. Calidad y ancho salen siempre de QUALITY_LADDER y
+    WIDTH_LADDER (la petición se redondea al escalón inferior), de modo que
+    clientes con peticiones y niveles distintos siguen compartiendo codificación.
+    """
+
+    SLOW_SEND_S = 0.1
+    RECOVER_AFTER = 50
+    WIDTH_STEPS = 3 # Escalones de ancho que se bajan con la calidad ya al mínimo
+    FPS_FACTORS = (1.0, 0.5, 0.25)
+
+    def __init__(self, options):
+        self.options = options
+        self.level = 0
+        self._fast = 0
+        top = next((q for q in QUALITY_LADDER if q <= options.quality), MIN_QUALITY)
+        qualities = [q for q in QUALITY_LADDER if q <= top]
+        # Niveles: (calidad, escalones de ancho bajados, factor de fps)
+        self._levels = [(q, 0, 1.0) for q in qualities]
+        self._levels += [(MIN_QUALITY, step, 1.0) for step in range(1, self.WIDTH_STEPS + 1)]
+        self._levels += [(MIN_QUALITY, self.WIDTH_STEPS, f) for f in self.FPS_FACTORS[1:]]
+
+    def variant(self, frame_width):
+        """(calidad, ancho) a codificar para este cliente; ancho None = tamaño original."""
+        quality, width_steps, _ = self._levels[self.level]
+        # Anchos posibles de mayor a menor; el primero es la petición redondeada al escalón.
+        requested = self.options.width
+        if requested and requested < frame_width:
+            widths = [w for w in WIDTH_LADDER if w <= requested] # requested >= MIN_WIDTH
+        else:
+            widths = [None] + [w for w in WIDTH_LADDER if w < frame_width]
+        return quality, widths[min(width_steps, len(widths) - 1)]
+
+    def min_interval(self):
+        """Segundos mínimos entre frames (0 = sin límite)."""
+        fps = self.options.max_fps
+        factor = self._levels[self.level][2]
+        if factor < 1.0:
+            fps = (fps or 25.0) * factor # Sin fps pedidos se parte de una cámara típica
+        return 1.0 / fps if fps else 0.0
+
+    def record_send(self, seconds):
+        if not self.options.adaptive:
+            return
+        budget = max(self.min_interval(), self.SLOW_SEND_S)
+        if seconds > budget:
+            self._fast = 0
+            if self.level < len(self._levels) - 1:
+                self.level += 1
+        elif seconds < budget / 4:
+            self._fast += 1
+            if self._fast >= self.RECOVER_AFTER and self.level > 0:
+                self.level -= 1
+                self._fast = 0
+
+
+class _Subscriber:
+    """Cola acotada de un cliente MJPEG: el productor añade referencias a frames y nunca espera."""
+
+    def __init__(self, client_id, options, queue_size):
+        self.id = client_id
+        self.rate = _AdaptiveRate(options)
+        self.queue = deque(maxlen=queue_size) # (seq, instante de publicación, frame, metadatos)
+        self.pending_since = None # Desde cuándo hay frames en la cola sin que el cliente recoja ninguno
+        self.evicted = False
+        self.stats = {"sent": 0, "dropped": 0, "skipped": 0, "bytes": 0, "lag_ms": 0.0, "send_ms": 0.0,
+                      "level": 0, "quality": options.quality, "width": options.width}
+
+
+class FrameBroadcaster:
+    """Reparte el último frame procesado a todos los clientes MJPEG.
+
+    El hilo de procesamiento solo publica la referencia al frame (sin codificar)
+    y despierta a los clientes que esperan en la condición. El primer cliente que
+    necesita un frame nuevo lo codifica a JPEG fuera del lock de publicación; el
+    resto reutiliza los mismos bytes, identificados por su número de secuencia.
+    Así el coste de codificación no crece con el número de espectadores y ningún
+    cliente recibe dos veces el mismo frame.
+
+    Cada variante (calidad, ancho, formato) tiene su propia caché, limitada a MAX_VARIANTS:
+    el coste crece con las variantes distintas en uso, no con los clientes. Una
+    variante pedida para el frame actual o el anterior no se expulsa aunque se
+    supere el límite (expulsarla obligaría a recodificar en cada frame); como
+    calidad y ancho van por escalones globales, el número de variantes está acotado.
+
+    Cada cliente tiene su propia cola acotada (QUEUE_SIZE, descarta el más
+    antiguo). `publish` solo añade la referencia a cada cola, sin esperar a
+    nadie, así que un cliente atascado no frena al productor ni a los demás.
+    Un cliente que lleva EVICT_AFTER_S (más su intervalo de fps) con frames en
+    la cola sin recoger ninguno se expulsa: deja de recibir frames (y de retener
+    arrays del pool) y su generador termina. Se mide el progreso sobre la cola,
+    no el último envío, así que una pausa del productor (reconexión RTSP,
+    decodificación en pausa) o un cliente con fps muy bajos no cuentan como muerte.
+
+    Los clientes pueden ser hilos (`mjpeg_stream`, servidor WSGI) o corrutinas
+    (`mjpeg_stream_async`, servidor ASGI). Para las corrutinas `publish` hace
+    una sola llamada por event loop, no una por cliente.
+    """
+
+    STAGE_HELP = "Latencia por etapa del pipeline de video"
+
+    def __init__(self, name="stream", labels=None, queue_size=QUEUE_SIZE, evict_after=EVICT_AFTER_S):
+        self.name = name
+        self.labels = labels or {"app": name}
+        self._encode_hist = REGISTRY.histogram("antares_stage_seconds", self.STAGE_HELP, stage="encode", **self.labels)
+        self._send_hist = REGISTRY.histogram("antares_stage_seconds", self.STAGE_HELP, stage="send", **self.labels)
+        self._client_ids = itertools.count(1)
+        self.queue_size = queue_size
+        self.evict_after = evict_after
+        self._subscribers = {} # id -> _Subscriber
+        self.clients = {} # id -> estadísticas de cada cliente MJPEG conectado
+        self.evicted_clients = 0
+        self._cond = threading.Condition()
+        self._loop_events = {} # event loop -> asyncio.Event que despierta a sus clientes async
+        self._variants_lock = threading.Lock()
+        self._variants = OrderedDict() # (calidad, ancho, formato) -> {"lock", "seq", "jpeg"}, en orden de uso
+        self._frame = None
+        self._meta = None
+        self._recent_meta = deque(maxlen=8) # (seq, metadatos) de los últimos frames
+        self._seq = 0
+        self._running = True
+        self.encoded_frames = 0
+
+    def publish(self, frame, meta=None):
+        """Publica un frame nuevo. El llamador no debe modificarlo después.
+
+        `meta` (dict serializable a JSON, opcional) viaja con el frame en el
+        WebSocket: instante de captura, latencias por etapa, detecciones...
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._frame = frame
+            self._meta = meta
+            self._recent_meta.append((self._seq + 1, meta))
+            self._seq += 1
+            for sub in list(self._subscribers.values()):
+                if sub.pending_since is not None and \
+                        now - sub.pending_since > self.evict_after + sub.rate.min_interval():
+                    self._evict(sub)
+                    continue
+                if len(sub.queue) == sub.queue.maxlen:
+                    sub.stats["dropped"] += 1 # deque con maxlen descarta el más antiguo al añadir
+                elif not sub.queue:
+                    sub.pending_since = now
+                sub.queue.append((self._seq, now, frame, meta))
+            self._cond.notify_all()
+            loops = list(self._loop_events)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError: # Event loop ya cerrado
+                self._loop_events.pop(loop, None)
+
+    def _wake_loop(self, loop):
+        # Se ejecuta en el event loop: despierta a todos sus clientes y deja un evento nuevo para la próxima espera.
+        event = self._loop_events.get(loop)
+        if event is not None:
+            self._loop_events[loop] = asyncio.Event()
+            event.set()
+
+    def _evict(self, sub):
+        # Se llama con self._cond tomado.
+        sub.evicted = True
+        sub.queue.clear()
+        self._subscribers.pop(sub.id, None)
+        self.clients.pop(sub.id, None)
+        self.evicted_clients += 1
+        print(f"[WARN] {self.name}: cliente {sub.id} expulsado (sin recoger frames en {self.evict_after:g}s).")
+
+    def latest_frame(self):
+        with self._cond:
+            return self._frame
+
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """Bloquea hasta que haya un frame con secuencia distinta de `last_seq`.
+
+        Devuelve (seq, frame); frame es None si vence el timeout o se cerró el broadcaster.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq or not self._running, timeout)
+            if self._seq == last_seq or self._frame is None:
+                return last_seq, None
+            return self._seq, self._frame
+
+    def _variant_entry(self, variant, seq):
+        """Entrada de caché de la variante, marcada como usada para el frame `seq`.
+
+        Se llama con self._variants_lock tomado.
+        """
+        entry = self._variants.get(variant)
+        if entry is None:
+            entry = self._variants[variant] = {"lock": threading.Lock(), "seq": 0, "jpeg": None, "used": seq}
+            while len(self._variants) > MAX_VARIANTS:
+                oldest = next(iter(self._variants.values())) # La variante usada hace más tiempo
+                if oldest["used"] >= self._seq - 1:
+                    break # Sigue en uso: todas las demás se usaron después
+                self._variants.popitem(last=False)
+        else:
+            entry["used"] = max(entry["used"], seq)
+            self._variants.move_to_end(variant)
+        return entry
+
+    def get_jpeg(self, last_seq=None, timeout=1.0, quality=DEFAULT_QUALITY, width=None):
+        """Devuelve (seq, bytes) del último frame en la variante pedida, codificándolo una sola vez.
+
+        Si se indica `last_seq`, espera primero a que se publique un frame más nuevo.
+        `width` escala el frame manteniendo la proporción (None = tamaño original).
+        """
+        if last_seq is None:
+            with self._cond:
+                frame, seq = self._frame, self._seq
+        else:
+            seq, frame = self.wait_for_frame(last_seq, timeout)
+        if frame is None:
+            return 0, None
+        return self._encode(seq, frame, quality, width)
+
+    def _encode(self, seq, frame, quality, width, fmt="jpeg"):
+        with self._variants_lock:
+            entry = self._variant_entry((quality, width, fmt), seq)
+        with entry["lock"]:
+            # Si otro cliente ya codificó este frame (o uno más nuevo) en esta variante, se reutiliza:
+            # un cliente retrasado salta al frame más reciente en vez de pagar otra codificación.
+            if seq > entry["seq"]:
+                t0 = time.perf_counter()
+                if width is not None and width < frame.shape[1]:
+                    height = round(frame.shape[0] * width / frame.shape[1])
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                ext, quality_flag = FORMATS[fmt]
+                ret, buffer = cv2.imencode(ext, frame, [quality_flag, quality])
+                self._encode_hist.observe(time.perf_counter() - t0)
+                if ret:
+                    entry["jpeg"], entry["seq"] = buffer.tobytes(), seq
+                    self.encoded_frames += 1
+            return entry["seq"], entry["jpeg"]
+
+    def _subscribe(self, options):
+        with self._cond:
+            sub = _Subscriber(next(self._client_ids), options or StreamOptions(), self.queue_size)
+            if self._frame is not None:
+                sub.queue.append((self._seq, time.monotonic(), self._frame, self._meta)) # Imagen inmediata al conectar
+                sub.pending_since = time.monotonic()
+            self._subscribers[sub.id] = sub
+            self.clients[sub.id] = sub.stats
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._cond:
+            self._subscribers.pop(sub.id, None)
+            self.clients.pop(sub.id, None)
+            sub.queue.clear()
+
+    def _pop_frame(self, sub, last_seq):
+        """Saca el siguiente frame de la cola del cliente: (seq, instante de publicación, frame) o None.
+
+        Se llama con self._cond tomado. Recoger cuenta como progreso para la expulsión.
+        """
+        item = None
+        while sub.queue:
+            candidate = sub.queue.popleft()
+            if candidate[0] > last_seq and (not sub.rate.min_interval() or not sub.queue):
+                item = candidate
+                break
+            # Con fps limitados solo interesa el más reciente; el resto se salta.
+            sub.stats["skipped"] += 1
+        sub.pending_since = time.monotonic() if sub.queue else None
+        return item
+
+    def _next_frame(self, sub, last_seq, timeout=1.0):
+        with self._cond:
+            self._cond.wait_for(lambda: sub.queue or sub.evicted or not self._running, timeout)
+            return self._pop_frame(sub, last_seq)
+
+    def _cached_jpeg(self, seq, quality, width, fmt="jpeg"):
+        """(seq, bytes) si la variante ya tiene este frame o uno más nuevo, sin esperar al lock de codificación."""
+        with self._variants_lock:
+            entry = self._variants.get((quality, width, fmt))
+            if entry is None or entry["seq"] < seq:
+                return None
+            self._variant_entry((quality, width, fmt), seq)
+            return entry["seq"], entry["jpeg"]
+
+    def _pace_wait(self, sub, last_start):
+        """Segundos a esperar antes del siguiente frame por el límite de fps del cliente."""
+        interval = sub.rate.min_interval()
+        return last_start + interval - time.perf_counter() if interval else 0.0
+
+    def _record_send(self, sub, seconds, nbytes, published, quality, width, rate_seconds=None):
+        now = time.monotonic()
+        self._send_hist.observe(seconds)
+        sub.rate.record_send(seconds if rate_seconds is None else rate_seconds)
+        stats = sub.stats
+        stats.update(sent=stats["sent"] + 1, bytes=stats["bytes"] + nbytes, send_ms=round(seconds * 1000, 2),
+                     lag_ms=round((now - published) * 1000, 2), level=sub.rate.level,
+                     quality=quality, width=width)
+
+    @staticmethod
+    def _multipart(jpeg):
+        return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+    def mjpeg_stream(self, options=None):
+        """Generador multipart/x-mixed-replace para un cliente (ver StreamOptions)."""
+        sub = self._subscribe(options)
+        last_seq, last_start = 0, 0.0
+        try:
+            while self._running and not sub.evicted:
+                # Limitar fps: se espera y después se toma el frame más reciente de la cola.
+                wait = self._pace_wait(sub, last_start)
+                if wait > 0:
+                    time.sleep(wait)
+                item = self._next_frame(sub, last_seq)
+                if item is None:
+                    continue
+                seq, published, frame, _ = item
+                frame_width = frame.shape[1]
+                quality, width = sub.rate.variant(frame_width)
+                seq, jpeg = self._encode(seq, frame, quality, width)
+                del frame, item # No retener el array del pool mientras se escribe en el socket
+                if jpeg is None or seq <= last_seq:
+                    continue
+                last_seq = seq
+                t0 = time.perf_counter()
+                # El generador queda suspendido mientras el servidor escribe en el socket del cliente.
+                yield self._multipart(jpeg)
+                last_start = t0
+                self._record_send(sub, time.perf_counter() - t0, len(jpeg), published, quality, width or frame_width)
+        finally:
+            self._unsubscribe(sub)
+
+    async def _wait_async(self, timeout):
+        loop = asyncio.get_running_loop()
+        event = self._loop_events.get(loop)
+        if event is None:
+            event = self._loop_events[loop] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def mjpeg_stream_async(self, options=None):
+        """Igual que mjpeg_stream pero como generador asíncrono: un cliente = una corrutina.
+
+        Si la variante ya está codificada se envía sin salir del event loop; si no,
+        la codificación va a un hilo del executor (cv2 libera el GIL).
+        """
+        loop = asyncio.get_running_loop()
+        sub = self._subscribe(options)
+        last_seq, last_start = 0, 0.0
+        try:
+            while self._running and not sub.evicted:
+                wait = self._pace_wait(sub, last_start)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                with self._cond:
+                    item = self._pop_frame(sub, last_seq)
+                if item is None:
+                    await self._wait_async(1.0)
+                    continue
+                seq, published, frame, _ = item
+                frame_width = frame.shape[1]
+                quality, width = sub.rate.variant(frame_width)
+                cached = self._cached_jpeg(seq, quality, width)
+                if cached is None:
+                    cached = await loop.run_in_executor(None, self._encode, seq, frame, quality, width)
+                seq, jpeg = cached
+                del frame, item
+                if jpeg is None or seq <= last_seq:
+                    continue
+                last_seq = seq
+                t0 = time.perf_counter()
+                # El servidor ASGI reanuda el generador cuando el transporte acepta más datos.
+                yield self._multipart(jpeg)
+                last_start = t0
+                self._record_send(sub, time.perf_counter() - t0, len(jpeg), published, quality, width or frame_width)
+        finally:
+            self._unsubscribe(sub)
+
+    async def ws_stream(self, send_bytes, receive_text, options=None, window=WS_WINDOW):
+        """Sesión WebSocket de un cliente: frames binarios con cabecera y control de flujo por acks.
+
+        `send_bytes` y `receive_text` son las corrutinas del WebSocket del servidor
+        (ej. Starlette). Cada mensaje binario es:
+
+            24 bytes big-endian: longitud del JSON (uint32), seq (uint32),
+                instante de envío (float64, epoch s), calidad (uint16), ancho (uint16),
+                formato (uint8: 0 = jpeg, 1 = webp) y 3 bytes de relleno
+            JSON con los metadatos publicados con el frame (captura, latencias, detecciones)
+            imagen JPEG o WebP
+
+        El cliente responde `{"ack": seq}` al mostrar cada frame. Con `window`
+        frames sin confirmar no se envía más: los nuevos se descartan en la cola
+        del cliente (el más antiguo primero) y el tiempo hasta el ack alimenta la
+        adaptación de calidad/ancho/fps. Termina al desconectarse el cliente
+        (`receive_text` lanza) o si se le expulsa por no confirmar.
+        """
+        loop = asyncio.get_running_loop()
+        sub = self._subscribe(options)
+        fmt = sub.rate.options.format
+        inflight = {} # seq -> (instante de envío, publicación, bytes, calidad, ancho)
+        acked = asyncio.Event()
+
+        async def read_acks():
+            while True:
+                try:
+                    seq = int(json.loads(await receive_text()).get("ack", 0))
+                except (ValueError, TypeError, AttributeError):
+                    continue
+                sent = inflight.pop(seq, None)
+                # Los acks de frames anteriores quedan implícitos: el cliente ya va por delante.
+                for old in [s for s in inflight if s < seq]:
+                    inflight.pop(old)
+                if sent is not None:
+                    t0, published, nbytes, quality, width = sent
+                    rtt = time.perf_counter() - t0
+                    # Con `window` frames en vuelo, el cliente da abasto mientras rtt / window quepa en su intervalo.
+                    self._record_send(sub, rtt, nbytes, published, quality, width, rate_seconds=rtt / window)
+                acked.set()
+
+        reader = asyncio.create_task(read_acks())
+        last_seq, last_start = 0, 0.0
+        try:
+            while self._running and not sub.evicted and not reader.done():
+                if len(inflight) >= window:
+                    acked.clear()
+                    try:
+                        await asyncio.wait_for(acked.wait(), 1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                wait = self._pace_wait(sub, last_start)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                with self._cond:
+                    item = self._pop_frame(sub, last_seq)
+                if item is None:
+                    await self._wait_async(1.0)
+                    continue
+                seq, published, frame, meta = item
+                frame_width = frame.shape[1]
+                quality, width = sub.rate.variant(frame_width)
+                cached = self._cached_jpeg(seq, quality, width, fmt)
+                if cached is None:
+                    cached = await loop.run_in_executor(None, self._encode, seq, frame, quality, width, fmt)
+                image_seq, image = cached
+                del frame, item
+                if image is None or image_seq <= last_seq:
+                    continue
+                if image_seq != seq:
+                    # Otro cliente ya codificó un frame más nuevo: se envía ese, con sus metadatos.
+                    meta = next((m for s, m in list(self._recent_meta) if s == image_seq), None)
+                last_seq = image_seq
+                meta_json = json.dumps(meta or {}, separators=(",", ":")).encode()
+                header = WS_HEADER.pack(len(meta_json), image_seq, time.time(), quality, width or frame_width,
+                                        list(FORMATS).index(fmt))
+                t0 = time.perf_counter()
+                inflight[image_seq] = (t0, published, len(image), quality, width or frame_width)
+                await send_bytes(header + meta_json + image)
+                last_start = t0
+        finally:
+            self._unsubscribe(sub)
+            reader.cancel()
+            # Esperar al lector para que no quede leyendo de un socket ya cerrado; su excepción
+            # (desconexión del cliente) se recoge aquí y no se registra como error.
+            await asyncio.gather(reader, return_exceptions=True)
+
+    def metric_samples(self):
+        """Muestras para el colector de /metrics: clientes y frames por cliente."""
+        clients = dict(self.clients)
+        samples = [("antares_stream_clients", "gauge", "Clientes MJPEG conectados", self.labels, len(clients)),
+                   ("antares_stream_encoded_frames_total", "counter", "Frames codificados (JPEG o WebP)", self.labels,
+                    self.encoded_frames),
+                   ("antares_stream_evicted_clients_total", "counter", "Clientes expulsados por no consumir frames",
+                    self.labels, self.evicted_clients),
+                   ("antares_stream_variants", "gauge", "Variantes (calidad, ancho) codificadas en caché", self.labels,
+                    len(self._variants))]
+        for client_id, stats in clients.items():
+            labels = {**self.labels, "client": client_id}
+            samples += [("antares_stream_client_sent_frames_total", "counter", "Frames enviados al cliente", labels, stats["sent"]),
+                        ("antares_stream_client_dropped_frames_total", "counter",
+                         "Frames descartados de la cola del cliente por ir más lento que el productor", labels,
+                         stats["dropped"]),
+                        ("antares_stream_client_skipped_frames_total", "counter",
+                         "Frames saltados por el límite de fps o porque el cliente ya envió uno más nuevo", labels,
+                         stats["skipped"]),
+                        ("antares_stream_client_sent_bytes_total", "counter", "Bytes JPEG enviados al cliente", labels,
+                         stats["bytes"]),
+                        ("antares_stream_client_lag_seconds", "gauge",
+                         "Retraso entre la publicación del último frame enviado y el fin de su envío", labels,
+                         stats["lag_ms"] / 1000),
+                        ("antares_stream_client_send_seconds", "gauge", "Duración del último envío al cliente", labels,
+                         stats["send_ms"] / 1000),
+                        ("antares_stream_client_quality", "gauge", "Calidad JPEG actual del cliente", labels, stats["quality"]),
+                        ("antares_stream_client_width", "gauge", "Ancho actual del video del cliente", labels, stats["width"]),
+                        ("antares_stream_client_backoff_level", "gauge",
+                         "Nivel de degradación adaptativa del cliente (0 = lo pedido)", labels, stats["level"])]
+        return samples
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            loops = list(self._loop_events)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:
+                pass
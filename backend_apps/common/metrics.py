@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Límites de los buckets en segundos: de 1 ms a 5 s, suficiente desde la lectura
+# de un frame hasta una inferencia lenta en CPU.
+DEFAULT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+class Histogram:
+    """Histograma acumulativo (formato Prometheus) más una ventana de muestras recientes.
+
+    Los buckets dan la distribución desde el arranque; la ventana permite dar
+    p50/p95/p99 de los últimos `window` valores en get_status.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1024):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # +Inf al final
+        self._sum = 0.0
+        self._count = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += seconds
+            self._count += 1
+            self._recent.append(seconds)
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def percentiles(self, qs=(50, 95, 99)):
+        """Percentiles de la ventana reciente en ms ({} si no hay muestras)."""
+        with self._lock:
+            recent = sorted(self._recent)
+        if not recent:
+            return {}
+        return {q: round(recent[min(len(recent) - 1, int(len(recent) * q / 100))] * 1000, 2) for q in qs}
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, total = [], 0
+            for c in self._counts:
+                total += c
+                cumulative.append(total)
+            return cumulative, self._sum, self._count
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso, expuesto por /metrics en formato texto de Prometheus.
+
+    Los histogramas se crean bajo demanda por (nombre, etiquetas). El resto de
+    valores (contadores y niveles de cola que ya llevan los servicios) se leen al
+    vuelo con colectores: funciones que devuelven tuplas
+    (nombre, tipo, ayuda, etiquetas, valor).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {} # (nombre, etiquetas) -> Histogram
+        self._help = {}
+        self._collectors = {}
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+                self._help[name] = help_text
+            return self._histograms[key]
+
+    def remove(self, **labels):
+        """Elimina los histogramas cuyas etiquetas incluyan `labels` (ej. una cámara que se detiene)."""
+        with self._lock:
+            for key in [k for k in self._histograms if set(labels.items()) <= set(k[1])]:
+                del self._histograms[key]
+
+    def register_collector(self, key, fn):
+        with self._lock:
+            self._collectors[key] = fn
+
+    def unregister_collector(self, key):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def render(self):
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            collectors = list(self._collectors.values())
+        lines, declared = [], set()
+        for (name, labels), hist in histograms:
+            labels = dict(labels)
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative, total, count = hist.snapshot()
+            for le, c in zip([*map(str, hist.buckets), "+Inf"], cumulative):
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': le})} {c}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        samples = []
+        for fn in collectors:
+            try:
+                samples.extend(fn())
+            except Exception as e: # Un servicio a medio cerrar no debe tumbar /metrics
+                print(f"[WARN] Colector de métricas falló: {e}")
+        for name, kind, help_text, labels, value in sorted(samples, key=lambda s: s[0]):
+            if value is None:
+                continue
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_format_labels(labels)} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
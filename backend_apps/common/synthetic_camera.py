@@ -0,0 +1,57 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from backend_apps.common.frame_broadcaster import FrameBroadcaster
+
+
+class SyntheticCamera:
+    """Cámara sintética para pruebas de carga del streaming, sin hardware ni RTSP.
+
+    Publica a `fps` frames con contenido que cambia (gradiente con ruido, una
+    caja que se mueve y un contador) en un FrameBroadcaster normal, así que los
+    clientes pagan lo mismo que con una cámara real: codificación JPEG de un
+    frame distinto cada vez, colas por cliente y envío.
+    """
+
+    def __init__(self, width=1280, height=720, fps=25.0, name="synthetic"):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.broadcaster = FrameBroadcaster(name, labels={"app": name, "camera": "0"})
+        self.frames = 0
+        self._background = np.tile(np.linspace(40, 200, width, dtype=np.uint8)[None, :, None], (height, 1, 3))
+        self._noise = np.random.default_rng(0).integers(0, 24, (height, width, 3), dtype=np.uint8)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _render(self, n):
+        frame = self._background.copy()
+        frame += np.roll(self._noise, n * 7, axis=1) # El ruido evita que el JPEG salga artificialmente pequeño
+        box = min(self.width, self.height) // 6
+        x = int((self.width - box) * (0.5 + 0.5 * np.sin(n / 40)))
+        y = int((self.height - box) * (0.5 + 0.5 * np.cos(n / 55)))
+        cv2.rectangle(frame, (x, y), (x + box, y + box), (0, 200, 255), -1)
+        cv2.putText(frame, f"SYNTH {n}", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2, cv2.LINE_AA)
+        return frame
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        next_t = time.perf_counter()
+        while self._running:
+            self.broadcaster.publish(self._render(self.frames))
+            self.frames += 1
+            next_t += interval
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_t = time.perf_counter() # Sin CPU para mantener los fps: no acumular retraso
+
+    def release_resources(self):
+        self._running = False
+        self.broadcaster.close()
+        self._thread.join(timeout=2)
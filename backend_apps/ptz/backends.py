@@ -0,0 +1,146 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from backend_apps.ptz.inference import EMPTY_DETECTIONS
+
+# Backends de inferencia sin PyTorch para el YOLOv5 exportado con tools/export_yolov5.py.
+# Mismo contrato que YoloV5Detector: names, set_thresholds, set_classes y
+# detect_batch(frames, size) -> lista de arrays Nx6 (x1, y1, x2, y2, conf, clase).
+
+MAX_DETECTIONS = 300
+
+
+def load_names(names_path):
+    """Nombres de clase guardados junto al modelo exportado (<modelo>.names.json)."""
+    try:
+        with open(names_path) as f:
+            return {int(k): v for k, v in json.load(f).items()}
+    except FileNotFoundError:
+        print(f"[WARN] No existe {names_path}; se usan ids como nombres de clase.")
+        return {i: f"id{i}" for i in range(1000)}
+
+
+def letterbox_batch(frames, size, stride=32):
+    """Reescala cada frame (lado mayor = size) y los rellena a una forma común múltiplo de stride.
+
+    Devuelve el tensor NCHW float32 RGB normalizado y, por frame, (escala, pad_x, pad_y).
+    """
+    scaled = []
+    for f in frames:
+        h, w = f.shape[:2]
+        r = min(size / h, size / w)
+        scaled.append((r, (max(1, round(w * r)), max(1, round(h * r)))))
+    th = -(-max(s[1] for _, s in scaled) // stride) * stride
+    tw = -(-max(s[0] for _, s in scaled) // stride) * stride
+    batch = np.full((len(frames), th, tw, 3), 114, np.uint8)
+    meta = []
+    for i, (f, (r, (nw, nh))) in enumerate(zip(frames, scaled)):
+        px, py = (tw - nw) // 2, (th - nh) // 2
+        resized = f if (nw, nh) == (f.shape[1], f.shape[0]) else cv2.resize(f, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        batch[i, py:py + nh, px:px + nw] = resized
+        meta.append((r, px, py))
+    # BGR -> RGB, NHWC -> NCHW, 0..1
+    tensor = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+    tensor *= 1 / 255.0
+    return tensor, meta
+
+
+def postprocess(pred, meta, frames, conf, iou, classes):
+    """Salida cruda de YOLOv5 (N, anchors, 5 + clases) -> detecciones Nx6 en píxeles del frame."""
+    results = []
+    for p, (r, px, py), f in zip(pred, meta, frames):
+        p = p[p[:, 4] > conf]
+        if len(p) == 0:
+            results.append(EMPTY_DETECTIONS)
+            continue
+        scores = p[:, 5:] * p[:, 4:5]
+        cls = scores.argmax(1)
+        score = scores[np.arange(len(p)), cls]
+        keep = score > conf
+        if classes:
+            keep &= np.isin(cls, classes)
+        p, cls, score = p[keep], cls[keep], score[keep]
+        if len(p) == 0:
+            results.append(EMPTY_DETECTIONS)
+            continue
+        xy, wh = p[:, :2], p[:, 2:4]
+        boxes = np.concatenate([xy - wh / 2, xy + wh / 2], 1)
+        # NMS por clase desplazando las cajas de cada clase (como en YOLOv5).
+        offset = cls[:, None].astype(np.float32) * 4096
+        nms_boxes = boxes + offset
+        idx = cv2.dnn.NMSBoxes(np.concatenate([nms_boxes[:, :2], nms_boxes[:, 2:] - nms_boxes[:, :2]], 1).tolist(),
+                               score.tolist(), conf, iou)
+        idx = np.array(idx, int).reshape(-1)[:MAX_DETECTIONS]
+        boxes = boxes[idx]
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - px) / r).clip(0, f.shape[1])
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - py) / r).clip(0, f.shape[0])
+        results.append(np.concatenate([boxes, score[idx, None], cls[idx, None]], 1).astype(np.float32))
+    return results
+
+
+class _ExportedYoloDetector:
+    """Pre y postproceso en numpy/OpenCV común a los backends exportados."""
+
+    def __init__(self, model_path, size=640, names_path=None):
+        self.model_path = model_path
+        self.size = size
+        self.names = load_names(names_path or os.path.splitext(model_path)[0] + ".names.json")
+        self.conf = 0.25
+        self.iou = 0.45
+        self.classes = None
+
+    def set_thresholds(self, conf=None, iou=None):
+        if conf is not None:
+            self.conf = conf
+        if iou is not None:
+            self.iou = iou
+
+    def set_classes(self, classes):
+        self.classes = list(classes) if classes else None
+
+    def _run(self, tensor):
+        raise NotImplementedError
+
+    def detect_batch(self, frames, size=None):
+        tensor, meta = letterbox_batch(frames, size or self.size)
+        pred = self._run(tensor)
+        return postprocess(pred, meta, frames, self.conf, self.iou, self.classes)
+
+
+class OnnxYoloDetector(_ExportedYoloDetector):
+    """YOLOv5 exportado a ONNX ejecutado con ONNX Runtime (CPU o CUDA si está disponible)."""
+
+    def __init__(self, model_path, size=640, names_path=None, threads=0):
+        super().__init__(model_path, size, names_path)
+        import onnxruntime as ort # Opcional: solo con INFERENCE_BACKEND = "onnx"
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in ort.get_available_providers()]
+        self.session = ort.InferenceSession(model_path, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_type = np.float16 if "float16" in self.session.get_inputs()[0].type else np.float32
+        print(f"[ONNX] {os.path.basename(model_path)} cargado ({self.session.get_providers()[0]}).")
+
+    def _run(self, tensor):
+        return self.session.run(None, {self.input_name: tensor.astype(self.input_type, copy=False)})[0].astype(np.float32)
+
+
+class OpenVinoYoloDetector(_ExportedYoloDetector):
+    """YOLOv5 convertido a OpenVINO IR (.xml/.bin), pensado para CPUs Intel sin GPU."""
+
+    def __init__(self, model_path, size=640, names_path=None, threads=0, device="CPU"):
+        super().__init__(model_path, size, names_path)
+        import openvino as ov # Opcional: solo con INFERENCE_BACKEND = "openvino"
+        core = ov.Core()
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        self.compiled = core.compile_model(core.read_model(model_path), device, config)
+        self.output = self.compiled.output(0)
+        print(f"[OpenVINO] {os.path.basename(model_path)} cargado en {device}.")
+
+    def _run(self, tensor):
+        return self.compiled(tensor)[self.output].astype(np.float32)
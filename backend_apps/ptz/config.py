@@ -0,0 +1,62 @@
+import os
+
+# ===================== CONFIG USUARIO (desde constants.py o similar) =====================
+# Por ahora, usaremos valores por defecto o los cargaremos de un archivo de configuración
+# que crearemos más adelante.
+# Para la refactorización, asumiremos que estos valores se pasarán al servicio o se cargarán.
+# Ejemplo de configuración por defecto:
+DEFAULT_CONFIG = {
+    "IP": "192.168.1.19",
+    "USER": "admin",
+    "PASS": "uijgbv88",
+    "RTSP_PORT": 554,
+    "RTSP_PATH": "/12",
+    "ONVIF_PORT": 8080,
+    "USE_CUSTOM_WEIGHTS": False,
+    "WEIGHTS": "/path/a/tu/best.pt", # Asegúrate de que esta ruta sea válida si USE_CUSTOM_WEIGHTS es True
+    "MODEL_NAME": "yolov5s",
+    "INFERENCE_BACKEND": "torch", # "torch" (Torch Hub), "onnx" (ONNX Runtime) u "openvino"
+    "MODEL_PRECISION": "fp32", # "fp32", "fp16" o "int8" (variantes de tools/export_yolov5.py)
+    "MODEL_DIR": os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"), # Modelos exportados
+    "YOLO_CONF_THRESHOLD": 0.4, # Umbral de confianza inicial
+    "YOLO_IOU_THRESHOLD": 0.45, # Umbral de IoU inicial
+    "YOLO_CLASSES": [], # Clases permitidas (nombres o ids); vacío = todas
+    "ROI": [], # Polígonos [[x, y], ...] en píxeles del frame; YOLO solo mira su rectángulo envolvente
+    "YOLO_STRIDE_N": 2, # Stride N inicial (solo con ADAPTIVE_STRIDE desactivado)
+    "ADAPTIVE_STRIDE": 1, # 1 = el stride de YOLO/Face/Body se ajusta solo según la latencia medida
+    "TARGET_FPS": 15, # FPS de salida objetivo para el stride adaptativo
+    "LATENCY_BUDGET_MS": 120, # Coste máximo de detectores en un mismo frame
+    "MOTION_GATE": 1, # 1 = no ejecutar detectores si la escena no cambia
+    "MOTION_THRESHOLD": 1, # % de píxeles (frame reducido) que deben cambiar para disparar los detectores
+    "MOTION_MAX_IDLE_S": 2, # Segundos máximos sin ejecutar detectores aunque no haya movimiento
+    "PAN_SPEED": 0.5,
+    "TILT_SPEED": 0.5,
+    "ZOOM_SPEED": 0.5,
+    "COLOR_PUNTOS": [0, 255, 0],
+    "COLOR_LINEAS": [255, 0, 0],
+    "GROSOR_PUNTOS": 1,
+    "GROSOR_LINEAS": 1,
+    "CLIENT_OVERLAY": 0, # 1 = video sin anotar; el navegador dibuja cajas/landmarks desde los metadatos
+    "PASSTHROUGH": 1, # 1 = sin YOLO/Face/Body, el H.264 de la cámara va al navegador sin decodificar (MP4 fragmentado)
+    "PASSTHROUGH_FRAGMENT_MS": 200, # Duración de cada fragmento MP4 (latencia mínima del passthrough)
+    "FRAME_WIDTH": 640, # Resolución de inferencia; ffmpeg escala el stream a este tamaño
+    "FRAME_HEIGHT": 352,
+    "CAPTURE_FPS": 0, # 0 = fps nativos de la cámara; si no, ffmpeg decima a este valor
+    "HWACCEL": None, # Decodificación por hardware en ffmpeg, ej. "auto", "vaapi", "cuda"
+    "INFERENCE_MAX_BATCH": 8, # Máximo de cámaras por forward del modelo compartido
+    "INFERENCE_MODE": "thread", # "thread" = en este proceso; "process" = proceso worker aparte (sin GIL compartido)
+    "INFERENCE_WORKER_THREADS": 0, # Hilos de inferencia (torch en el worker, ONNX Runtime/OpenVINO); 0 = por defecto
+}
+
+# Cámaras PTZ que puede gestionar el servidor. Cada entrada sobrescribe DEFAULT_CONFIG.
+# Todas comparten un único modelo YOLOv5 con inferencia por lotes.
+CAMERAS = {
+    "default": {},
+    # "linea2": {"IP": "192.168.1.20", "YOLO_CLASSES": ["bottle", "cup"],
+    #            "ROI": [[[80, 60], [560, 60], [560, 300], [80, 300]]]},
+}
+
+def get_camera_config(camera_id="default"):
+    if camera_id not in CAMERAS:
+        raise KeyError(f"Cámara PTZ desconocida: {camera_id}")
+    return {**DEFAULT_CONFIG, **CAMERAS[camera_id], "CAMERA_ID": camera_id}
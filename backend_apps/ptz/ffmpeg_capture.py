@@ -0,0 +1,346 @@
+import json
+import subprocess
+import threading
+import time
+import weakref
+
+import numpy as np
+
+
+class _Lease:
+    """Préstamo de un array del pool.
+
+    El frame entregado (y cualquier vista o recorte que se saque de él) apunta a
+    este objeto como `base`, así que vive exactamente mientras alguien use el
+    frame; al recogerse, `weakref.finalize` devuelve el array al pool.
+    """
+
+    def __init__(self, array):
+        self.__array_interface__ = array.__array_interface__
+        self.array = array
+
+
+class FramePool:
+    """Pool de arrays preasignados que se reciclan sin pasar por el allocator.
+
+    `acquire` presta un array: quien lo reciba (buffer de captura, broadcaster,
+    un cliente codificando) puede dibujar sobre él y publicarlo sin copiarlo, y
+    vuelve al pool cuando se suelta la última referencia al frame o a una vista
+    suya. Si todos están prestados el pool crece hasta `max_size`; por encima se
+    entregan arrays sueltos (`overflow`) que no se reciclan, así la memoria
+    retenida por el pool queda acotada aunque un cliente atascado retenga frames.
+    """
+
+    def __init__(self, shape, size=4, max_size=16):
+        self.shape = shape
+        self.max_size = max(size, max_size)
+        self._free = [np.empty(shape, np.uint8) for _ in range(size)]
+        self._size = size
+        self._lock = threading.RLock() # El finalizador puede ejecutarse dentro de acquire (GC)
+        self.grown = 0
+        self.overflow = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                array = self._free.pop()
+            elif self._size < self.max_size:
+                array = np.empty(self.shape, np.uint8)
+                self._size += 1
+                self.grown += 1
+            else:
+                self.overflow += 1
+                return np.empty(self.shape, np.uint8)
+        lease = _Lease(array)
+        weakref.finalize(lease, self._release, array)
+        return np.asarray(lease)
+
+    def _release(self, array):
+        with self._lock:
+            self._free.append(array)
+
+    def free_count(self):
+        return len(self._free)
+
+    def __len__(self):
+        return self._size
+
+
+class LatestFrameBuffer:
+    """Guarda solo el frame más reciente y se lo entrega en propiedad al consumidor.
+
+    Si el consumidor no recogió el frame anterior a tiempo, se descarta (se cuenta
+    en `dropped`) y su array vuelve al pool automáticamente.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._latest = None
+        self._latest_ts = 0.0
+        self._seq = 0
+        self.dropped = 0
+        self.acquired_ts = 0.0 # Instante de captura del último frame entregado
+
+    def commit(self, frame):
+        """Publica `frame` como el más reciente."""
+        with self._cond:
+            if self._latest is not None:
+                self.dropped += 1
+            self._latest = frame
+            self._latest_ts = time.time()
+            self._seq += 1
+            self._cond.notify_all()
+
+    def acquire_latest(self, last_seq, timeout=0.5):
+        """Espera un frame más nuevo que `last_seq` y lo entrega en propiedad.
+
+        Devuelve (seq, array) o (last_seq, None) si vence el timeout.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._latest is not None and self._seq != last_seq, timeout)
+            if self._latest is None or self._seq == last_seq:
+                return last_seq, None
+            frame, self._latest = self._latest, None
+            self.acquired_ts = self._latest_ts
+            return self._seq, frame
+
+
+class FFmpegCapture:
+    """Captura RTSP con ffmpeg en un hilo dedicado que vacía la tubería continuamente.
+
+    ffmpeg entrega los frames ya escalados a `width`x`height` (y decimados a `fps`
+    si se indica), de modo que se puede usar el stream principal de la cámara sin
+    romper el encuadre ni escalar en Python. Con `hwaccel` se delega la
+    decodificación H.264/H.265 a la GPU/VAAPI cuando está disponible.
+
+    Un supervisor relanza ffmpeg con backoff exponencial cuando el proceso termina
+    (la cámara cerró la sesión RTSP) o deja de entregar frames.
+
+    Los frames se leen con `readinto` directamente sobre arrays de un `FramePool`,
+    sin objetos `bytes` intermedios ni copias. Cada frame se completa acumulando
+    lecturas cortas hasta tener exactamente `frame_size` bytes; un frame cortado
+    por EOF se descarta, así el encuadre nunca queda desalineado. La inferencia toma siempre el frame
+    más reciente de `buffer`, de modo que la latencia queda acotada a un periodo
+    de inferencia aunque el modelo sea lento.
+    """
+
+    RECONNECT_MIN_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 10.0
+    STALL_TIMEOUT = 5.0 # Segundos sin frames antes de dar la conexión por colgada
+
+    def __init__(self, rtsp_url, width, height, fps=None, hwaccel=None, pool_size=6, read_histogram=None):
+        self.rtsp_url = rtsp_url
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.hwaccel = hwaccel
+        self.native_size = None
+        self.native_fps = None
+        self._probe_failed = False # No repetir ffprobe (timeout de 10 s) en cada reintento con la cámara caída
+        self.frame_size = width * height * 3
+        self.pool = FramePool((height, width, 3), pool_size)
+        self.buffer = LatestFrameBuffer()
+        self.process = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._last_frame_ts = 0.0
+        self.state = "stopped"
+        self.reconnects = 0
+        self.last_error = None
+
+        # Contadores de encuadre (expuestos en get_status del servicio)
+        self.frames_read = 0
+        self.short_reads = 0
+        self.partial_frames = 0
+        # Tiempo esperando un frame completo en la tubería (incluye la decodificación en ffmpeg)
+        self.read_histogram = read_histogram
+
+    def probe(self):
+        """Consulta con ffprobe la resolución y fps nativos del stream."""
+        command = [
+            'ffprobe', '-v', 'error',
+            '-rtsp_transport', 'tcp',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,avg_frame_rate',
+            '-of', 'json',
+            self.rtsp_url,
+        ]
+        try:
+            out = subprocess.run(command, capture_output=True, timeout=10, check=True).stdout
+            stream = json.loads(out)["streams"][0]
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError, IndexError) as e:
+            print(f"[WARN] ffprobe no pudo leer el stream: {e}")
+            return None
+        self.native_size = (int(stream["width"]), int(stream["height"]))
+        num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+        if den and float(den):
+            self.native_fps = float(num) / float(den)
+        print(f"[INFO] Stream nativo {self.native_size[0]}x{self.native_size[1]} @ {self.native_fps or '?'} fps.")
+        return self.native_size
+
+    def _video_filters(self):
+        filters = []
+        if self.native_size != (self.width, self.height):
+            # Si no se pudo sondear también se escala: garantiza el tamaño del frame.
+            filters.append(f"scale={self.width}:{self.height}")
+        if self.fps and (self.native_fps is None or self.fps < self.native_fps):
+            filters.append(f"fps={self.fps}")
+        return filters
+
+    def build_command(self):
+        command = ['ffmpeg', '-loglevel', 'error']
+        if self.hwaccel:
+            command += ['-hwaccel', self.hwaccel]
+        command += [
+            '-rtsp_transport', 'tcp',
+            '-i', self.rtsp_url,
+            '-an', # El audio de la cámara lo gestiona AudioStreamer
+        ]
+        filters = self._video_filters()
+        if filters:
+            command += ['-vf', ",".join(filters)]
+        command += [
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-' # Salida a stdout
+        ]
+        return command
+
+    def start(self):
+        """Arranca el supervisor de captura; no bloquea esperando a la cámara.
+
+        Cada arranque tiene su propio evento de parada: un supervisor anterior que
+        aún no terminó (p. ej. dentro de ffprobe tras un stop()) sale por su cuenta
+        en vez de seguir en paralelo con el nuevo.
+        """
+        self._stop_event.set()
+        self._stop_event = stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._supervise, args=(stop_event,), daemon=True)
+        self._thread.start()
+        return True
+
+    def _launch(self):
+        print(f"[INFO] Abriendo RTSP con FFMPEG: {self.rtsp_url}")
+        self.state = "connecting"
+        try:
+            process = subprocess.Popen(self.build_command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            print("[ERR] FFMPEG no pudo iniciar. Asegúrate de que ffmpeg está instalado en el sistema.")
+            self.last_error = "ffmpeg no encontrado"
+            return None
+        threading.Thread(target=self._drain_stderr, args=(process,), daemon=True).start()
+        return process
+
+    def _drain_stderr(self, process):
+        # Vaciar stderr evita que ffmpeg se bloquee si escribe muchos errores.
+        for line in process.stderr:
+            line = line.decode(errors="replace").strip()
+            if line:
+                self.last_error = line
+                print(f"[FFMPEG ERR] {line}")
+
+    def _supervise(self, stop_event):
+        """Mantiene ffmpeg vivo: relanza con backoff exponencial si termina o se cuelga.
+
+        Solo se reinicia el proceso de captura; el modelo y MediaPipe siguen cargados.
+        """
+        backoff = self.RECONNECT_MIN_DELAY
+        while not stop_event.is_set():
+            if self.native_size is None and not self._probe_failed:
+                self._probe_failed = self.probe() is None
+                if stop_event.is_set(): # stop() llegó durante ffprobe
+                    break
+            process = self._launch()
+            if process is not None:
+                if stop_event.is_set():
+                    process.kill()
+                    process.wait()
+                    break
+                self.process = process
+                frames_before = self.frames_read
+                reader = threading.Thread(target=self._read_loop, args=(process, stop_event), daemon=True)
+                reader.start()
+                self._last_frame_ts = time.time()
+                while not stop_event.is_set() and reader.is_alive():
+                    if time.time() - self._last_frame_ts > self.STALL_TIMEOUT:
+                        print(f"[WARN] Sin frames de FFMPEG durante {self.STALL_TIMEOUT:.0f}s; reiniciando captura.")
+                        break
+                    stop_event.wait(0.5)
+                process.kill()
+                reader.join(timeout=2.0)
+                process.wait()
+                if stop_event.is_set():
+                    break
+                if self.frames_read > frames_before:
+                    backoff = self.RECONNECT_MIN_DELAY # La conexión llegó a funcionar
+                    self._probe_failed = False # La cámara responde: se vuelve a sondear en la próxima conexión
+            self.state = "reconnecting"
+            self.reconnects += 1
+            print(f"[WARN] Captura RTSP caída; reintento #{self.reconnects} en {backoff:.1f}s.")
+            stop_event.wait(backoff)
+            backoff = min(backoff * 2, self.RECONNECT_MAX_DELAY)
+        if stop_event is self._stop_event: # No pisar el estado de un arranque posterior
+            self.state = "stopped"
+
+    def _read_exact(self, stdout, frame):
+        """Llena `frame` con exactamente `frame_size` bytes.
+
+        Devuelve False si el stream terminó antes (el frame parcial se descarta).
+        """
+        view = memoryview(frame).cast('B')
+        got = 0
+        while got < self.frame_size:
+            try:
+                n = stdout.readinto(view[got:])
+            except (ValueError, OSError):
+                n = 0 # Tubería cerrada desde stop()
+            if not n:
+                if got:
+                    self.partial_frames += 1
+                    print(f"[WARN] Frame parcial descartado ({got}/{self.frame_size} bytes).")
+                return False
+            if n < self.frame_size - got:
+                self.short_reads += 1
+            got += n
+        return True
+
+    def _read_loop(self, process, stop_event):
+        stdout = process.stdout
+        while not stop_event.is_set():
+            frame = self.pool.acquire()
+            t0 = time.perf_counter()
+            if not self._read_exact(stdout, frame):
+                # EOF: el supervisor relanza ffmpeg y el encuadre empieza de cero.
+                return
+            if self.read_histogram:
+                self.read_histogram.observe(time.perf_counter() - t0)
+            self.frames_read += 1
+            self._last_frame_ts = time.time()
+            self.state = "streaming"
+            self.buffer.commit(frame)
+            del frame # El array vuelve al pool en cuanto el consumidor lo suelte
+
+    def is_open(self):
+        return self.process is not None and self.process.poll() is None
+
+    def get_stats(self):
+        return {
+            "capture_state": self.state,
+            "capture_reconnects": self.reconnects,
+            "capture_last_error": self.last_error,
+            "capture_native_size": list(self.native_size) if self.native_size else None,
+            "capture_native_fps": self.native_fps,
+            "capture_frames": self.frames_read,
+            "capture_dropped_frames": self.buffer.dropped,
+            "capture_short_reads": self.short_reads,
+            "capture_partial_frames": self.partial_frames,
+        }
+
+    def stop(self):
+        self._stop_event.set()
+        if self.process:
+            print("[INFO] Deteniendo proceso FFMPEG.")
+            self.process.kill()
+            self.process = None
+        if self._thread:
+            self._thread.join(timeout=3.0)
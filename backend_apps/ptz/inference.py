@@ -0,0 +1,310 @@
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from backend_apps.common.metrics import REGISTRY
+
+EMPTY_DETECTIONS = np.zeros((0, 6), np.float32)
+
+
+# ===================== YOLOv5 =====================
+def load_yolov5(use_custom_weights, weights_path, model_name, precision="fp32", model_dir=None):
+    import torch # Solo lo necesita quien carga el modelo (servidor o worker de inferencia)
+    from backend_apps.ptz.model_registry import local_weights
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if precision == "int8":
+        # YOLOv5 es casi todo convoluciones: la cuantización dinámica de PyTorch (solo Linear/LSTM) no aporta nada.
+        raise ValueError("INT8 no está soportado con torch; exporta con tools/export_yolov5.py y usa onnx/openvino")
+    cached = local_weights(model_dir, use_custom_weights, weights_path, model_name) if model_dir else None
+    try:
+        if cached:
+            # Código y pesos fijados en la caché local: sin red ni resolución del repo en GitHub.
+            model = torch.hub.load(cached[0], "custom", path=cached[1], source="local", verbose=False)
+        elif use_custom_weights:
+            model = torch.hub.load("ultralytics/yolov5", "custom", path=weights_path, verbose=False)
+        else:
+            model = torch.hub.load("ultralytics/yolov5", model_name, pretrained=True, verbose=False)
+    except Exception:
+        Y5_DIR = str(__import__("pathlib").Path.home() / "yolov5")
+        sys.path.insert(0, Y5_DIR)
+        raise RuntimeError("No se pudo cargar YOLOv5 con Torch Hub.")
+    model.to(device)
+    if precision == "fp16":
+        if device == "cuda":
+            model.half() # AutoShape convierte la entrada al dtype de los pesos
+        else:
+            print("[WARN] FP16 con torch solo tiene sentido en GPU; se usa FP32.")
+            precision = "fp32"
+    print(f"[YOLOv5] Cargado en {device} ({precision}).")
+    return model, device
+
+
+MODEL_EXTENSIONS = {"onnx": ".onnx", "openvino": ".xml"}
+PRECISIONS = ("fp32", "fp16", "int8")
+
+
+def model_stem(config):
+    """Nombre base del modelo: el de los pesos propios o el de Torch Hub (ej. yolov5s)."""
+    if config["USE_CUSTOM_WEIGHTS"]:
+        return os.path.splitext(os.path.basename(config["WEIGHTS"]))[0]
+    return config["MODEL_NAME"]
+
+
+def exported_model_path(config, backend, precision=None):
+    """Ruta del modelo exportado por tools/export_yolov5.py, ej. yolov5s.onnx o yolov5s-int8.xml."""
+    precision = precision or config.get("MODEL_PRECISION", "fp32")
+    suffix = "" if precision == "fp32" else f"-{precision}"
+    return os.path.join(config["MODEL_DIR"], model_stem(config) + suffix + MODEL_EXTENSIONS[backend])
+
+
+def names_path(config):
+    """Nombres de clase del modelo exportado, compartidos por todos los backends y precisiones."""
+    return os.path.join(config["MODEL_DIR"], model_stem(config) + ".names.json")
+
+
+def local_weights_ready(config):
+    from backend_apps.ptz.model_registry import local_weights
+    return local_weights(config["MODEL_DIR"], config['USE_CUSTOM_WEIGHTS'], config['WEIGHTS'], config['MODEL_NAME']) is not None
+
+
+def create_detector(config, threads=0):
+    """Crea el detector según INFERENCE_BACKEND: "torch" (Torch Hub), "onnx" u "openvino"."""
+    backend = config.get("INFERENCE_BACKEND", "torch")
+    precision = config.get("MODEL_PRECISION", "fp32")
+    if precision not in PRECISIONS:
+        raise ValueError(f"MODEL_PRECISION desconocida: {precision}")
+    if backend == "torch":
+        if not local_weights_ready(config):
+            print("[WARN] YOLOv5 no está en la caché local; se usa Torch Hub (red). Ver tools/fetch_models.py")
+        model, _ = load_yolov5(config['USE_CUSTOM_WEIGHTS'], config['WEIGHTS'], config['MODEL_NAME'],
+                               precision, config["MODEL_DIR"])
+        return YoloV5Detector(model)
+    if backend not in MODEL_EXTENSIONS:
+        raise ValueError(f"INFERENCE_BACKEND desconocido: {backend}")
+    path = exported_model_path(config, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} no existe; genera el modelo con "
+                                f"tools/export_yolov5.py --format {backend} --precision {precision}")
+    from backend_apps.ptz.backends import OnnxYoloDetector, OpenVinoYoloDetector
+    if backend == "onnx":
+        return OnnxYoloDetector(path, names_path=names_path(config), threads=threads)
+    return OpenVinoYoloDetector(path, names_path=names_path(config), threads=threads)
+
+
+class YoloV5Detector:
+    """Adaptador del modelo YOLOv5 de Torch Hub (AutoShape).
+
+    Devuelve las detecciones de cada imagen como un array Nx6 de float32:
+    x1, y1, x2, y2, confianza, clase.
+    """
+
+    def __init__(self, model, size=640):
+        self.model = model
+        self.size = size
+        self.names = model.names if hasattr(model, "names") else {i: f"id{i}" for i in range(1000)}
+
+    def set_thresholds(self, conf=None, iou=None):
+        if conf is not None:
+            self.model.conf = conf
+        if iou is not None:
+            self.model.iou = iou
+
+    def set_classes(self, classes):
+        # AutoShape filtra por clase dentro del NMS; None = todas.
+        self.model.classes = list(classes) if classes else None
+
+    def detect_batch(self, frames, size=None):
+        # AutoShape acepta una lista de imágenes y hace un único forward con todas.
+        results = self.model(list(frames), size=size or self.size)
+        return [det.cpu().numpy().astype(np.float32) if det is not None else EMPTY_DETECTIONS
+                for det in results.xyxy]
+
+
+class _InferenceRequest:
+    __slots__ = ("frame", "size", "result", "event")
+
+    def __init__(self, frame, size=None):
+        self.frame = frame
+        self.size = size
+        self.result = None
+        self.event = threading.Event()
+
+
+class BatchInferenceEngine:
+    """Agrupa los frames de varias cámaras en un único forward del detector.
+
+    Cada pipeline de cámara llama a `infer()` con su frame y espera el resultado.
+    El hilo del motor junta las peticiones pendientes (una por cámara; si una cámara
+    envía otra antes de ser atendida se sustituye la vieja) y espera como mucho
+    `max_wait` segundos a que lleguen las del resto de cámaras registradas.
+
+    Umbral de confianza y lista de clases son por cámara: el modelo compartido
+    usa el filtro más permisivo y cada cámara recibe solo lo suyo.
+    """
+
+    def __init__(self, detector, max_batch=8, max_wait=0.01):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._filters_lock = threading.Lock() # Serializa el envío de umbral/clases al detector
+        self._pending = {}
+        self._clients = {} # camera_id -> umbral de confianza de esa cámara
+        self._classes = {} # camera_id -> ids de clase permitidos (None = todas)
+        self._running = True
+        self.batches = 0
+        self.frames = 0
+        self.inference_time = 0.0
+        self.superseded = 0 # Peticiones sustituidas por un frame más nuevo de la misma cámara
+        self._batch_hist = REGISTRY.histogram("antares_inference_batch_seconds",
+                                              "Duración de cada forward por lotes del detector compartido")
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    @property
+    def names(self):
+        return self.detector.names
+
+    def register(self, camera_id, conf, classes=None):
+        with self._cond:
+            self._clients[camera_id] = conf
+            self._classes[camera_id] = classes or None
+        self._push_filters()
+
+    def unregister(self, camera_id):
+        with self._cond:
+            self._clients.pop(camera_id, None)
+            self._classes.pop(camera_id, None)
+            request = self._pending.pop(camera_id, None)
+        if request:
+            request.event.set()
+        self._push_filters()
+
+    def set_conf(self, camera_id, conf):
+        with self._cond:
+            if camera_id not in self._clients:
+                return
+            self._clients[camera_id] = conf
+        self._push_filters()
+
+    def set_classes(self, camera_id, classes):
+        with self._cond:
+            if camera_id not in self._clients:
+                return
+            self._classes[camera_id] = classes or None
+        self._push_filters()
+
+    def set_iou(self, iou):
+        # El NMS es del modelo compartido: el IoU aplica a todas las cámaras.
+        self.detector.set_thresholds(iou=iou)
+
+    def _push_filters(self):
+        """Envía al detector el umbral y las clases combinados de todas las cámaras.
+
+        Se llama sin self._cond: el detector puede tardar (un worker relanzándose) y las
+        inferencias de las demás cámaras no deben esperar por ello. _filters_lock evita
+        que dos cambios simultáneos lleguen al detector en orden inverso.
+        """
+        with self._filters_lock:
+            with self._cond:
+                conf = min(self._clients.values()) if self._clients else None
+                allowed = list(self._classes.values())
+            # El modelo filtra con el umbral más bajo; cada cámara aplica luego el suyo.
+            if conf is not None:
+                self.detector.set_thresholds(conf=conf)
+            # Unión de las listas de todas las cámaras; si alguna quiere todas, sin filtro.
+            if not allowed or any(c is None for c in allowed):
+                self.detector.set_classes(None)
+            else:
+                self.detector.set_classes(sorted(set().union(*allowed)))
+
+    def infer(self, camera_id, frame, timeout=2.0, size=None):
+        """Devuelve las detecciones Nx6 de `frame` filtradas con el umbral y las clases de la cámara.
+
+        `size` permite inferir un recorte (ROI) a menor resolución que el frame completo.
+        """
+        request = _InferenceRequest(frame, size)
+        with self._cond:
+            previous = self._pending.get(camera_id)
+            self._pending[camera_id] = request
+            self._cond.notify_all()
+        if previous:
+            self.superseded += 1
+            previous.event.set()
+        if not request.event.wait(timeout) or request.result is None:
+            return None
+        conf = self._clients.get(camera_id)
+        classes = self._classes.get(camera_id)
+        det = request.result
+        if conf is not None:
+            det = det[det[:, 4] >= conf]
+        if classes:
+            det = det[np.isin(det[:, 5].astype(int), classes)]
+        return det
+
+    def _loop(self):
+        while self._running:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or not self._running, 0.5)
+                if not self._pending:
+                    continue
+                deadline = time.time() + self.max_wait
+                while len(self._pending) < min(len(self._clients), self.max_batch):
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        break
+                keys = list(self._pending)[:self.max_batch]
+                batch = [self._pending.pop(k) for k in keys]
+
+            t0 = time.time()
+            try:
+                # AutoShape rellena todas las imágenes del lote a la misma forma: se usa el mayor tamaño pedido.
+                sizes = [r.size for r in batch]
+                size = None if None in sizes else max(sizes)
+                results = self.detector.detect_batch([r.frame for r in batch], size=size)
+            except Exception as e:
+                print(f"[ERR] Inferencia por lotes falló: {e}")
+                results = [None] * len(batch)
+            self.inference_time += time.time() - t0
+            self._batch_hist.observe(time.time() - t0)
+            self.batches += 1
+            self.frames += len(batch)
+            for request, det in zip(batch, results):
+                request.result = det
+                request.event.set()
+
+    def warmup(self, width, height):
+        """Forward sobre un frame negro para que el primero real no pague la inicialización."""
+        t0 = time.time()
+        try:
+            self.detector.detect_batch([np.zeros((height, width, 3), np.uint8)])
+        except Exception as e:
+            print(f"[WARN] Warm-up de inferencia falló: {e}")
+        return time.time() - t0
+
+    def metric_samples(self):
+        return [
+            ("antares_inference_queue_depth", "gauge", "Peticiones esperando al detector compartido", {}, len(self._pending)),
+            ("antares_inference_batches_total", "counter", "Forwards por lotes ejecutados", {}, self.batches),
+            ("antares_inference_frames_total", "counter", "Frames inferidos", {}, self.frames),
+            ("antares_inference_superseded_total", "counter",
+             "Peticiones descartadas por llegar un frame más nuevo de la misma cámara", {}, self.superseded),
+        ]
+
+    def get_stats(self):
+        return {
+            "inference_cameras": len(self._clients),
+            "inference_pending": len(self._pending),
+            "inference_batches": self.batches,
+            "inference_avg_batch": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "inference_ms_per_frame": round(1000 * self.inference_time / self.frames, 2) if self.frames else 0.0,
+        }
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if hasattr(self.detector, "close"):
+            self.detector.close()
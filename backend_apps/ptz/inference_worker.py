@@ -0,0 +1,223 @@
+import multiprocessing as mp
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backend_apps.ptz.inference import EMPTY_DETECTIONS
+
+
+def _worker_main(conn, shm_name, slot_bytes, model_cfg, threads):
+    """Proceso de inferencia: carga el modelo y atiende lotes leídos de memoria compartida."""
+    from backend_apps.ptz.inference import create_detector
+
+    threads = threads or os.cpu_count() or 1
+    if model_cfg.get("INFERENCE_BACKEND", "torch") == "torch":
+        import warnings
+        warnings.filterwarnings("ignore", category=FutureWarning,
+                                message=r".*torch\.cuda\.amp\.autocast.*is deprecated.*")
+        import torch
+        torch.set_num_threads(threads)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        detector = create_detector(model_cfg, threads=threads)
+    except Exception as e:
+        conn.send(("error", str(e)))
+        shm.close()
+        return
+    conn.send(("ready", dict(detector.names)))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        kind = msg[0]
+        if kind == "stop":
+            break
+        if kind == "thresholds":
+            detector.set_thresholds(conf=msg[1], iou=msg[2])
+            continue
+        if kind == "classes":
+            detector.set_classes(msg[1])
+            continue
+        if kind == "detect":
+            shapes, size = msg[1], msg[2]
+            frames = [np.ndarray(shape, np.uint8, buffer=shm.buf, offset=i * slot_bytes)
+                      for i, shape in enumerate(shapes)]
+            try:
+                conn.send(("result", detector.detect_batch(frames, size=size)))
+            except Exception as e:
+                conn.send(("error", str(e)))
+            del frames # Soltar las vistas antes de cerrar la memoria compartida
+    shm.close()
+
+
+class ProcessDetector:
+    """Detector YOLOv5 que corre en un proceso aparte para no competir por el GIL.
+
+    Los frames se copian a un bloque de memoria compartida (un slot por cámara del
+    lote) y por la tubería solo viajan las formas de los frames y, de vuelta, los
+    arrays Nx6 de detecciones. El proceso hijo puede usar todos los núcleos con el
+    pool de hilos de torch sin frenar a Flask ni a los generadores MJPEG.
+
+    Las esperas al worker tienen timeout: si se cuelga o muere, la inferencia de
+    ese lote cuenta como fallida (sin detecciones) y el worker se relanza, en vez
+    de bloquear para siempre el hilo de procesamiento.
+    """
+
+    STARTUP_TIMEOUT = 180.0 # Carga del modelo (incluye compilar OpenVINO o bajar pesos de Torch Hub)
+    DETECT_TIMEOUT = 10.0
+
+    def __init__(self, config):
+        self.slot_bytes = config["FRAME_WIDTH"] * config["FRAME_HEIGHT"] * 3
+        self.max_batch = config["INFERENCE_MAX_BATCH"]
+        self.model_cfg = {k: config.get(k) for k in ("USE_CUSTOM_WEIGHTS", "WEIGHTS", "MODEL_NAME",
+                                                      "INFERENCE_BACKEND", "MODEL_PRECISION", "MODEL_DIR")}
+        self.threads = config.get("INFERENCE_WORKER_THREADS", 0)
+        self.names = {}
+        self._conf = None
+        self._iou = None
+        self._classes = None
+        # _lock protege la tubería y la memoria compartida (mensajes cortos y una inferencia);
+        # _restart_lock solo serializa los relanzamientos, que pueden tardar STARTUP_TIMEOUT.
+        self._lock = threading.RLock()
+        self._restart_lock = threading.Lock()
+        self._ctx = mp.get_context("spawn") # No heredar el estado de hilos de Flask/torch
+        self._process = None
+        self._conn = None
+        self._shm = None
+        self._start_worker()
+
+    def _start_worker(self):
+        """Lanza un worker y espera a que cargue el modelo sin tomar _lock.
+
+        Mientras tanto `_conn` es None: los cambios de umbral/clases solo se guardan
+        (se reenvían aquí al terminar) y las inferencias salen vacías.
+        """
+        with self._restart_lock:
+            if self._process is not None: # Otro hilo ya lo relanzó
+                return
+            shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.max_batch)
+            conn, child_conn = self._ctx.Pipe()
+            process = None
+            try:
+                process = self._ctx.Process(
+                    target=_worker_main,
+                    args=(child_conn, shm.name, self.slot_bytes, self.model_cfg, self.threads),
+                    daemon=True,
+                )
+                process.start()
+                child_conn.close()
+                kind, payload = self._receive(conn, self.STARTUP_TIMEOUT)
+            except (EOFError, OSError, TimeoutError) as e:
+                kind, payload = "error", f"{type(e).__name__}: {e}"
+            except BaseException:
+                child_conn.close()
+                self._cleanup(process, conn, shm)
+                raise
+            if kind != "ready":
+                child_conn.close()
+                self._cleanup(process, conn, shm) # Cierra y borra también la memoria compartida
+                raise RuntimeError(f"El worker de inferencia no pudo cargar el modelo: {payload}")
+            with self._lock:
+                self.names = {int(k): v for k, v in payload.items()}
+                self._process, self._conn, self._shm = process, conn, shm
+                if self._conf is not None or self._iou is not None:
+                    self._conn.send(("thresholds", self._conf, self._iou))
+                if self._classes:
+                    self._conn.send(("classes", self._classes))
+            print(f"[INFO] Worker de inferencia listo (pid {process.pid}).")
+
+    @staticmethod
+    def _receive(conn, timeout):
+        """Siguiente mensaje del worker; TimeoutError si no responde a tiempo."""
+        if not conn.poll(timeout):
+            raise TimeoutError(f"el worker no respondió en {timeout:g}s")
+        return conn.recv()
+
+    def _send_setting(self, msg):
+        # Se llama con _lock tomado. Sin worker (relanzándose) basta con lo guardado.
+        if self._conn is None:
+            return
+        try:
+            self._conn.send(msg)
+        except (BrokenPipeError, OSError):
+            pass # La siguiente inferencia detecta el worker caído y lo relanza
+
+    def set_thresholds(self, conf=None, iou=None):
+        with self._lock:
+            self._conf = conf if conf is not None else self._conf
+            self._iou = iou if iou is not None else self._iou
+            self._send_setting(("thresholds", self._conf, self._iou))
+
+    def set_classes(self, classes):
+        with self._lock:
+            self._classes = list(classes) if classes else None
+            self._send_setting(("classes", self._classes))
+
+    def detect_batch(self, frames, size=None):
+        if not frames:
+            return []
+        if len(frames) > self.max_batch:
+            raise ValueError(f"Lote de {len(frames)} frames supera INFERENCE_MAX_BATCH={self.max_batch}")
+        for frame in frames:
+            if frame.nbytes > self.slot_bytes:
+                raise ValueError(f"Frame {frame.shape} no cabe en el slot de memoria compartida")
+        if self._process is None and not self._restart_lock.locked():
+            self._start_worker() # Un relanzamiento anterior falló
+        with self._lock:
+            if self._conn is None: # Relanzándose en otro hilo
+                return [EMPTY_DETECTIONS] * len(frames)
+            shapes = []
+            for i, frame in enumerate(frames):
+                slot = np.ndarray(frame.shape, np.uint8, buffer=self._shm.buf, offset=i * self.slot_bytes)
+                np.copyto(slot, frame)
+                shapes.append(frame.shape)
+            del slot
+            try:
+                self._conn.send(("detect", shapes, size))
+                kind, payload = self._receive(self._conn, self.DETECT_TIMEOUT)
+                dead = None
+            except (EOFError, OSError, TimeoutError) as e:
+                # Un worker colgado se mata: una respuesta tardía desalinearía la tubería.
+                print(f"[ERR] Worker de inferencia caído ({e}); relanzando.")
+                dead = self._detach()
+        if dead is not None:
+            self._cleanup(*dead, graceful=False)
+            self._start_worker()
+            return [EMPTY_DETECTIONS] * len(frames)
+        if kind != "result":
+            raise RuntimeError(payload)
+        return payload
+
+    def _detach(self):
+        # Se llama con _lock tomado: el worker deja de estar disponible para los demás hilos.
+        dead = (self._process, self._conn, self._shm)
+        self._process = self._conn = self._shm = None
+        return dead
+
+    @staticmethod
+    def _cleanup(process, conn, shm, graceful=True):
+        # graceful=False: el worker no responde, se mata sin pedirle que pare.
+        if process is not None:
+            if graceful and process.is_alive():
+                try:
+                    conn.send(("stop",))
+                except (BrokenPipeError, OSError):
+                    pass
+                process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join(timeout=5)
+        if conn is not None:
+            conn.close()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        with self._lock:
+            dead = self._detach()
+        self._cleanup(*dead)
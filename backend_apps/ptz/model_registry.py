@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import subprocess
+import urllib.request
+
+# Caché local de modelos: código de YOLOv5 (para torch.hub con source="local") y
+# pesos, fijados a una versión. Se rellena una vez con tools/fetch_models.py;
+# después el servicio arranca sin red. registry.json guarda el SHA-256 de cada
+# fichero descargado y se verifica en cada carga.
+
+YOLOV5_REPO = "https://github.com/ultralytics/yolov5"
+YOLOV5_TAG = "v7.0" # Versión fijada del código y de los pesos oficiales
+WEIGHTS_URL = f"{YOLOV5_REPO}/releases/download/{YOLOV5_TAG}/{{name}}.pt"
+REGISTRY_FILE = "registry.json"
+
+
+def repo_dir(model_dir):
+    return os.path.join(model_dir, f"yolov5-{YOLOV5_TAG}")
+
+
+def weights_path(model_dir, model_name):
+    return os.path.join(model_dir, f"{model_name}.pt")
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_registry(model_dir):
+    try:
+        with open(os.path.join(model_dir, REGISTRY_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_registry(model_dir, registry):
+    with open(os.path.join(model_dir, REGISTRY_FILE), "w") as f:
+        json.dump(registry, f, indent=1, sort_keys=True)
+
+
+def verify(model_dir, path):
+    """Comprueba el SHA-256 de `path` contra registry.json (error si no coincide)."""
+    expected = load_registry(model_dir).get(os.path.basename(path), {}).get("sha256")
+    if expected and sha256(path) != expected:
+        raise RuntimeError(f"{path} no coincide con el SHA-256 fijado en {REGISTRY_FILE}")
+
+
+def local_weights(model_dir, use_custom_weights, weights, model_name):
+    """(repo local, pesos) si ambos están en caché; None si hay que ir a la red."""
+    repo = repo_dir(model_dir)
+    path = weights if use_custom_weights else weights_path(model_dir, model_name)
+    if not (os.path.isfile(os.path.join(repo, "hubconf.py")) and os.path.isfile(path)):
+        return None
+    if not use_custom_weights:
+        verify(model_dir, path)
+    return repo, path
+
+
+def fetch(model_dir, model_names):
+    """Descarga el código de YOLOv5 fijado y los pesos pedidos, registrando su SHA-256."""
+    os.makedirs(model_dir, exist_ok=True)
+    repo = repo_dir(model_dir)
+    if not os.path.isdir(repo):
+        subprocess.run(["git", "clone", "--depth", "1", "--branch", YOLOV5_TAG, YOLOV5_REPO, repo], check=True)
+    registry = load_registry(model_dir)
+    for name in model_names:
+        path = weights_path(model_dir, name)
+        if not os.path.isfile(path):
+            url = WEIGHTS_URL.format(name=name)
+            print(f"[INFO] Descargando {url}")
+            urllib.request.urlretrieve(url, path + ".part")
+            os.replace(path + ".part", path)
+        entry = registry.setdefault(os.path.basename(path), {"source": WEIGHTS_URL.format(name=name)})
+        digest = sha256(path)
+        if entry.get("sha256", digest) != digest:
+            raise RuntimeError(f"{path} no coincide con el SHA-256 registrado")
+        entry["sha256"] = digest
+    save_registry(model_dir, registry)
+    return registry
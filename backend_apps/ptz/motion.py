@@ -0,0 +1,63 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Puerta de movimiento barata para no ejecutar detectores sobre escenas estáticas.
+
+    Compara una versión reducida en grises del frame con la del último frame en
+    que corrieron los detectores (no con el anterior, así un movimiento lento
+    también acaba disparando). Si la fracción de píxeles que cambian supera
+    `threshold`, o han pasado `max_idle` segundos sin ejecutar nada, deja pasar.
+    """
+
+    def __init__(self, width, height, threshold=0.01, pixel_delta=15, max_idle=2.0, small_width=160):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_idle = max_idle
+        sw = min(small_width, width)
+        self._small_size = (sw, max(1, round(height * sw / width)))
+        shape = self._small_size[::-1]
+        self._gray = np.empty((height, width), np.uint8)
+        self._small = np.empty(shape, np.uint8)
+        self._reference = np.empty(shape, np.uint8)
+        self._diff = np.empty(shape, np.uint8)
+        self._has_reference = False
+        self._last_pass = 0.0
+        self.motion = 0.0 # Fracción de píxeles cambiados en la última comprobación
+        self.checked = 0
+        self.skipped = 0
+
+    def reset(self):
+        self._has_reference = False
+
+    def check(self, frame):
+        """True si hay que ejecutar los detectores en este frame."""
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.resize(self._gray, self._small_size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(self._small, (5, 5), 0, dst=self._small)
+        self.checked += 1
+        if not self._has_reference or time.time() - self._last_pass >= self.max_idle:
+            return True
+        cv2.absdiff(self._small, self._reference, dst=self._diff)
+        self.motion = float(np.count_nonzero(self._diff > self.pixel_delta)) / self._diff.size
+        if self.motion >= self.threshold:
+            return True
+        self.skipped += 1
+        return False
+
+    def accept(self):
+        """Los detectores corrieron: el frame actual pasa a ser la referencia."""
+        self._small, self._reference = self._reference, self._small
+        self._has_reference = True
+        self._last_pass = time.time()
+
+    def get_stats(self):
+        return {
+            "motion_gate_checked": self.checked,
+            "motion_gate_skipped": self.skipped,
+            "motion_gate_skip_ratio": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            "motion_gate_level": round(self.motion, 4),
+        }
@@ -0,0 +1,342 @@
+import asyncio
+import itertools
+import struct
+import subprocess
+import threading
+import time
+from collections import deque
+
+# Modo passthrough: el H.264 de la cámara llega al navegador sin decodificar.
+# ffmpeg solo remuxa (-c:v copy) a MP4 fragmentado; el navegador lo reproduce con
+# Media Source Extensions. Sin decodificación ni JPEG en el servidor, el ancho de
+# banda por espectador es el bitrate de la cámara.
+
+
+def iter_boxes(data, offset=0, end=None):
+    """(tipo, inicio del contenido, fin) de cada caja MP4 en data[offset:end]."""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _find_box(data, kind, start, end):
+    for k, s, e in iter_boxes(data, start, end):
+        if k == kind:
+            return s, e
+    return None
+
+
+def fragment_starts_with_keyframe(moof):
+    """True si el primer sample del fragmento es un frame de sincronización (IDR).
+
+    Mira moof > traf > trun (first_sample_flags o flags del primer sample) y, si
+    no vienen, los default_sample_flags de tfhd. sample_is_non_sync_sample es el bit 16.
+    """
+    traf = _find_box(moof, b"traf", 8, len(moof))
+    if traf is None:
+        return False
+    flags = None
+    tfhd = _find_box(moof, b"tfhd", *traf)
+    if tfhd is not None:
+        pos, _ = tfhd
+        tf_flags = struct.unpack_from(">I", moof, pos)[0] & 0xFFFFFF
+        pos += 8 # versión/flags + track_ID
+        for bit, size in ((0x1, 8), (0x2, 4), (0x8, 4), (0x10, 4)):
+            if tf_flags & bit:
+                pos += size
+        if tf_flags & 0x20:
+            flags = struct.unpack_from(">I", moof, pos)[0]
+    trun = _find_box(moof, b"trun", *traf)
+    if trun is not None:
+        pos, _ = trun
+        tr_flags = struct.unpack_from(">I", moof, pos)[0] & 0xFFFFFF
+        pos += 8 # versión/flags + sample_count
+        if tr_flags & 0x1:
+            pos += 4 # data_offset
+        if tr_flags & 0x4:
+            flags = struct.unpack_from(">I", moof, pos)[0]
+        elif tr_flags & 0x400:
+            pos += 4 * bool(tr_flags & 0x100) + 4 * bool(tr_flags & 0x200)
+            flags = struct.unpack_from(">I", moof, pos)[0]
+    return flags is not None and not flags & 0x10000
+
+
+def codec_string(moov):
+    """Códec para MediaSource.isTypeSupported, ej. 'avc1.64001f' (None si no es H.264/H.265)."""
+    i = moov.find(b"avcC")
+    if i >= 0:
+        profile, compat, level = moov[i + 5], moov[i + 6], moov[i + 7]
+        return f"avc1.{profile:02x}{compat:02x}{level:02x}"
+    if moov.find(b"hvcC") >= 0:
+        return "hvc1" # H.265: solo algunos navegadores lo reproducen con MSE
+    return None
+
+
+class _Viewer:
+    def __init__(self, viewer_id, queue_size):
+        self.id = viewer_id
+        self.queue = deque(maxlen=queue_size)
+        self.waiting_keyframe = True # Un espectador empieza (y se resincroniza) en un IDR
+        self.stats = {"fragments": 0, "bytes": 0, "resyncs": 0}
+
+
+class H264Passthrough:
+    """Remuxa la RTSP de la cámara a MP4 fragmentado y lo reparte a los espectadores.
+
+    Cada espectador recibe primero el segmento de inicialización (ftyp + moov) y
+    después fragmentos (moof + mdat) a partir del siguiente keyframe. Si se queda
+    atrás y su cola se llena, se vacía y espera al siguiente keyframe: en vídeo
+    comprimido no se pueden saltar fragmentos sueltos. Si ffmpeg se reinicia
+    (nuevo moov), los streams en curso terminan y el navegador reconecta.
+    """
+
+    RECONNECT_DELAY = 2.0
+    RETRY_AFTER_ERROR = 30.0 # Sin ffmpeg, start() no reintenta antes de este tiempo (se llama en cada frame)
+    QUEUE_SIZE = 30 # Fragmentos (unos segundos con fragmentos de 100-200 ms)
+
+    def __init__(self, rtsp_url, fragment_ms=200, input_args=None):
+        self.rtsp_url = rtsp_url
+        self.fragment_ms = fragment_ms
+        self.input_args = input_args or ['-rtsp_transport', 'tcp', '-i', rtsp_url]
+        self.init_segment = None
+        self.codec = None
+        self.process = None
+        self.state = "stopped"
+        self.last_error = None
+        self.bytes_in = 0
+        self.fragments = 0
+        self._generation = 0 # Cambia con cada segmento de inicialización nuevo
+        self._viewer_ids = itertools.count(1)
+        self._viewers = {}
+        self._cond = threading.Condition()
+        self._loop_events = {} # event loop -> asyncio.Event de sus espectadores async
+        self._running = False
+        self._thread = None
+        self._failed_at = None
+
+    def build_command(self):
+        return ['ffmpeg', '-loglevel', 'error', *self.input_args,
+                '-map', '0:v:0', '-c:v', 'copy', '-an',
+                '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+                '-frag_duration', str(int(self.fragment_ms * 1000)),
+                '-']
+
+    def start(self):
+        if self._running:
+            return
+        if self._failed_at is not None and time.monotonic() - self._failed_at < self.RETRY_AFTER_ERROR:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        self._thread.start()
+
+    def _supervise(self):
+        while self._running:
+            print(f"[INFO] Passthrough H.264: remuxando {self.rtsp_url}")
+            self.state = "connecting"
+            try:
+                self.process = subprocess.Popen(self.build_command(), stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL)
+            except FileNotFoundError:
+                self.last_error = "ffmpeg no encontrado"
+                print("[ERR] Passthrough: ffmpeg no está instalado.")
+                self.state = "error"
+                self._failed_at = time.monotonic()
+                self._running = False # Permite reintentar con start() y que is_running() no mienta
+                with self._cond:
+                    self._cond.notify_all() # wait_ready deja de esperar
+                return
+            try:
+                self._read_boxes(self.process.stdout)
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+            self.process.kill()
+            self.process.wait()
+            if self._running:
+                self.state = "reconnecting"
+                print(f"[WARN] Passthrough: ffmpeg terminó; reintento en {self.RECONNECT_DELAY:.0f}s.")
+                time.sleep(self.RECONNECT_DELAY)
+        self.state = "stopped"
+
+    def _read_exact(self, stdout, n):
+        data = stdout.read(n)
+        if len(data) < n:
+            raise ValueError("fin del stream de ffmpeg")
+        return data
+
+    def _read_boxes(self, stdout):
+        init, moof = b"", None
+        while self._running:
+            header = self._read_exact(stdout, 8)
+            size, kind = struct.unpack(">I4s", header)
+            if size == 1:
+                large = self._read_exact(stdout, 8)
+                header += large
+                size = struct.unpack(">Q", large)[0]
+            box = header + self._read_exact(stdout, size - len(header))
+            self.bytes_in += size
+            if kind in (b"ftyp", b"moov"):
+                init += box
+                if kind == b"moov":
+                    self._set_init(init, box)
+                    init = b""
+            elif kind == b"moof":
+                moof = box
+            elif kind == b"mdat" and moof is not None:
+                self._publish(moof + box, fragment_starts_with_keyframe(moof))
+                moof = None
+
+    def _set_init(self, init, moov):
+        with self._cond:
+            self.init_segment = init
+            self.codec = codec_string(moov)
+            self._generation += 1
+            self.state = "streaming"
+            self._cond.notify_all()
+        print(f"[OK] Passthrough listo ({self.codec or 'códec desconocido'}).")
+        self._wake_loops()
+
+    def _publish(self, fragment, keyframe):
+        with self._cond:
+            self.fragments += 1
+            for viewer in self._viewers.values():
+                if viewer.waiting_keyframe:
+                    if not keyframe:
+                        continue
+                    viewer.waiting_keyframe = False
+                elif len(viewer.queue) == viewer.queue.maxlen:
+                    # Espectador atascado: se descarta lo pendiente y se retoma en el siguiente IDR.
+                    viewer.queue.clear()
+                    viewer.stats["resyncs"] += 1
+                    viewer.waiting_keyframe = not keyframe
+                    if not keyframe:
+                        continue
+                viewer.queue.append(fragment)
+            self._cond.notify_all()
+        self._wake_loops()
+
+    def _wake_loops(self):
+        for loop in list(self._loop_events):
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError: # Event loop ya cerrado
+                self._loop_events.pop(loop, None)
+
+    def _wake_loop(self, loop):
+        event = self._loop_events.get(loop)
+        if event is not None:
+            self._loop_events[loop] = asyncio.Event()
+            event.set()
+
+    def _add_viewer(self):
+        with self._cond:
+            viewer = _Viewer(next(self._viewer_ids), self.QUEUE_SIZE)
+            self._viewers[viewer.id] = viewer
+            return viewer, self._generation, self.init_segment
+
+    def _remove_viewer(self, viewer):
+        with self._cond:
+            self._viewers.pop(viewer.id, None)
+
+    def _take(self, viewer, generation):
+        """Fragmentos pendientes del espectador; None si el stream terminó o cambió el moov."""
+        if not self._running or self._generation != generation:
+            return None
+        fragments = list(viewer.queue)
+        viewer.queue.clear()
+        return fragments
+
+    def wait_ready(self, timeout=10.0):
+        """Espera al segmento de inicialización. Devuelve False si no llega a tiempo."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.init_segment is not None or not self._running, timeout) \
+                and self.init_segment is not None
+
+    def stream(self):
+        """Generador del MP4 fragmentado para un espectador (servidor WSGI)."""
+        viewer, generation, init = self._add_viewer()
+        try:
+            if init is None:
+                return
+            yield init
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: viewer.queue or not self._running
+                                        or self._generation != generation, 1.0)
+                    fragments = self._take(viewer, generation)
+                if fragments is None:
+                    return
+                for fragment in fragments:
+                    viewer.stats["fragments"] += 1
+                    viewer.stats["bytes"] += len(fragment)
+                    yield fragment
+        finally:
+            self._remove_viewer(viewer)
+
+    async def stream_async(self):
+        """Igual que stream() pero como generador asíncrono (servidor ASGI)."""
+        loop = asyncio.get_running_loop()
+        viewer, generation, init = self._add_viewer()
+        try:
+            if init is None:
+                return
+            yield init
+            while True:
+                with self._cond:
+                    fragments = self._take(viewer, generation)
+                if fragments is None:
+                    return
+                if not fragments:
+                    event = self._loop_events.get(loop)
+                    if event is None:
+                        event = self._loop_events[loop] = asyncio.Event()
+                    try:
+                        await asyncio.wait_for(event.wait(), 1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                for fragment in fragments:
+                    viewer.stats["fragments"] += 1
+                    viewer.stats["bytes"] += len(fragment)
+                    yield fragment
+        finally:
+            self._remove_viewer(viewer)
+
+    def is_running(self):
+        return self._running
+
+    def viewer_count(self):
+        return len(self._viewers)
+
+    def get_stats(self):
+        return {
+            "passthrough_state": self.state,
+            "passthrough_codec": self.codec,
+            "passthrough_viewers": len(self._viewers),
+            "passthrough_fragments": self.fragments,
+            "passthrough_bytes_in": self.bytes_in,
+            "passthrough_last_error": self.last_error,
+        }
+
+    def stop(self):
+        self._running = False
+        if self.process:
+            self.process.kill()
+        with self._cond:
+            self.init_segment = None
+            self._generation += 1
+            self._cond.notify_all()
+        self._wake_loops()
+        if self._thread:
+            self._thread.join(timeout=3.0)
+        self.state = "stopped"
@@ -1,45 +1,28 @@
 import os
 import cv2
 import time
-import sys
-import torch
 import numpy as np
-from onvif import ONVIFCamera
 import warnings
 import threading
-import pyaudio
 import wave
 import json # Para cargar la configuración
 import subprocess
 
-# ===================== CONFIG USUARIO (desde constants.py o similar) =====================
-# Por ahora, usaremos valores por defecto o los cargaremos de un archivo de configuración
-# que crearemos más adelante.
-# Para la refactorización, asumiremos que estos valores se pasarán al servicio o se cargarán.
-# Ejemplo de configuración por defecto:
-DEFAULT_CONFIG = {
-    "IP": "192.168.1.19",
-    "USER": "admin",
-    "PASS": "uijgbv88",
-    "RTSP_PORT": 554,
-    "RTSP_PATH": "/12",
-    "ONVIF_PORT": 8080,
-    "USE_CUSTOM_WEIGHTS": False,
-    "WEIGHTS": "/path/a/tu/best.pt", # Asegúrate de que esta ruta sea válida si USE_CUSTOM_WEIGHTS es True
-    "MODEL_NAME": "yolov5s",
-    "YOLO_CONF_THRESHOLD": 0.4, # Umbral de confianza inicial
-    "YOLO_IOU_THRESHOLD": 0.45, # Umbral de IoU inicial
-    "YOLO_STRIDE_N": 2, # Stride N inicial
-    "PAN_SPEED": 0.5,
-    "TILT_SPEED": 0.5,
-    "ZOOM_SPEED": 0.5,
-    "COLOR_PUNTOS": [0, 255, 0],
-    "COLOR_LINEAS": [255, 0, 0],
-    "GROSOR_PUNTOS": 1,
-    "GROSOR_LINEAS": 1,
-    "FRAME_WIDTH": 640,
-    "FRAME_HEIGHT": 352,
-}
+from backend_apps.common.event_broadcaster import EventBroadcaster
+from backend_apps.common.frame_broadcaster import FrameBroadcaster
+from backend_apps.common.metrics import REGISTRY
+from backend_apps.ptz.config import DEFAULT_CONFIG, get_camera_config
+from backend_apps.ptz.ffmpeg_capture import FFmpegCapture
+from backend_apps.ptz.inference import BatchInferenceEngine, create_detector
+from backend_apps.ptz.inference_worker import ProcessDetector
+from backend_apps.ptz.motion import MotionGate
+from backend_apps.ptz.passthrough import H264Passthrough
+from backend_apps.ptz.roi import filter_in_roi, inference_size, parse_roi, roi_rect
+from backend_apps.ptz.scheduler import AdaptiveScheduler
+from backend_apps.ptz.tracker import EMPTY_TRACKS, IoUTracker
+
+# Las dependencias pesadas (mediapipe, onvif/zeep, pyaudio, torch) se importan al
+# usarlas, en el hilo de arranque del servicio: importar este módulo es barato.
 
 # ===================== LOG FILTERS =====================
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
@@ -47,10 +30,16 @@ warnings.filterwarnings("ignore", category=FutureWarning,
                         message=r".*torch\.cuda\.amp\.autocast.*is deprecated.*")
 
 # ===================== Mediapipe =====================
-import mediapipe as mp
-mp_face_mesh = mp.solutions.face_mesh
-mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
+mp_face_mesh = mp_pose = mp_drawing = None
+
+def load_mediapipe():
+    """Importa mediapipe la primera vez que se necesita (tarda segundos)."""
+    global mp_face_mesh, mp_pose, mp_drawing
+    if mp_face_mesh is None:
+        import mediapipe as mp
+        mp_pose = mp.solutions.pose
+        mp_drawing = mp.solutions.drawing_utils
+        mp_face_mesh = mp.solutions.face_mesh
 
 def draw_custom_landmarks(image, landmarks, connections, color_puntos, color_lineas, grosor_puntos, grosor_lineas):
     mp_drawing.draw_landmarks(
@@ -71,6 +60,7 @@ def clamp(val, lo=-1.0, hi=1.0):
 
 class PTZ:
     def __init__(self, ip, port, user, password):
+        from onvif import ONVIFCamera # onvif/zeep solo al conectar con la cámara
         self.cam = ONVIFCamera(ip, port, user, password)
         self.media = self.cam.create_media_service()
         self.ptz = self.cam.create_ptz_service()
@@ -110,29 +100,41 @@ class PTZ:
             print(f"[PTZ] Home no soportado o error: {e}")
 
 # ===================== YOLOv5 =====================
-def load_yolov5(use_custom_weights, weights_path, model_name):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    try:
-        if use_custom_weights:
-            model = torch.hub.load("ultralytics/yolov5", "custom", path=weights_path, verbose=False)
-        else:
-            model = torch.hub.load("ultralytics/yolov5", model_name, pretrained=True, verbose=False)
-    except Exception:
-        Y5_DIR = str(__import__("pathlib").Path.home() / "yolov5")
-        sys.path.insert(0, Y5_DIR)
-        raise RuntimeError("No se pudo cargar YOLOv5 con Torch Hub.")
-    model.to(device)
-    print(f"[YOLOv5] Cargado en {device}.")
-    return model, device
-
-def draw_detections(frame, results, names):
-    det = results.xyxy[0]
+_inference_engine = None
+_inference_engine_lock = threading.Lock()
+
+def get_inference_engine(config):
+    """Carga YOLOv5 una sola vez y lo comparte entre todas las cámaras."""
+    global _inference_engine
+    with _inference_engine_lock:
+        if _inference_engine is None:
+            print("[INFO] Cargando YOLOv5...")
+            t0 = time.time()
+            try:
+                if config["INFERENCE_MODE"] == "process":
+                    detector = ProcessDetector(config)
+                else:
+                    detector = create_detector(config, threads=config["INFERENCE_WORKER_THREADS"])
+            except Exception as e:
+                print(f"[ERR] No se pudo cargar YOLOv5: {e}")
+                return None
+            detector.set_thresholds(iou=config["YOLO_IOU_THRESHOLD"])
+            engine = BatchInferenceEngine(detector, max_batch=config["INFERENCE_MAX_BATCH"])
+            engine.load_s = time.time() - t0
+            engine.warmup_s = engine.warmup(config["FRAME_WIDTH"], config["FRAME_HEIGHT"])
+            print(f"[INFO] YOLOv5 listo en {engine.load_s:.1f}s (warm-up {engine.warmup_s * 1000:.0f} ms).")
+            REGISTRY.register_collector("inference", engine.metric_samples)
+            _inference_engine = engine
+        return _inference_engine
+
+def draw_detections(frame, det, names):
+    """Dibuja detecciones Nx6 (x1, y1, x2, y2, conf, clase) o pistas Nx7 (+ track_id)."""
     if det is None or len(det) == 0:
         return frame
-    for *xyxy, conf, cls in det:
-        x1, y1, x2, y2 = map(int, xyxy)
-        c = int(cls.item()) if hasattr(cls, "item") else int(cls)
-        label = f"{names[c]} {float(conf):.2f}"
+    for row in det:
+        x1, y1, x2, y2 = map(int, row[:4])
+        conf, c = float(row[4]), int(row[5])
+        label = f"{names[c]} #{int(row[6])} {conf:.2f}" if len(row) > 6 else f"{names[c]} {conf:.2f}"
         cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
         (tw, th), bl = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
         cv2.rectangle(frame, (x1, y1 - th - 6), (x1 + tw + 4, y1), (0, 255, 0), -1)
@@ -152,6 +154,7 @@ class AudioStreamer:
 
     def _stream_mic_to_rtsp(self):
         try:
+            import pyaudio
             p = pyaudio.PyAudio()
             stream = p.open(format=pyaudio.paInt16, channels=1, rate=16000, input=True,
                             frames_per_buffer=AUDIO_CHUNK)
@@ -191,6 +194,7 @@ class AudioStreamer:
                 "-ac", "1", "-ar", "16000", "-"
             ]
             p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            import pyaudio
             pya = pyaudio.PyAudio()
             stream = pya.open(format=pya.get_format_from_width(2), channels=1, rate=16000, output=True)
             while self.cam_audio_active:
@@ -216,27 +220,33 @@ class AudioStreamer:
             self.cam_audio_thread = None
 
 class PTZCameraService:
-    _instance = None
+    # Una instancia por cámara (clave CAMERA_ID); el modelo YOLO es compartido.
+    _instances = {}
     _lock = threading.Lock()
 
     def __new__(cls, config=None):
+        camera_id = (config or DEFAULT_CONFIG).get("CAMERA_ID", "default")
         with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(PTZCameraService, cls).__new__(cls)
-                cls._instance._initialized = False
-            return cls._instance
+            if camera_id not in cls._instances:
+                instance = super(PTZCameraService, cls).__new__(cls)
+                instance._initialized = False
+                cls._instances[camera_id] = instance
+            return cls._instances[camera_id]
 
     def __init__(self, config=None):
         with PTZCameraService._lock:
             if self._initialized:
                 return
 
-            self.config = config if config else DEFAULT_CONFIG
+            self.config = config if config else get_camera_config()
+            self.camera_id = self.config.get("CAMERA_ID", "default")
             self.rtsp_url = f"rtsp://{self.config['USER']}:{self.config['PASS']}@{self.config['IP']}:{self.config['RTSP_PORT']}{self.config['RTSP_PATH']}"
 
             self.ptz = None
-            self.ffmpeg_process = None # <--- Proceso para FFMPEG
-            self.model = None
+            self.capture = None # <--- Captura FFMPEG en hilo propio
+            self.passthrough = None # <--- H.264 remuxado sin decodificar (sin análisis activo)
+            self.decode_paused = False
+            self.engine = None # <--- Motor de inferencia por lotes compartido
             self.names = None
             self.face_mesh = None
             self.pose = None
@@ -256,11 +266,21 @@ class PTZCameraService:
                 "YOLO_CONF_THRESHOLD": self.config["YOLO_CONF_THRESHOLD"],
                 "YOLO_IOU_THRESHOLD": self.config["YOLO_IOU_THRESHOLD"],
                 "YOLO_STRIDE_N": self.config["YOLO_STRIDE_N"],
+                "ADAPTIVE_STRIDE": self.config["ADAPTIVE_STRIDE"],
+                "TARGET_FPS": self.config["TARGET_FPS"],
+                "LATENCY_BUDGET_MS": self.config["LATENCY_BUDGET_MS"],
+                "MOTION_GATE": self.config["MOTION_GATE"],
+                "MOTION_THRESHOLD": self.config["MOTION_THRESHOLD"],
+                "MOTION_MAX_IDLE_S": self.config["MOTION_MAX_IDLE_S"],
                 "PAN_SPEED": self.config["PAN_SPEED"],
                 "TILT_SPEED": self.config["TILT_SPEED"],
                 "ZOOM_SPEED": self.config["ZOOM_SPEED"],
                 "GROSOR_PUNTOS": self.config["GROSOR_PUNTOS"],
                 "GROSOR_LINEAS": self.config["GROSOR_LINEAS"],
+                "CLIENT_OVERLAY": self.config["CLIENT_OVERLAY"],
+                "PASSTHROUGH": self.config["PASSTHROUGH"],
+                "YOLO_CLASSES": list(self.config["YOLO_CLASSES"]),
+                "ROI": self.config["ROI"],
             }
 
             # Parámetros de dibujo de Mediapipe (pueden seguir en config si no se cambian en real time)
@@ -269,146 +289,396 @@ class PTZCameraService:
 
             self._initialized = True
             self._running = False
-            self._frame_lock = threading.Lock()
-            self._current_frame = None
+            # Métricas por etapa para /metrics: read y queue_wait (captura), yolo/face/body,
+            # draw y frame (bucle completo) aquí; encode y send en el broadcaster.
+            self.metric_labels = {"app": "ptz", "camera": self.camera_id}
+            self._stage_hist = {stage: REGISTRY.histogram("antares_stage_seconds", FrameBroadcaster.STAGE_HELP,
+                                                          stage=stage, **self.metric_labels)
+                                for stage in ("read", "queue_wait", "yolo", "face", "body", "draw", "frame", "encode", "send")}
+            REGISTRY.register_collector(f"ptz:{self.camera_id}", self._metric_samples)
+            self.broadcaster = FrameBroadcaster(f"ptz:{self.camera_id}", labels=self.metric_labels)
+            self.detections = EventBroadcaster("detections") # Metadatos para consumidores sin video
+            self._frame_stages = {} # Latencias (s) de las etapas del frame en curso, para los metadatos del WebSocket
+            self.scheduler = AdaptiveScheduler(observer=self._observe_stage)
+            self.tracker = IoUTracker()
+            self.motion_gate = MotionGate(self.frame_width, self.frame_height)
+            self._tracks = EMPTY_TRACKS # Últimas pistas (x1, y1, x2, y2, conf, clase, track_id)
+            self._face_landmarks = []
+            self._pose_landmarks = None
+            self.fps = 0.0
+            self._class_ids = None # YOLO_CLASSES resuelto a ids (None = todas)
+            self._set_roi(self.config["ROI"])
+            self._apply_schedule_params()
+            self._apply_motion_params()
             self._last_move_ts = 0.0
             self._move_timeout = 0.25 # Tiempo para detener el movimiento PTZ continuo
 
-            self._setup_camera()
+            # Arranque en segundo plano: el constructor vuelve enseguida con state="starting".
+            self.state = "starting" # starting -> running | error; stopped tras release_resources
+            self.start_error = None
+            self._start_ts = time.time()
+            self.startup = {} # Tiempos de arranque en segundos (ver get_status)
+            self._setup_lock = threading.Lock()
+            threading.Thread(target=self._setup_camera, daemon=True).start()
+
+    def _mark_startup(self, step):
+        self.startup[step] = round(time.time() - self._start_ts, 3)
 
     def _setup_camera(self):
         print("[INFO] Inicializando PTZCameraService...")
         try:
-            self.ptz = PTZ(self.config['IP'], self.config['ONVIF_PORT'], self.config['USER'], self.config['PASS'])
-            print("[OK] ONVIF listo.")
+            with self._setup_lock:
+                if self.state == "stopped":
+                    return
+                # Primero la captura: ffmpeg conecta con la RTSP mientras se cargan los modelos.
+                # La captura corre en su propio hilo para que la inferencia no atasque la tubería de ffmpeg.
+                self.capture = FFmpegCapture(self.rtsp_url, self.frame_width, self.frame_height,
+                                             fps=self.config.get("CAPTURE_FPS") or None,
+                                             hwaccel=self.config.get("HWACCEL"),
+                                             read_histogram=self._stage_hist["read"])
+                self.capture.start()
+                # El video sin análisis sale en cuanto llega el primer frame; los detectores
+                # se incorporan al bucle a medida que terminan de cargarse.
+                self._running = True
+                threading.Thread(target=self._process_frames, daemon=True).start()
+            threading.Thread(target=self._setup_onvif, daemon=True).start()
+
+            engine = get_inference_engine(self.config)
+            with self._setup_lock:
+                if self.state == "stopped":
+                    return
+                if engine:
+                    self.names = engine.names
+                    try:
+                        self._class_ids = self._resolve_classes(self.params["YOLO_CLASSES"])
+                    except ValueError as e:
+                        print(f"[WARN] YOLO_CLASSES ignorado: {e}")
+                    engine.register(self.camera_id, self.params["YOLO_CONF_THRESHOLD"], self._class_ids)
+                    self.startup["model_load_s"] = round(engine.load_s, 3)
+                    self.startup["model_warmup_s"] = round(engine.warmup_s, 3)
+                    self.engine = engine
+                self._mark_startup("yolo_ready_s")
+
+            load_mediapipe()
+            face_mesh = mp_face_mesh.FaceMesh(max_num_faces=2, refine_landmarks=True,
+                                              min_detection_confidence=0.5, min_tracking_confidence=0.5)
+            pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+            # Warm-up de los grafos de MediaPipe con un frame negro.
+            dummy = np.zeros((self.frame_height, self.frame_width, 3), np.uint8)
+            face_mesh.process(dummy)
+            pose.process(dummy)
+            with self._setup_lock:
+                if self.state == "stopped":
+                    face_mesh.close()
+                    pose.close()
+                    return
+                self.face_mesh, self.pose = face_mesh, pose
+                self.audio_streamer = AudioStreamer(self.rtsp_url)
+                self._mark_startup("mediapipe_ready_s")
+                self.state = "running"
+            print(f"[INFO] PTZCameraService listo en {self.startup['mediapipe_ready_s']:.1f}s y procesando frames.")
         except Exception as e:
-            print(f"[WARN] ONVIF no disponible: {e}")
-            self.ptz = None
+            print(f"[ERR] Arranque de PTZCameraService falló: {e}")
+            self.start_error = str(e)
+            if self.state != "stopped":
+                self.state = "error"
 
-        print(f"[INFO] Abriendo RTSP con FFMPEG: {self.rtsp_url}")
-        command = [
-            'ffmpeg',
-            '-rtsp_transport', 'tcp',
-            '-i', self.rtsp_url,
-            '-loglevel', 'error',
-            '-f', 'rawvideo',
-            '-pix_fmt', 'bgr24',
-            '-' # Salida a stdout
-        ]
-        self.ffmpeg_process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        if self.ffmpeg_process.poll() is not None:
-            print("[ERR] FFMPEG no pudo iniciar. Asegúrate de que ffmpeg está instalado en el sistema.")
-            err = self.ffmpeg_process.stderr.read().decode()
-            print(f"[FFMPEG ERR] {err}")
-            self.ffmpeg_process = None
-
-        print("[INFO] Cargando YOLOv5...")
+    def _setup_onvif(self):
         try:
-            self.model, _ = load_yolov5(self.config['USE_CUSTOM_WEIGHTS'], self.config['WEIGHTS'], self.config['MODEL_NAME'])
-            self.names = self.model.names if hasattr(self.model, "names") else {i: f"id{i}" for i in range(1000)}
-            self.model.conf = self.params["YOLO_CONF_THRESHOLD"]
-            self.model.iou = self.params["YOLO_IOU_THRESHOLD"]
+            ptz = PTZ(self.config['IP'], self.config['ONVIF_PORT'], self.config['USER'], self.config['PASS'])
+            print("[OK] ONVIF listo.")
         except Exception as e:
-            print(f"[ERR] No se pudo cargar YOLOv5: {e}")
-            self.model = None
-
-        self.face_mesh = mp_face_mesh.FaceMesh(max_num_faces=2, refine_landmarks=True,
-                                              min_detection_confidence=0.5, min_tracking_confidence=0.5)
-        self.pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-
-        self.audio_streamer = AudioStreamer(self.rtsp_url)
-        self._running = True
-        threading.Thread(target=self._process_frames, daemon=True).start()
-        print("[INFO] PTZCameraService inicializado y procesando frames.")
+            print(f"[WARN] ONVIF no disponible: {e}")
+            ptz = None
+        with self._setup_lock:
+            if self.state != "stopped":
+                self.ptz = ptz
+                self._mark_startup("onvif_ready_s")
 
     def _process_frames(self):
         fcount, t0, fps = 0, time.time(), 0.0
-        frame_size = self.frame_width * self.frame_height * 3
+        last_seq = 0
+        rgb_buffer = np.empty((self.frame_height, self.frame_width, 3), np.uint8) # Reutilizado por MediaPipe
 
         while self._running:
-            if self.ffmpeg_process is None:
-                time.sleep(0.5)
+            self._update_video_mode()
+            # Siempre el frame más reciente; los intermedios se descartan en el buffer de captura.
+            # El frame llega en propiedad desde el pool de captura: se dibuja sobre él sin copiarlo
+            # y vuelve al pool solo cuando el broadcaster y los clientes dejan de usarlo.
+            last_seq, processed_frame = self.capture.buffer.acquire_latest(last_seq, timeout=0.5)
+            if processed_frame is None:
                 continue
-
-            raw_frame = self.ffmpeg_process.stdout.read(frame_size)
-
-            if not raw_frame:
-                time.sleep(0.01)
-                continue
-
-            frame = np.frombuffer(raw_frame, np.uint8).reshape((self.frame_height, self.frame_width, 3))
-            processed_frame = frame.copy()
+            frame_t0 = time.perf_counter()
+            capture_ts = self.capture.buffer.acquired_ts
+            self._frame_stages = {}
+            self._observe_stage("queue_wait", max(time.time() - capture_ts, 0.0))
 
             # --- PTZ continuo (detener si no hay movimiento reciente) ---
             if self.ptz and (time.time() - self._last_move_ts) > self._move_timeout and self._last_move_ts > 0:
                 self.ptz.stop()
                 self._last_move_ts = 0
 
-            # --- YOLO ---
+            # --- Planificación: qué detectores corren en este frame ---
             fcount += 1
-            if self.do_detect and self.model and (fcount % self.params["YOLO_STRIDE_N"] == 0):
-                results = self.model(processed_frame, size=640)
-                processed_frame = draw_detections(processed_frame, results, self.names)
+            enabled = [stage for stage, on in (("yolo", self.do_detect and self.engine),
+                                               ("face", self.do_face and self.face_mesh),
+                                               ("body", self.do_body and self.pose)) if on]
+            stages = self.scheduler.plan(enabled)
+            # Puerta de movimiento: con la escena quieta se conservan los últimos resultados.
+            # Las etapas siguen pendientes en el scheduler y corren en cuanto algo se mueva.
+            gated = False
+            if stages and self.params["MOTION_GATE"]:
+                if self.motion_gate.check(processed_frame):
+                    self.motion_gate.accept()
+                else:
+                    stages, gated = set(), True
+
+            # Todos los detectores corren sobre el frame limpio; el dibujo va al final.
+            # --- YOLO + tracker ---
+            # En los frames sin YOLO el tracker propaga las cajas, así no parpadean.
+            det = None
+            if "yolo" in stages:
+                with self.scheduler.measure("yolo"):
+                    # Se agrupa con los frames de las demás cámaras en un solo forward.
+                    # Con ROI solo se infiere su rectángulo envolvente (vista, sin copia).
+                    x1, y1, x2, y2 = self._roi_rect
+                    det = self.engine.infer(self.camera_id, processed_frame[y1:y2, x1:x2], size=self._roi_size)
+                    if det is not None:
+                        det = filter_in_roi(det, self._roi, (x1, y1))
+            if "yolo" in enabled:
+                if det is not None:
+                    self._tracks = self.tracker.update(det)
+                elif gated:
+                    # Con la escena quieta las cajas se quedan donde están: predecir las
+                    # movería con la última velocidad, alejándolas de objetos que ya no se mueven.
+                    self._tracks = self.tracker.hold()
+                else:
+                    self._tracks = self.tracker.predict()
+            elif len(self._tracks):
+                self.tracker.clear()
+                self._tracks = EMPTY_TRACKS
 
             # --- Mediapipe FaceMesh ---
-            if self.do_face and self.face_mesh:
-                rgb = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                results_face = self.face_mesh.process(rgb)
-                if results_face.multi_face_landmarks:
-                    for fl in results_face.multi_face_landmarks:
-                        draw_custom_landmarks(processed_frame, fl, mp_face_mesh.FACEMESH_TESSELATION, self.color_puntos, self.color_lineas, self.params["GROSOR_PUNTOS"], self.params["GROSOR_LINEAS"])
-                        draw_custom_landmarks(processed_frame, fl, mp_face_mesh.FACEMESH_CONTOURS, self.color_puntos, self.color_lineas, self.params["GROSOR_PUNTOS"], self.params["GROSOR_LINEAS"])
-                        draw_custom_landmarks(processed_frame, fl, mp_face_mesh.FACEMESH_IRISES, self.color_puntos, self.color_lineas, self.params["GROSOR_PUNTOS"], self.params["GROSOR_LINEAS"])
+            # Los landmarks se conservan en los frames en que el scheduler salta la etapa.
+            if "face" in stages:
+                with self.scheduler.measure("face"):
+                    rgb = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB, dst=rgb_buffer)
+                    results_face = self.face_mesh.process(rgb)
+                self._face_landmarks = results_face.multi_face_landmarks or []
+            elif "face" not in enabled:
+                self._face_landmarks = []
 
             # --- Mediapipe Pose ---
-            if self.do_body and self.pose:
-                rgb = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                results_body = self.pose.process(rgb)
-                if results_body.pose_landmarks:
-                    draw_custom_landmarks(processed_frame, results_body.pose_landmarks, mp_pose.POSE_CONNECTIONS, self.color_puntos, self.color_lineas, self.params["GROSOR_PUNTOS"], self.params["GROSOR_LINEAS"])
+            if "body" in stages:
+                with self.scheduler.measure("body"):
+                    rgb = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB, dst=rgb_buffer)
+                    results_body = self.pose.process(rgb)
+                self._pose_landmarks = results_body.pose_landmarks
+            elif "body" not in enabled:
+                self._pose_landmarks = None
 
             # --- FPS ---
             dt = time.time() - t0
             if dt >= 0.5:
                 fps, fcount, t0 = fcount / dt, 0, time.time()
-            hud = f"FPS: {fps:.1f} | YOLO:{'ON' if self.do_detect else 'OFF'} | FACE:{'ON' if self.do_face else 'OFF'} | BODY:{'ON' if self.do_body else 'OFF'}"
-            cv2.putText(processed_frame, hud, (10, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2, cv2.LINE_AA)
-
-            with self._frame_lock:
-                self._current_frame = processed_frame
-
-    def generate_frames(self):
-        while self._running:
-            try:
-                with self._frame_lock:
-                    if self._current_frame is None:
-                        time.sleep(0.01) # Esperar si no hay frame
-                        continue
-                    ret, buffer = cv2.imencode('.jpg', self._current_frame)
-                    if not ret:
-                        continue
-                    frame = buffer.tobytes()
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                time.sleep(0.03)
-            except (GeneratorExit, BrokenPipeError):
-                # El cliente se ha desconectado.
-                print("[INFO] Cliente de streaming desconectado.")
-                break
+            self.fps = fps
+
+            event = None
+            if enabled:
+                event = self._detection_event(last_seq, det is not None)
+                self.detections.publish(event)
+
+            # --- Overlays ---
+            # En modo CLIENT_OVERLAY el frame sale limpio y el navegador dibuja cajas y
+            # landmarks con los metadatos de /api/ptz/detections/stream.
+            if not self.params["CLIENT_OVERLAY"]:
+                draw_t0 = time.perf_counter()
+                self._draw_overlays(processed_frame)
+                self._observe_stage("draw", time.perf_counter() - draw_t0)
+            self.scheduler.end_frame()
+            self._observe_stage("frame", time.perf_counter() - frame_t0)
+
+            # La codificación JPEG la hace el broadcaster, una vez por frame y fuera de este hilo.
+            # Los metadatos acompañan al frame en el WebSocket (latencia de extremo a extremo,
+            # detecciones emparejadas con su frame).
+            self.broadcaster.publish(processed_frame, {
+                "frame_seq": last_seq,
+                "capture_ts": capture_ts,
+                "publish_ts": time.time(),
+                "stages_ms": {stage: round(s * 1000, 2) for stage, s in self._frame_stages.items()},
+                "detections": event,
+            })
+            if "first_frame_s" not in self.startup:
+                self._mark_startup("first_frame_s")
+            if det is not None and "first_detection_s" not in self.startup:
+                self._mark_startup("first_detection_s")
+
+    def passthrough_active(self):
+        return bool(self.params["PASSTHROUGH"]) and not (self.do_detect or self.do_face or self.do_body)
+
+    def _update_video_mode(self):
+        """Alterna entre el pipeline decodificado y el passthrough H.264.
+
+        Sin YOLO/Face/Body (y con PASSTHROUGH) el navegador recibe el H.264 de la
+        cámara remuxado, y la decodificación se pausa en cuanto no queda ningún
+        cliente MJPEG/WebSocket. Al activar un análisis (o conectarse un cliente
+        MJPEG) la captura decodificada vuelve a arrancar y el passthrough se detiene.
+        Se llama en cada vuelta del bucle de procesamiento.
+        """
+        active = self.passthrough_active()
+        if active:
+            if self.passthrough is None:
+                self.passthrough = H264Passthrough(self.rtsp_url, self.config["PASSTHROUGH_FRAGMENT_MS"])
+            if not self.passthrough.is_running():
+                self.passthrough.start()
+            if (not self.decode_paused and not self.broadcaster.clients
+                    and self.passthrough.init_segment is not None):
+                print("[INFO] Sin análisis ni clientes MJPEG: decodificación en pausa (passthrough H.264).")
+                self.capture.stop()
+                self.decode_paused = True
+        elif self.passthrough is not None and self.passthrough.is_running():
+            self.passthrough.stop()
+        if self.decode_paused and (not active or self.broadcaster.clients):
+            print("[INFO] Reanudando la decodificación.")
+            self.capture.start()
+            self.decode_paused = False
+
+    def open_passthrough(self, timeout=10.0):
+        """El passthrough listo para un espectador, o None si hay análisis activos o no arranca a tiempo."""
+        passthrough = self.passthrough
+        if not self.passthrough_active() or passthrough is None or not passthrough.wait_ready(timeout):
+            return None
+        return passthrough
+
+    def _observe_stage(self, stage, seconds):
+        self._stage_hist[stage].observe(seconds)
+        self._frame_stages[stage] = seconds
+
+    def _draw_overlays(self, frame):
+        grosor_puntos, grosor_lineas = self.params["GROSOR_PUNTOS"], self.params["GROSOR_LINEAS"]
+        if self._roi:
+            cv2.polylines(frame, self._roi, True, (0, 255, 255), 1)
+        draw_detections(frame, self._tracks, self.names)
+        for fl in self._face_landmarks:
+            draw_custom_landmarks(frame, fl, mp_face_mesh.FACEMESH_TESSELATION, self.color_puntos, self.color_lineas, grosor_puntos, grosor_lineas)
+            draw_custom_landmarks(frame, fl, mp_face_mesh.FACEMESH_CONTOURS, self.color_puntos, self.color_lineas, grosor_puntos, grosor_lineas)
+            draw_custom_landmarks(frame, fl, mp_face_mesh.FACEMESH_IRISES, self.color_puntos, self.color_lineas, grosor_puntos, grosor_lineas)
+        if self._pose_landmarks:
+            draw_custom_landmarks(frame, self._pose_landmarks, mp_pose.POSE_CONNECTIONS, self.color_puntos, self.color_lineas, grosor_puntos, grosor_lineas)
+        hud = f"FPS: {self.fps:.1f} | YOLO:{'ON' if self.do_detect else 'OFF'} | FACE:{'ON' if self.do_face else 'OFF'} | BODY:{'ON' if self.do_body else 'OFF'}"
+        cv2.putText(frame, hud, (10, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2, cv2.LINE_AA)
+
+    def generate_frames(self, options=None):
+        try:
+            yield from self.broadcaster.mjpeg_stream(options)
+        except (GeneratorExit, BrokenPipeError):
+            # El cliente se ha desconectado.
+            print("[INFO] Cliente de streaming desconectado.")
+
+    def _apply_schedule_params(self):
+        if self.params["ADAPTIVE_STRIDE"]:
+            self.scheduler.set_adaptive(self.params["TARGET_FPS"], self.params["LATENCY_BUDGET_MS"])
+        else:
+            self.scheduler.set_fixed_strides(yolo=self.params["YOLO_STRIDE_N"], face=1, body=1)
+
+    def _set_roi(self, value):
+        self._roi = parse_roi(value, self.frame_width, self.frame_height)
+        self._roi_rect = roi_rect(self._roi, self.frame_width, self.frame_height)
+        self._roi_size = inference_size(self._roi_rect, self.frame_width, self.frame_height) if self._roi else None
+
+    def _resolve_classes(self, value):
+        """Lista de nombres o ids de clase -> ids del modelo (None = todas)."""
+        if not value:
+            return None
+        by_name = {name: i for i, name in self.names.items()}
+        ids = []
+        for c in value:
+            if isinstance(c, str) and c in by_name:
+                ids.append(by_name[c])
+            elif str(c).isdigit() and int(c) in self.names:
+                ids.append(int(c))
+            else:
+                raise ValueError(f"Clase desconocida: {c}")
+        return sorted(set(ids))
+
+    def _apply_motion_params(self):
+        self.motion_gate.threshold = self.params["MOTION_THRESHOLD"] / 100
+        self.motion_gate.max_idle = self.params["MOTION_MAX_IDLE_S"]
+        if not self.params["MOTION_GATE"]:
+            self.motion_gate.reset()
 
     def get_params(self):
         return self.params
 
+    def get_tracks(self):
+        tracks = self._tracks
+        return [{"track_id": int(t[6]), "class_id": int(t[5]), "class_name": self.names[int(t[5])],
+                 "confidence": round(float(t[4]), 3), "box": [round(float(v), 1) for v in t[:4]]}
+                for t in tracks]
+
+    def _landmarks_to_pixels(self, landmarks):
+        # Array compacto [x0, y0, x1, y1, ...] en píxeles del frame.
+        w, h = self.frame_width, self.frame_height
+        return [round(v) for lm in landmarks.landmark for v in (lm.x * w, lm.y * h)]
+
+    def _detection_event(self, frame_seq, from_yolo):
+        return {
+            "camera_id": self.camera_id,
+            "frame_seq": frame_seq,
+            "timestamp": self.capture.buffer.acquired_ts,
+            "source": "yolo" if from_yolo else "tracker", # "tracker" = caja propagada entre strides
+            "frame_size": [self.frame_width, self.frame_height],
+            "fps": round(self.fps, 1),
+            "detections": self.get_tracks(),
+            "faces": [self._landmarks_to_pixels(fl) for fl in self._face_landmarks],
+            "pose": self._landmarks_to_pixels(self._pose_landmarks) if self._pose_landmarks else None,
+        }
+
+    def get_overlay_topology(self):
+        """Conexiones entre landmarks para que el cliente dibuje las mallas (se pide una vez)."""
+        def edges(connections):
+            return sorted([int(a), int(b)] for a, b in connections)
+        load_mediapipe()
+        return {
+            "face_tesselation": edges(mp_face_mesh.FACEMESH_TESSELATION),
+            "face_contours": edges(mp_face_mesh.FACEMESH_CONTOURS),
+            "face_irises": edges(mp_face_mesh.FACEMESH_IRISES),
+            "pose_connections": edges(mp_pose.POSE_CONNECTIONS),
+            "color_puntos": list(self.color_puntos),
+            "color_lineas": list(self.color_lineas),
+        }
+
+    def generate_detections(self):
+        try:
+            yield from self.detections.sse_stream()
+        except (GeneratorExit, BrokenPipeError):
+            print("[INFO] Cliente de detecciones desconectado.")
+
     def set_param(self, param_name, value):
+        if param_name == "ROI":
+            try:
+                self._set_roi(value)
+            except (ValueError, TypeError, IndexError) as e:
+                return {"error": f"ROI inválido: {e}"}
+        elif param_name == "YOLO_CLASSES":
+            if not self.engine:
+                return {"error": "YOLO no disponible"}
+            try:
+                self._class_ids = self._resolve_classes(value)
+            except (ValueError, TypeError) as e:
+                return {"error": str(e)}
+            self.engine.set_classes(self.camera_id, self._class_ids)
         if param_name in self.params:
             self.params[param_name] = value
             # Actualizar yolo model si es necesario
-            if param_name == "YOLO_CONF_THRESHOLD" and self.model:
-                self.model.conf = value
-            elif param_name == "YOLO_IOU_THRESHOLD" and self.model:
-                self.model.iou = value
+            if param_name == "YOLO_CONF_THRESHOLD" and self.engine:
+                self.engine.set_conf(self.camera_id, value)
+            elif param_name == "YOLO_IOU_THRESHOLD" and self.engine:
+                self.engine.set_iou(value)
+            elif param_name in ("YOLO_STRIDE_N", "ADAPTIVE_STRIDE", "TARGET_FPS", "LATENCY_BUDGET_MS"):
+                self._apply_schedule_params()
+            elif param_name in ("MOTION_GATE", "MOTION_THRESHOLD", "MOTION_MAX_IDLE_S"):
+                self._apply_motion_params()
             return {"status": "ok", "param_name": param_name, "value": value}
         return {"error": "Parámetro no válido"}
 
@@ -470,25 +740,83 @@ class PTZCameraService:
             return self.audio_streamer.cam_audio_active
         return False
 
+    def _metric_samples(self):
+        labels = self.metric_labels
+        samples = [
+            ("antares_fps", "gauge", "FPS de salida del bucle de procesamiento", labels, self.fps),
+            ("antares_motion_gate_skipped_total", "counter", "Frames sin detectores por escena estática", labels,
+             self.motion_gate.skipped),
+        ]
+        if self.capture:
+            samples += [
+                ("antares_capture_frames_total", "counter", "Frames leídos de ffmpeg", labels, self.capture.frames_read),
+                ("antares_capture_dropped_frames_total", "counter",
+                 "Frames descartados antes de procesarse (el bucle iba más lento que la cámara)", labels,
+                 self.capture.buffer.dropped),
+                ("antares_capture_reconnects_total", "counter", "Reconexiones de la captura RTSP", labels,
+                 self.capture.reconnects),
+                ("antares_capture_partial_frames_total", "counter", "Frames cortados por EOF", labels,
+                 self.capture.partial_frames),
+                ("antares_capture_pool_frames", "gauge", "Arrays en el pool de captura", labels, len(self.capture.pool)),
+            ]
+        return samples + self.broadcaster.metric_samples()
+
+    def get_latency_stats(self):
+        """p50/p95/p99 recientes de cada etapa, en ms."""
+        stats = {}
+        for stage, hist in self._stage_hist.items():
+            for q, ms in hist.percentiles().items():
+                stats[f"latency_{stage}_p{q}_ms"] = ms
+        return stats
+
     def get_status(self):
         status = {
+            "camera_id": self.camera_id,
+            "state": self.state,
+            "start_error": self.start_error,
             "do_detect": self.do_detect,
             "do_face": self.do_face,
             "do_body": self.do_body,
             "mic_active": self.audio_streamer.mic_active if self.audio_streamer else False,
             "cam_audio_active": self.audio_streamer.cam_audio_active if self.audio_streamer else False,
             "ptz_available": self.ptz is not None,
-            "yolo_available": self.model is not None,
-            "rtsp_open": self.ffmpeg_process is not None and self.ffmpeg_process.poll() is None
+            "yolo_available": self.engine is not None,
+            "rtsp_open": (self.capture is not None and self.capture.is_open())
+                         or (self.passthrough is not None and self.passthrough.init_segment is not None),
+            "video_mode": "passthrough" if self.passthrough_active() and self.passthrough is not None
+                          and self.passthrough.init_segment is not None else "decoded",
+            "decode_paused": self.decode_paused,
         }
+        if self.capture:
+            status.update(self.capture.get_stats())
+        if self.passthrough:
+            status.update(self.passthrough.get_stats())
+        if self.engine:
+            status.update(self.engine.get_stats())
+        status.update(self.scheduler.get_stats())
+        status.update(self.motion_gate.get_stats())
+        status.update({f"startup_{k}": v for k, v in dict(self.startup).items()})
+        status.update(self.get_latency_stats())
+        status["stream_clients"] = len(self.broadcaster.clients)
         status.update(self.params)
         return status
 
     def release_resources(self):
+        with self._setup_lock: # Un arranque en curso ve "stopped" y no crea nada más
+            self.state = "stopped"
         self._running = False
-        if self.ffmpeg_process:
-            print("[INFO] Deteniendo proceso FFMPEG.")
-            self.ffmpeg_process.kill()
+        self.broadcaster.close()
+        self.detections.close()
+        if self.engine:
+            self.engine.unregister(self.camera_id)
+        with PTZCameraService._lock:
+            PTZCameraService._instances.pop(self.camera_id, None)
+        REGISTRY.unregister_collector(f"ptz:{self.camera_id}")
+        REGISTRY.remove(**self.metric_labels)
+        if self.capture:
+            self.capture.stop()
+        if self.passthrough:
+            self.passthrough.stop()
         if self.face_mesh:
             self.face_mesh.close()
         if self.pose:
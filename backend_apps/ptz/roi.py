@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+
+def parse_roi(value, width, height):
+    """Convierte ROI de la config/API en una lista de polígonos int32 Nx2.
+
+    Acepta un polígono ([[x, y], ...]) o una lista de polígonos, en píxeles del
+    frame de inferencia (FRAME_WIDTH x FRAME_HEIGHT). Vacío o None = frame completo.
+    """
+    if not value:
+        return []
+    polygons = value if isinstance(value[0][0], (list, tuple)) else [value]
+    result = []
+    for poly in polygons:
+        pts = np.asarray(poly, np.float32).reshape(-1, 2)
+        if len(pts) < 3:
+            raise ValueError("Cada polígono del ROI necesita al menos 3 puntos")
+        pts[:, 0] = np.clip(pts[:, 0], 0, width - 1)
+        pts[:, 1] = np.clip(pts[:, 1], 0, height - 1)
+        result.append(pts.round().astype(np.int32))
+    return result
+
+
+def roi_rect(polygons, width, height):
+    """Rectángulo (x1, y1, x2, y2) que envuelve todos los polígonos; el frame entero si no hay ROI."""
+    if not polygons:
+        return 0, 0, width, height
+    x, y, w, h = cv2.boundingRect(np.concatenate(polygons))
+    return x, y, x + w, y + h
+
+
+def inference_size(rect, width, height, base_size=640):
+    """Tamaño de inferencia para el recorte: misma escala que el frame completo a `base_size`.
+
+    AutoShape reescala el lado mayor de la imagen a `size`; si se le pasa el
+    recorte con el tamaño del frame completo lo ampliaría y no se ahorraría nada.
+    Se redondea a múltiplo de 32 (stride máximo de YOLOv5).
+    """
+    x1, y1, x2, y2 = rect
+    scale = base_size / max(width, height)
+    side = max(x2 - x1, y2 - y1) * scale
+    return int(min(base_size, max(32, -(-side // 32) * 32)))
+
+
+def filter_in_roi(det, polygons, offset=(0, 0)):
+    """Traslada las detecciones del recorte al frame y descarta las de centro fuera del ROI."""
+    if len(det) == 0:
+        return det
+    if offset != (0, 0):
+        det = det.copy()
+        det[:, [0, 2]] += offset[0]
+        det[:, [1, 3]] += offset[1]
+    if not polygons:
+        return det
+    cx = (det[:, 0] + det[:, 2]) / 2
+    cy = (det[:, 1] + det[:, 3]) / 2
+    keep = np.array([any(cv2.pointPolygonTest(p, (float(x), float(y)), False) >= 0 for p in polygons)
+                     for x, y in zip(cx, cy)], bool)
+    return det[keep]
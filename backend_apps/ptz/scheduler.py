@@ -0,0 +1,107 @@
+import time
+from contextlib import contextmanager
+
+
+class AdaptiveScheduler:
+    """Decide en cada frame qué detectores (YOLO, FaceMesh, Pose) se ejecutan.
+
+    Mide el coste de cada etapa (media móvil exponencial, en ms) y elige el stride
+    de cada detector para que el coste medio por frame quepa en 1000 / target_fps.
+    Además, si en un mismo frame tocan varias etapas y juntas superan el
+    presupuesto de latencia, las menos atrasadas se aplazan al frame siguiente.
+
+    El contador de frames es propio y monótono, así que el stride no deriva
+    con el cálculo de FPS del HUD.
+    """
+
+    STAGES = ("yolo", "face", "body")
+
+    def __init__(self, target_fps=15, latency_budget_ms=120, max_stride=30, alpha=0.2, observer=None):
+        self.target_fps = target_fps
+        self.latency_budget_ms = latency_budget_ms
+        self.max_stride = max_stride
+        self.alpha = alpha
+        self.adaptive = True
+        self.cost = {s: None for s in self.STAGES}
+        self.stride = {s: 1 for s in self.STAGES}
+        self.base_cost = 0.0
+        self._frame = 0
+        self._last_run = {s: -max_stride for s in self.STAGES}
+        self._frame_stage_ms = 0.0
+        self.observer = observer # observer(stage, segundos): cada medición, ej. para los histogramas de /metrics
+
+    def set_fixed_strides(self, **strides):
+        """Modo manual: strides fijos (ej. yolo=YOLO_STRIDE_N) sin aplazamientos."""
+        self.adaptive = False
+        self.stride.update({s: max(1, int(n)) for s, n in strides.items()})
+
+    def set_adaptive(self, target_fps=None, latency_budget_ms=None):
+        self.adaptive = True
+        if target_fps:
+            self.target_fps = target_fps
+        if latency_budget_ms:
+            self.latency_budget_ms = latency_budget_ms
+
+    def _ema(self, old, new):
+        return new if old is None else old + self.alpha * (new - old)
+
+    def _update_strides(self, enabled):
+        budget = max(1000.0 / self.target_fps - self.base_cost, 1.0)
+        for s in enabled:
+            self.stride[s] = 1 # Sin medición todavía se ejecuta en cada frame para medir
+        measured = [s for s in enabled if self.cost[s] is not None]
+        # Voraz: subir el stride de la etapa que más coste medio aporta hasta caber en el presupuesto.
+        while measured:
+            total = sum(self.cost[s] / self.stride[s] for s in measured)
+            if total <= budget:
+                break
+            candidates = [s for s in measured if self.stride[s] < self.max_stride]
+            if not candidates:
+                break
+            worst = max(candidates, key=lambda s: self.cost[s] / self.stride[s])
+            self.stride[worst] += 1
+
+    def plan(self, enabled):
+        """Empieza un frame y devuelve el conjunto de etapas que deben ejecutarse."""
+        self._frame += 1
+        self._frame_start = time.perf_counter()
+        self._frame_stage_ms = 0.0
+        if self.adaptive:
+            self._update_strides(enabled)
+        due = [s for s in enabled if self._frame - self._last_run[s] >= self.stride[s]]
+        if not self.adaptive:
+            return set(due)
+        run, spent = set(), 0.0
+        # Las etapas más atrasadas primero; siempre se ejecuta al menos una.
+        for s in sorted(due, key=lambda s: self._frame - self._last_run[s] - self.stride[s], reverse=True):
+            c = self.cost[s] or 0.0
+            if run and spent + c > self.latency_budget_ms:
+                continue
+            run.add(s)
+            spent += c
+        return run
+
+    @contextmanager
+    def measure(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            self.cost[stage] = self._ema(self.cost[stage], ms)
+            self._last_run[stage] = self._frame
+            self._frame_stage_ms += ms
+            if self.observer:
+                self.observer(stage, ms / 1000)
+
+    def end_frame(self):
+        """Cierra el frame y actualiza el coste base (todo lo que no es un detector)."""
+        total_ms = (time.perf_counter() - self._frame_start) * 1000
+        self.base_cost = self._ema(self.base_cost, max(total_ms - self._frame_stage_ms, 0.0))
+
+    def get_stats(self):
+        stats = {"scheduler_adaptive": self.adaptive, "scheduler_base_ms": round(self.base_cost, 2)}
+        for s in self.STAGES:
+            stats[f"scheduler_{s}_stride"] = self.stride[s]
+            stats[f"scheduler_{s}_ms"] = round(self.cost[s], 2) if self.cost[s] is not None else None
+        return stats
@@ -0,0 +1,123 @@
+import numpy as np
+
+EMPTY_TRACKS = np.zeros((0, 7), np.float32)
+
+
+def iou_matrix(a, b):
+    """IoU entre dos conjuntos de cajas x1, y1, x2, y2 (NxM)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class _Track:
+    __slots__ = ("track_id", "box", "anchor", "velocity", "conf", "cls", "missed", "age")
+
+    def __init__(self, track_id, det):
+        self.track_id = track_id
+        self.box = det[:4].astype(np.float32)
+        self.anchor = self.box # Última caja detectada
+        self.velocity = np.zeros(4, np.float32)
+        self.conf = float(det[4])
+        self.cls = int(det[5])
+        self.missed = 0 # Actualizaciones de YOLO seguidas sin match
+        self.age = 0 # Frames desde la última detección
+
+
+def center_shift_matrix(a, b):
+    """Distancia entre centros relativa al tamaño medio de la caja de `a` (NxM)."""
+    ca = (a[:, :2] + a[:, 2:4]) / 2
+    cb = (b[:, :2] + b[:, 2:4]) / 2
+    size = np.maximum(((a[:, 2] - a[:, 0]) + (a[:, 3] - a[:, 1])) / 2, 1.0)
+    return np.linalg.norm(ca[:, None, :] - cb[None, :, :], axis=2) / size[:, None]
+
+
+class IoUTracker:
+    """Seguimiento multi-objeto ligero por IoU con predicción de velocidad constante.
+
+    `update()` se llama en los frames en que corrió YOLO: asocia detecciones a
+    pistas por IoU (misma clase, emparejamiento voraz; si no hay solape suficiente
+    se acepta un desplazamiento del centro de hasta `max_center_shift` veces el
+    tamaño de la caja, útil antes de conocer la velocidad) y estima la velocidad de
+    cada caja. `predict()` se llama en los frames saltados por el stride y
+    desplaza las cajas según esa velocidad, así las pistas (y sus IDs estables)
+    siguen siendo continuas aunque YOLO corra cada 4-6 frames. `hold()` se
+    llama con la escena quieta (puerta de movimiento): las cajas no se mueven
+    pero el tiempo sigue contando para la próxima estimación de velocidad.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_shift=1.0, max_missed=2, smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_center_shift = max_center_shift
+        self.max_missed = max_missed
+        self.smoothing = smoothing
+        self._tracks = []
+        self._next_id = 1
+
+    def clear(self):
+        self._tracks = []
+
+    def predict(self):
+        for t in self._tracks:
+            t.box = t.box + t.velocity
+            t.age += 1
+        return self.as_array()
+
+    def hold(self):
+        for t in self._tracks:
+            t.age += 1
+        return self.as_array()
+
+    def update(self, det):
+        """Asocia las detecciones Nx6 del frame actual y devuelve las pistas Nx7."""
+        self.predict() # Llevar las pistas al frame actual antes de asociar
+        boxes = np.array([t.box for t in self._tracks], np.float32).reshape(-1, 4)
+        score = np.zeros((len(boxes), len(det)), np.float32)
+        if len(boxes) and len(det):
+            ious = iou_matrix(boxes, det[:, :4])
+            shift = center_shift_matrix(boxes, det[:, :4])
+            # Los emparejamientos por IoU siempre puntúan por encima de los de distancia.
+            by_shift = (1 - shift / self.max_center_shift) * self.iou_threshold * 0.99
+            score = np.where(ious >= self.iou_threshold, ious, np.clip(by_shift, 0, None))
+            same_cls = np.array([t.cls for t in self._tracks])[:, None] == det[None, :, 5].astype(int)
+            score = np.where(same_cls, score, 0.0)
+
+        matched_t, matched_d = set(), set()
+        for ti, di in sorted(zip(*np.nonzero(score > 0)), key=lambda p: -score[p]):
+            if ti in matched_t or di in matched_d:
+                continue
+            matched_t.add(ti)
+            matched_d.add(di)
+            t = self._tracks[ti]
+            new_box = det[di, :4].astype(np.float32)
+            v = (new_box - t.anchor) / max(t.age, 1)
+            t.velocity = self.smoothing * v + (1 - self.smoothing) * t.velocity
+            t.box = t.anchor = new_box
+            t.conf, t.missed, t.age = float(det[di, 4]), 0, 0
+
+        alive = []
+        for ti, t in enumerate(self._tracks):
+            if ti not in matched_t:
+                t.missed += 1
+                if t.missed > self.max_missed:
+                    continue
+            alive.append(t)
+        for di in range(len(det)):
+            if di not in matched_d:
+                alive.append(_Track(self._next_id, det[di]))
+                self._next_id += 1
+        self._tracks = alive
+        return self.as_array()
+
+    def as_array(self):
+        """Pistas como array Nx7: x1, y1, x2, y2, conf, clase, track_id."""
+        if not self._tracks:
+            return EMPTY_TRACKS
+        return np.array([[*t.box, t.conf, t.cls, t.track_id] for t in self._tracks], np.float32)
@@ -0,0 +1,153 @@
+# Servidor ASGI (asyncio) de Antares para muchos espectadores simultáneos.
+#
+# Además de MJPEG, cada servicio tiene un WebSocket (/ptz_feed/ws, /arneg_feed/ws)
+# con frames binarios JPEG/WebP, metadatos por frame (captura, latencias por
+# etapa, detecciones) y control de flujo por acks; ver FrameBroadcaster.ws_stream.
+#
+# /ptz_feed.mp4 (passthrough H.264 sin análisis) también se sirve aquí, con
+# H264Passthrough.stream_async.
+#
+# Los streams de larga duración (/ptz_feed, /arneg_feed, /synthetic_feed y el SSE
+# de detecciones) se sirven con corrutinas: cada espectador es una corrutina que
+# lee de su cola en el FrameBroadcaster, no un hilo bloqueado en el socket. El
+# resto de la API (peticiones cortas) sigue siendo la app Flask de
+# backend_server.py, montada con un adaptador WSGI, así que las rutas, el estado
+# de los servicios y /metrics son los mismos en ambos modos.
+#
+# Dependencias (opcionales, solo para este modo): pip install starlette uvicorn a2wsgi
+#
+# Uso (desde la raíz del proyecto; un solo proceso, los servicios viven en él):
+#   python backend_asgi.py
+#   uvicorn backend_asgi:app --host 0.0.0.0 --port 5000
+# Para miles de conexiones, subir el límite de descriptores: ulimit -n 65536
+
+import os
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+try:
+    from websockets.exceptions import ConnectionClosed # Implementación WebSocket de uvicorn
+except ImportError:
+    ConnectionClosed = WebSocketDisconnect
+
+import backend_server
+from backend_apps.common.frame_broadcaster import StreamOptions
+
+MJPEG_MEDIA_TYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+
+def _cors_headers(request):
+    origin = request.headers.get('origin')
+    if origin in backend_server.ALLOWED_ORIGINS:
+        return {'Access-Control-Allow-Origin': origin, 'Vary': 'Origin'}
+    return {}
+
+
+def _mjpeg_response(request, broadcaster, not_started):
+    if broadcaster is None:
+        return PlainTextResponse(not_started, status_code=503)
+    try:
+        options = StreamOptions.from_query(request.query_params)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    # Starlette cancela el generador cuando el cliente se desconecta (su finally lo da de baja).
+    return StreamingResponse(broadcaster.mjpeg_stream_async(options), media_type=MJPEG_MEDIA_TYPE,
+                             headers=_cors_headers(request))
+
+
+async def ptz_feed(request):
+    service = backend_server.ptz_service_instances.get(request.query_params.get('camera') or 'default')
+    return _mjpeg_response(request, service.broadcaster if service else None, "PTZ service not started")
+
+
+async def arneg_feed(request):
+    service = backend_server.argneg_service_instance
+    return _mjpeg_response(request, service.broadcaster if service else None, "Arneg service not started")
+
+
+async def synthetic_feed(request):
+    camera = backend_server.get_synthetic_camera()
+    if camera is None:
+        return PlainTextResponse("Synthetic camera disabled (ANTARES_SYNTHETIC_CAMERA=1)", status_code=404)
+    return _mjpeg_response(request, camera.broadcaster, None)
+
+
+async def ptz_feed_mp4(request):
+    service = backend_server.ptz_service_instances.get(request.query_params.get('camera') or 'default')
+    if service is None:
+        return PlainTextResponse("PTZ service not started", status_code=503)
+    # wait_ready bloquea hasta que ffmpeg entrega el moov: fuera del event loop.
+    passthrough = await run_in_threadpool(service.open_passthrough)
+    if passthrough is None:
+        return PlainTextResponse("Passthrough not available (analytics enabled)", status_code=409)
+    return StreamingResponse(passthrough.stream_async(), media_type='video/mp4',
+                             headers={'Cache-Control': 'no-store', **_cors_headers(request)})
+
+
+async def _ws_session(websocket, broadcaster):
+    if broadcaster is None:
+        await websocket.close(code=1013) # Servicio no iniciado: probar más tarde
+        return
+    try:
+        options = StreamOptions.from_query(websocket.query_params)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await websocket.accept()
+    try:
+        await broadcaster.ws_stream(websocket.send_bytes, websocket.receive_text, options)
+    except (WebSocketDisconnect, ConnectionClosed, OSError):
+        pass # El cliente se fue a mitad de un envío
+    except RuntimeError:
+        # Starlette lanza RuntimeError al enviar tras el cierre: también es una desconexión.
+        if websocket.client_state == WebSocketState.CONNECTED and \
+                websocket.application_state == WebSocketState.CONNECTED:
+            raise
+
+
+async def ptz_feed_ws(websocket):
+    service = backend_server.ptz_service_instances.get(websocket.query_params.get('camera') or 'default')
+    await _ws_session(websocket, service.broadcaster if service else None)
+
+
+async def arneg_feed_ws(websocket):
+    service = backend_server.argneg_service_instance
+    await _ws_session(websocket, service.broadcaster if service else None)
+
+
+async def synthetic_feed_ws(websocket):
+    camera = backend_server.get_synthetic_camera()
+    await _ws_session(websocket, camera.broadcaster if camera else None)
+
+
+async def ptz_detections_stream(request):
+    service = backend_server.ptz_service_instances.get(request.query_params.get('camera') or 'default')
+    if service is None:
+        return PlainTextResponse("PTZ service not started", status_code=503)
+    return StreamingResponse(service.detections.sse_stream_async(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **_cors_headers(request)})
+
+
+app = Starlette(routes=[
+    Route('/ptz_feed', ptz_feed),
+    Route('/ptz_feed.mp4', ptz_feed_mp4),
+    Route('/arneg_feed', arneg_feed),
+    Route('/synthetic_feed', synthetic_feed),
+    Route('/api/ptz/detections/stream', ptz_detections_stream),
+    WebSocketRoute('/ptz_feed/ws', ptz_feed_ws),
+    WebSocketRoute('/arneg_feed/ws', arneg_feed_ws),
+    WebSocketRoute('/synthetic_feed/ws', synthetic_feed_ws),
+    Mount('/', app=WSGIMiddleware(backend_server.app)), # Resto de la API: la app Flask tal cual
+])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    print("--- Servidor Backend de Antares (ASGI) --- ")
+    print("Streams servidos con asyncio; API Flask montada vía WSGI.")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('ANTARES_PORT', '5000')), log_level='warning')
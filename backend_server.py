@@ -1,10 +1,12 @@
 # Mini servidor Flask para ejecutar aplicaciones Python como backend para Antares UI
 
 import os
+import threading
 from flask import Flask, jsonify, Response, request
 from flask_cors import CORS
-from backend_apps.ptz.ptz_service import PTZCameraService
-from backend_apps.argneg_contornos.argneg_service import ArgnegService
+# Solo la configuración PTZ (módulo ligero). Los servicios se importan al arrancar su
+# aplicación: así /health y Arneg no esperan a que carguen torch, mediapipe u onvif.
+from backend_apps.ptz.config import CAMERAS, get_camera_config
 
 # --- Forzar TCP para el stream RTSP de OpenCV ---
 # Esto a menudo soluciona problemas de conexión cuando UDP está bloqueado o no es fiable.
@@ -19,15 +21,20 @@ app = Flask(__name__)
 ARNEG_CAMERA_INDEX = 1
 
 # Inicializar las instancias de los servicios a None
-ptz_service_instance = None
+# El servicio PTZ tiene una instancia por cámara (ver CAMERAS en backend_apps/ptz/config.py).
+ptz_service_instances = {}
 argneg_service_instance = None
+synthetic_camera = None # Solo para pruebas de carga (ANTARES_SYNTHETIC_CAMERA=1)
+_synthetic_lock = threading.Lock()
 
 # --- Configuración de CORS ---
 # Permite que el frontend (ej. http://localhost:5173) se comunique con este backend.
+ALLOWED_ORIGINS = ["http://localhost:5173", "http://192.168.1.9:5173"]
 CORS(app, resources={
-    r"/api/*": {"origins": ["http://localhost:5173", "http://192.168.1.9:5173"]}, 
-    r"/ptz_feed": {"origins": ["http://localhost:5173", "http://192.168.1.9:5173"]}, 
-    r"/arneg_feed": {"origins": ["http://localhost:5173", "http://192.168.1.9:5173"]}
+    r"/api/*": {"origins": ALLOWED_ORIGINS}, 
+    r"/ptz_feed": {"origins": ALLOWED_ORIGINS}, 
+    r"/ptz_feed.mp4": {"origins": ALLOWED_ORIGINS},
+    r"/arneg_feed": {"origins": ALLOWED_ORIGINS}
 }) # En producción, restringe el origen
 
 # Directorio base donde se encuentran las `backend_apps`
@@ -40,6 +47,7 @@ def arneg_start():
     """Inicializa el servicio de Arneg Contornos."""
     global argneg_service_instance
     if argneg_service_instance is None:
+        from backend_apps.argneg_contornos.argneg_service import ArgnegService
         argneg_service_instance = ArgnegService(camera_index=ARNEG_CAMERA_INDEX)
         return jsonify({"status": "Arneg service started"}), 200
     return jsonify({"status": "Arneg service already running"}), 200
@@ -54,12 +62,21 @@ def arneg_stop():
         return jsonify({"status": "Arneg service stopped"}), 200
     return jsonify({"status": "Arneg service not running"}), 200
 
+def _stream_options():
+    """Opciones del stream MJPEG desde la query: ?fps=&quality=&width=&adaptive=."""
+    from backend_apps.common.frame_broadcaster import StreamOptions
+    return StreamOptions.from_query(request.args)
+
 @app.route('/arneg_feed')
 def arneg_feed():
-    """Ruta para el streaming de video MJPEG de la cámara Arneg."""
+    """Ruta para el streaming de video MJPEG de la cámara Arneg (acepta ?fps=&quality=&width=)."""
     if argneg_service_instance is None:
         return Response("Arneg service not started", status=503, mimetype='text/plain')
-    return Response(argneg_service_instance.generate_frames(),
+    try:
+        options = _stream_options()
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype='text/plain')
+    return Response(argneg_service_instance.generate_frames(options),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/api/arneg/status', methods=['GET'])
@@ -86,43 +103,120 @@ def arneg_set_param():
 
 
 # ===================== Rutas para la aplicación PTZ =====================
+def _ptz_camera_id():
+    """Cámara a la que va dirigida la petición: `?camera=<id>` o campo "camera" del JSON."""
+    data = request.get_json(silent=True) or {}
+    return request.args.get('camera') or data.get('camera') or 'default'
+
+@app.route('/api/ptz/cameras', methods=['GET'])
+def ptz_cameras():
+    """Lista las cámaras PTZ configuradas y si su servicio está corriendo."""
+    return jsonify([{"camera_id": camera_id, "running": camera_id in ptz_service_instances}
+                    for camera_id in CAMERAS])
+
 @app.route('/api/ptz/start', methods=['POST'])
 def ptz_start():
-    """Inicializa el servicio de la cámara PTZ."""
-    global ptz_service_instance
-    if ptz_service_instance is None:
-        ptz_service_instance = PTZCameraService()
-        return jsonify({"status": "PTZ service started"}), 200
-    return jsonify({"status": "PTZ service already running"}), 200
+    """Inicializa el servicio de la cámara PTZ.
+
+    Vuelve enseguida (202) con state="starting"; la conexión, la carga de modelos y
+    el warm-up siguen en segundo plano. El progreso se consulta en /api/ptz/status.
+    """
+    camera_id = _ptz_camera_id()
+    if camera_id not in CAMERAS:
+        return jsonify({"error": f"Cámara no válida: {camera_id}"}), 400
+    instance = ptz_service_instances.get(camera_id)
+    if instance is not None and instance.state == "error":
+        # Reintento tras un arranque fallido
+        ptz_service_instances.pop(camera_id).release_resources()
+        instance = None
+    if instance is None:
+        from backend_apps.ptz.ptz_service import PTZCameraService
+        instance = ptz_service_instances[camera_id] = PTZCameraService(get_camera_config(camera_id))
+        return jsonify({"status": "PTZ service starting", "state": instance.state, "camera_id": camera_id}), 202
+    return jsonify({"status": "PTZ service already running", "state": instance.state, "camera_id": camera_id}), 200
 
 @app.route('/api/ptz/stop_service', methods=['POST'])
 def ptz_stop_service():
     """Detiene y libera los recursos del servicio de la cámara PTZ."""
-    global ptz_service_instance
+    ptz_service_instance = ptz_service_instances.pop(_ptz_camera_id(), None)
     if ptz_service_instance:
         ptz_service_instance.release_resources()
-        ptz_service_instance = None
         return jsonify({"status": "PTZ service stopped"}), 200
     return jsonify({"status": "PTZ service not running"}), 200
 
 @app.route('/ptz_feed')
 def ptz_feed():
-    """Ruta para el streaming de video MJPEG de la cámara PTZ."""
+    """Ruta para el streaming de video MJPEG de la cámara PTZ (acepta ?fps=&quality=&width=)."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return Response("PTZ service not started", status=503, mimetype='text/plain')
-    return Response(ptz_service_instance.generate_frames(),
+    try:
+        options = _stream_options()
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype='text/plain')
+    return Response(ptz_service_instance.generate_frames(options),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/ptz_feed.mp4')
+def ptz_feed_mp4():
+    """H.264 de la cámara sin decodificar, en MP4 fragmentado para Media Source Extensions.
+
+    Solo disponible cuando no hay YOLO/Face/Body activos (PASSTHROUGH); si no, 409 y
+    el cliente usa /ptz_feed.
+    """
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
+    if ptz_service_instance is None:
+        return Response("PTZ service not started", status=503, mimetype='text/plain')
+    passthrough = ptz_service_instance.open_passthrough()
+    if passthrough is None:
+        return Response("Passthrough not available (analytics enabled)", status=409, mimetype='text/plain')
+    return Response(passthrough.stream(), mimetype='video/mp4', headers={'Cache-Control': 'no-store'})
+
 @app.route('/api/ptz/status', methods=['GET'])
 def ptz_status():
     """Obtiene el estado actual de la aplicación PTZ (toggles, parámetros)."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"status": "stopped", "message": "PTZ service not running."})
     return jsonify(ptz_service_instance.get_status())
 
+@app.route('/api/ptz/tracks', methods=['GET'])
+def ptz_tracks():
+    """Devuelve las pistas actuales del tracker (cajas YOLO con ID estable)."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
+    if ptz_service_instance is None:
+        return jsonify({"error": "PTZ service not started"}), 400
+    return jsonify(ptz_service_instance.get_tracks())
+
+@app.route('/api/ptz/detections/latest', methods=['GET'])
+def ptz_detections_latest():
+    """Último resultado de detección: secuencia de frame, timestamp, clases, confianzas y cajas."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
+    if ptz_service_instance is None:
+        return jsonify({"error": "PTZ service not started"}), 400
+    return jsonify(ptz_service_instance.detections.latest())
+
+@app.route('/api/ptz/detections/stream')
+def ptz_detections_stream():
+    """Stream de detecciones en JSON por Server-Sent Events (sin video)."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
+    if ptz_service_instance is None:
+        return Response("PTZ service not started", status=503, mimetype='text/plain')
+    return Response(ptz_service_instance.generate_detections(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/ptz/overlay_topology', methods=['GET'])
+def ptz_overlay_topology():
+    """Conexiones de FaceMesh/Pose para dibujar los landmarks en el cliente (modo CLIENT_OVERLAY)."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
+    if ptz_service_instance is None:
+        return jsonify({"error": "PTZ service not started"}), 400
+    return jsonify(ptz_service_instance.get_overlay_topology())
+
 @app.route('/api/ptz/set_param', methods=['POST'])
 def ptz_set_param():
     """Establece un parámetro específico de la aplicación PTZ."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"error": "PTZ service not started"}), 400
     data = request.json
@@ -130,9 +224,11 @@ def ptz_set_param():
     value = data.get('value')
     
     # El valor de los trackbars de la UI suele venir como string, hay que convertirlo.
-    # Intentamos convertir a float, y si no, a int.
+    # Intentamos convertir a float, y si no, a int. Las listas (ROI, YOLO_CLASSES) pasan tal cual.
     try:
-        if '.' in str(value):
+        if isinstance(value, list):
+            final_value = value
+        elif '.' in str(value):
             final_value = float(value)
         else:
             final_value = int(value)
@@ -148,6 +244,7 @@ def ptz_set_param():
 @app.route('/api/ptz/toggle_feature', methods=['POST'])
 def ptz_toggle_feature():
     """Alterna el estado de una característica (YOLO, Face, Body)."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"error": "PTZ service not started"}), 400
     data = request.json
@@ -160,6 +257,7 @@ def ptz_toggle_feature():
 @app.route('/api/ptz/move', methods=['POST'])
 def ptz_move():
     """Mueve la cámara PTZ en una dirección específica."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"error": "PTZ service not started"}), 400
     data = request.json
@@ -172,6 +270,7 @@ def ptz_move():
 @app.route('/api/ptz/stop', methods=['POST'])
 def ptz_stop():
     """Detiene el movimiento de la cámara PTZ."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"error": "PTZ service not started"}), 400
     ptz_service_instance.stop_ptz()
@@ -180,6 +279,7 @@ def ptz_stop():
 @app.route('/api/ptz/home', methods=['POST'])
 def ptz_home():
     """Mueve la cámara PTZ a su posición de inicio."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"error": "PTZ service not started"}), 400
     ptz_service_instance.goto_home_ptz()
@@ -188,6 +288,7 @@ def ptz_home():
 @app.route('/api/ptz/toggle_mic', methods=['POST'])
 def ptz_toggle_mic():
     """Alterna el streaming de micrófono a la cámara."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"error": "PTZ service not started"}), 400
     new_state = ptz_service_instance.toggle_mic_stream()
@@ -196,6 +297,7 @@ def ptz_toggle_mic():
 @app.route('/api/ptz/toggle_cam_audio', methods=['POST'])
 def ptz_toggle_cam_audio():
     """Alterna la escucha de audio de la cámara."""
+    ptz_service_instance = ptz_service_instances.get(_ptz_camera_id())
     if ptz_service_instance is None:
         return jsonify({"error": "PTZ service not started"}), 400
     new_state = ptz_service_instance.toggle_camera_audio()
@@ -203,6 +305,39 @@ def ptz_toggle_cam_audio():
 
 # ===================== Fin de Rutas para la aplicación PTZ =====================
 
+# ===================== Cámara sintética (pruebas de carga) =====================
+
+def get_synthetic_camera():
+    """Cámara sintética compartida, creada al conectarse el primer cliente. None si no está habilitada."""
+    global synthetic_camera
+    if os.environ.get('ANTARES_SYNTHETIC_CAMERA') != '1':
+        return None
+    with _synthetic_lock:
+        if synthetic_camera is None:
+            from backend_apps.common.synthetic_camera import SyntheticCamera
+            width, height = (int(v) for v in os.environ.get('ANTARES_SYNTHETIC_SIZE', '1280x720').split('x'))
+            synthetic_camera = SyntheticCamera(width, height, float(os.environ.get('ANTARES_SYNTHETIC_FPS', '25')))
+        return synthetic_camera
+
+@app.route('/synthetic_feed')
+def synthetic_feed():
+    """Stream MJPEG de la cámara sintética (ver tools/load_test_stream.py)."""
+    camera = get_synthetic_camera()
+    if camera is None:
+        return Response("Synthetic camera disabled (ANTARES_SYNTHETIC_CAMERA=1)", status=404, mimetype='text/plain')
+    try:
+        options = _stream_options()
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype='text/plain')
+    return Response(camera.broadcaster.mjpeg_stream(options),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# Métricas de latencia por etapa, frames descartados y colas (formato Prometheus)
+@app.route('/metrics')
+def metrics():
+    from backend_apps.common.metrics import REGISTRY
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Endpoint de salud para verificar que el servidor está corriendo
 @app.route('/health')
 def health_check():
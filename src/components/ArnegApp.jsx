@@ -1,13 +1,20 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
+import { useWsVideo, wsUrl } from '../hooks/useWsVideo.js';
 
 const API_BASE_URL = 'http://localhost:5000/api/arneg';
 const VIDEO_FEED_URL = 'http://localhost:5000/arneg_feed';
+const VIDEO_WS_URL = wsUrl(VIDEO_FEED_URL);
 
 function ArnegApp() {
   const [params, setParams] = useState(null);
   const [isServiceRunning, setIsServiceRunning] = useState(false);
   const [loading, setLoading] = useState(false); // Para acciones específicas
   const [error, setError] = useState(null);
+  const imgRef = useRef(null);
+
+  // Video por WebSocket (modo ASGI); si no está disponible, MJPEG.
+  const video = useWsVideo(VIDEO_WS_URL, isServiceRunning, imgRef);
+  const useMjpeg = video.state === 'failed' || video.state === 'closed';
 
   // Función para detener el servicio
   const stopService = useCallback(async () => {
@@ -101,10 +108,12 @@ function ArnegApp() {
           <div className="relative w-full flex-grow" style={{ minHeight: '360px' }}>
             {isServiceRunning ? (
               <img
-                src={`${VIDEO_FEED_URL}?t=${new Date().getTime()}`}
+                ref={imgRef}
+                src={useMjpeg ? `${VIDEO_FEED_URL}?t=${new Date().getTime()}` : undefined}
                 alt="Video Stream"
                 className="absolute top-0 left-0 w-full h-full object-contain"
                 onError={(e) => {
+                  if (!useMjpeg) return;
                   e.target.onerror = null;
                   setError('El stream de video no está disponible. Verifica la cámara y el backend.');
                   setIsServiceRunning(false); // Detiene el intento de carga
@@ -115,6 +124,11 @@ function ArnegApp() {
                 <span className="text-gray-400">Servicio detenido</span>
               </div>
             )}
+            {isServiceRunning && video.latency && (
+              <span className="absolute bottom-2 left-2 bg-black/60 text-white text-xs px-2 py-1 rounded" title="Captura → pantalla requiere relojes sincronizados (NTP)">
+                WebSocket · captura→pantalla {video.latency.glass_ms.toFixed(0)} ms · servidor {video.latency.server_ms.toFixed(0)} ms
+              </span>
+            )}
           </div>
           <div className="p-4 bg-gray-900">
             {!isServiceRunning ? (
@@ -1,13 +1,36 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
+import { useMseVideo } from '../hooks/useMseVideo.js';
+import { useWsVideo, wsUrl } from '../hooks/useWsVideo.js';
 
 const API_BASE_URL = 'http://localhost:5000/api/ptz';
 const VIDEO_FEED_URL = 'http://localhost:5000/ptz_feed';
+const VIDEO_WS_URL = wsUrl(VIDEO_FEED_URL);
+const VIDEO_MP4_URL = `${VIDEO_FEED_URL}.mp4`;
 
 function PTZApp() {
   const [status, setStatus] = useState(null);
   const [isServiceRunning, setIsServiceRunning] = useState(false);
   const [loading, setLoading] = useState(false); // Para acciones de Iniciar/Detener
   const [error, setError] = useState(null);
+  const imgRef = useRef(null);
+  const videoRef = useRef(null);
+  const canvasRef = useRef(null);
+  const topologyRef = useRef(null); // Conexiones de FaceMesh/Pose (se piden una vez)
+
+  const clientOverlay = isServiceRunning && !!status?.CLIENT_OVERLAY;
+
+  // Sin análisis activos el backend ofrece el H.264 de la cámara sin decodificar
+  // (passthrough); si el navegador no lo soporta se usa el WebSocket/MJPEG.
+  const passthroughMode = isServiceRunning && status?.video_mode === 'passthrough';
+  const mse = useMseVideo(VIDEO_MP4_URL, status?.passthrough_codec, passthroughMode, videoRef);
+  const usePassthrough = passthroughMode && mse.state !== 'unsupported' && mse.state !== 'failed';
+
+  // Video por WebSocket (modo ASGI); en modo Flask se usa el MJPEG. Con WebSocket las
+  // detecciones llegan en los metadatos de su propio frame, sin el SSE.
+  const video = useWsVideo(VIDEO_WS_URL, isServiceRunning && !usePassthrough, imgRef,
+                           clientOverlay ? (meta) => meta.detections && drawOverlay(meta.detections) : null);
+  const useMjpeg = !usePassthrough && (video.state === 'failed' || video.state === 'closed');
+  const wsOpen = video.state === 'open';
 
   // Función para detener el servicio
   const stopService = useCallback(async () => {
@@ -30,8 +53,8 @@ function PTZApp() {
       const response = await fetch(`${API_BASE_URL}/start`, { method: 'POST' });
       if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
       setIsServiceRunning(true);
-      // Dar un pequeño margen para que el servicio inicialice antes de pedir el estado
-      setTimeout(() => fetchStatus(), 1000);
+      // El arranque sigue en segundo plano (state = "starting"); el sondeo de estado muestra el progreso.
+      setTimeout(() => fetchStatus(), 300);
     } catch (e) {
       console.error("Error starting PTZ service:", e);
       setError("No se pudo iniciar el servicio PTZ. Verifica la consola del backend.");
@@ -63,12 +86,15 @@ function PTZApp() {
   }, [isServiceRunning]);
 
   // Efecto para obtener el estado periódicamente
+  const isStarting = status?.state === 'starting';
+  const hasStatus = !!status;
   useEffect(() => {
     if (isServiceRunning) {
-      const interval = setInterval(fetchStatus, 3000);
+      // Sondeo más rápido mientras el servicio arranca
+      const interval = setInterval(fetchStatus, isStarting || !hasStatus ? 500 : 3000);
       return () => clearInterval(interval);
     }
-  }, [isServiceRunning, fetchStatus]);
+  }, [isServiceRunning, isStarting, hasStatus, fetchStatus]);
 
   // Efecto para detener el servicio al desmontar
   useEffect(() => {
@@ -79,6 +105,81 @@ function PTZApp() {
     };
   }, [isServiceRunning, stopService]);
 
+  // Overlay en cliente: el servidor envía el video limpio y aquí se dibujan
+  // cajas, landmarks y HUD a partir de los metadatos (SSE).
+  useEffect(() => {
+    if (!clientOverlay) return;
+    let cancelled = false;
+    if (!topologyRef.current) {
+      fetch(`${API_BASE_URL}/overlay_topology`)
+        .then(r => (r.ok ? r.json() : null))
+        .then(data => { if (!cancelled && data) topologyRef.current = data; })
+        .catch(e => console.error("Error fetching overlay topology:", e));
+    }
+    const source = wsOpen ? null : new EventSource(`${API_BASE_URL}/detections/stream`);
+    if (source) source.addEventListener('detections', (e) => drawOverlay(JSON.parse(e.data)));
+    return () => {
+      cancelled = true;
+      if (source) source.close();
+      const canvas = canvasRef.current;
+      if (canvas) canvas.getContext('2d').clearRect(0, 0, canvas.width, canvas.height);
+    };
+  }, [clientOverlay, wsOpen]);
+
+  const drawOverlay = (event) => {
+    const canvas = canvasRef.current;
+    const img = imgRef.current;
+    if (!canvas || !img) return;
+    // El canvas cubre el <img>; se replica el escalado de object-contain.
+    const cw = img.clientWidth, ch = img.clientHeight;
+    if (canvas.width !== cw || canvas.height !== ch) {
+      canvas.width = cw;
+      canvas.height = ch;
+    }
+    const ctx = canvas.getContext('2d');
+    ctx.clearRect(0, 0, cw, ch);
+    const [fw, fh] = event.frame_size;
+    const scale = Math.min(cw / fw, ch / fh);
+    const ox = (cw - fw * scale) / 2, oy = (ch - fh * scale) / 2;
+    const X = (x) => ox + x * scale;
+    const Y = (y) => oy + y * scale;
+
+    ctx.lineWidth = 2;
+    ctx.font = '14px sans-serif';
+    event.detections.forEach(d => {
+      ctx.strokeStyle = '#00ff00';
+      ctx.strokeRect(X(d.box[0]), Y(d.box[1]), (d.box[2] - d.box[0]) * scale, (d.box[3] - d.box[1]) * scale);
+      const label = `${d.class_name} #${d.track_id} ${d.confidence.toFixed(2)}`;
+      ctx.fillStyle = '#00ff00';
+      ctx.fillText(label, X(d.box[0]), Math.max(Y(d.box[1]) - 5, 14));
+    });
+
+    const topo = topologyRef.current;
+    const bgr = (c) => `rgb(${c[2]}, ${c[1]}, ${c[0]})`; // Los colores del backend vienen en BGR
+    const drawMesh = (pts, edges) => {
+      if (!topo) return;
+      ctx.strokeStyle = bgr(topo.color_lineas);
+      ctx.lineWidth = status?.GROSOR_LINEAS || 1;
+      ctx.beginPath();
+      edges.forEach(([a, b]) => {
+        ctx.moveTo(X(pts[2 * a]), Y(pts[2 * a + 1]));
+        ctx.lineTo(X(pts[2 * b]), Y(pts[2 * b + 1]));
+      });
+      ctx.stroke();
+      ctx.fillStyle = bgr(topo.color_puntos);
+      const r = status?.GROSOR_PUNTOS || 1;
+      for (let i = 0; i < pts.length; i += 2) ctx.fillRect(X(pts[i]) - r / 2, Y(pts[i + 1]) - r / 2, r, r);
+    };
+    event.faces.forEach(pts => {
+      drawMesh(pts, topo ? [...topo.face_tesselation, ...topo.face_contours, ...topo.face_irises] : []);
+    });
+    if (event.pose) drawMesh(event.pose, topo ? topo.pose_connections : []);
+
+    ctx.fillStyle = '#ffffff';
+    ctx.font = '16px sans-serif';
+    ctx.fillText(`FPS: ${event.fps.toFixed(1)} | ${event.source.toUpperCase()}`, X(10), Y(0) + 20);
+  };
+
   const handleToggleFeature = async (featureName) => {
     if (!isServiceRunning) return;
     try {
@@ -110,8 +211,10 @@ function PTZApp() {
         body: JSON.stringify({ param_name: paramName, value: finalValue }),
       });
       // Actualizar el estado local inmediatamente para una UI más reactiva
+      // (get_status devuelve los parámetros en el nivel superior del JSON)
       setStatus(prev => ({
         ...prev,
+        [paramName]: finalValue,
         params: {
           ...prev.params,
           [paramName]: finalValue // Guardar el valor final que se envió al backend
@@ -186,7 +289,19 @@ function PTZApp() {
 
       {error && <div className="bg-red-100 border border-red-400 text-red-700 px-4 py-3 rounded relative mb-4" role="alert">{error}</div>}
       
-      {isServiceRunning && status && !status.rtsp_open && (
+      {isServiceRunning && status?.state === 'starting' && (
+        <div className="bg-blue-100 border-l-4 border-blue-500 text-blue-700 p-4 mb-4" role="status">
+          <p>Iniciando servicio (conexión, carga de modelos y warm-up)...</p>
+        </div>
+      )}
+
+      {isServiceRunning && status?.state === 'error' && (
+        <div className="bg-red-100 border border-red-400 text-red-700 px-4 py-3 rounded relative mb-4" role="alert">
+          Error al iniciar el servicio PTZ: {status.start_error}
+        </div>
+      )}
+
+      {isServiceRunning && status && status.state === 'running' && !status.rtsp_open && (
         <div className="bg-yellow-100 border-l-4 border-yellow-500 text-yellow-700 p-4 mb-4" role="alert">
           <p className="font-bold">Advertencia:</p>
           <p>El stream RTSP no está abierto. Asegúrate de que la cámara está conectada y la configuración es correcta en el backend.</p>
@@ -197,12 +312,22 @@ function PTZApp() {
         <div className="bg-gray-800 rounded-lg overflow-hidden shadow-lg flex flex-col">
           <h2 className="text-xl text-white p-4 border-b border-gray-700">Visualización de Cámara</h2>
           <div className="relative w-full flex-grow" style={{ minHeight: '360px' }}>
-            {isServiceRunning ? (
+            {usePassthrough ? (
+              <video
+                ref={videoRef}
+                muted
+                autoPlay
+                playsInline
+                className="absolute top-0 left-0 w-full h-full object-contain bg-black"
+              />
+            ) : isServiceRunning ? (
               <img
-                src={`${VIDEO_FEED_URL}?t=${new Date().getTime()}`}
+                ref={imgRef}
+                src={useMjpeg ? `${VIDEO_FEED_URL}?t=${new Date().getTime()}` : undefined}
                 alt="Video Stream"
                 className="absolute top-0 left-0 w-full h-full object-contain"
                 onError={(e) => {
+                  if (!useMjpeg) return;
                   e.target.onerror = null;
                   setError('El stream de video no está disponible. Verifica la conexión RTSP.');
                   setIsServiceRunning(false);
@@ -213,6 +338,19 @@ function PTZApp() {
                 <span className="text-gray-400">Servicio detenido</span>
               </div>
             )}
+            {clientOverlay && (
+              <canvas ref={canvasRef} className="absolute top-0 left-0 w-full h-full pointer-events-none" />
+            )}
+            {usePassthrough && mse.kbps !== null && (
+              <span className="absolute bottom-2 left-2 bg-black/60 text-white text-xs px-2 py-1 rounded" title="Video H.264 de la cámara sin decodificar en el servidor">
+                H.264 directo · {status.passthrough_codec} · {mse.kbps.toFixed(0)} kbps
+              </span>
+            )}
+            {!usePassthrough && isServiceRunning && video.latency && (
+              <span className="absolute bottom-2 left-2 bg-black/60 text-white text-xs px-2 py-1 rounded" title="Captura → pantalla requiere relojes sincronizados (NTP)">
+                WebSocket · captura→pantalla {video.latency.glass_ms.toFixed(0)} ms · servidor {video.latency.server_ms.toFixed(0)} ms
+              </span>
+            )}
           </div>
           <div className="p-4 bg-gray-900">
             {!isServiceRunning ? (
@@ -246,6 +384,14 @@ function PTZApp() {
                     <input type="checkbox" className="form-checkbox h-5 w-5 text-blue-600" checked={status.do_body} onChange={() => handleToggleFeature('body')} />
                     <span className="ml-2 text-gray-700">Corporal</span>
                   </label>
+                  <label className="inline-flex items-center">
+                    <input type="checkbox" className="form-checkbox h-5 w-5 text-blue-600" checked={!!status.CLIENT_OVERLAY} onChange={() => handleSetParam('CLIENT_OVERLAY', status.CLIENT_OVERLAY ? 0 : 1)} />
+                    <span className="ml-2 text-gray-700">Overlay en cliente</span>
+                  </label>
+                  <label className="inline-flex items-center">
+                    <input type="checkbox" className="form-checkbox h-5 w-5 text-blue-600" checked={!!status.PASSTHROUGH} onChange={() => handleSetParam('PASSTHROUGH', status.PASSTHROUGH ? 0 : 1)} />
+                    <span className="ml-2 text-gray-700">H.264 directo sin análisis</span>
+                  </label>
                 </div>
               </div>
 
@@ -272,7 +418,7 @@ function PTZApp() {
               {/* Sección de Trackbars para Parámetros */}
               <div className="mb-6">
                 <h3 className="text-lg font-medium mb-2">Ajuste de Parámetros</h3>
-                {status.params && Object.keys(status.params).map(paramName => {
+                {status.params && Object.keys(status.params).filter(p => p !== 'CLIENT_OVERLAY' && p !== 'PASSTHROUGH' && !Array.isArray(status.params[p])).map(paramName => {
                   const { min, max, step } = getParamProps(paramName);
                   // Para mostrar el valor correcto en el UI, especialmente para flotantes
                   const displayValue = ['YOLO_CONF_THRESHOLD', 'YOLO_IOU_THRESHOLD', 'PAN_SPEED', 'TILT_SPEED', 'ZOOM_SPEED'].includes(paramName)
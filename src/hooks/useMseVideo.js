@@ -0,0 +1,116 @@
+import { useEffect, useState } from 'react';
+
+// Passthrough H.264 (/ptz_feed.mp4): el servidor no decodifica, solo remuxa el
+// stream de la cámara a MP4 fragmentado, y el <video> lo reproduce con Media
+// Source Extensions. Se mantiene en el borde en vivo: si el buffer se queda más
+// de 1 s por detrás se salta al final, y lo ya reproducido se libera. Si el
+// stream termina (ffmpeg se reinició, se activó un análisis) se reconecta; si el
+// navegador no soporta el códec, `state` pasa a 'unsupported' y el componente
+// vuelve al MJPEG/WebSocket.
+
+const MAX_LAG_S = 1.0;
+const KEEP_BEHIND_S = 10;
+const RETRY_MS = 2000;
+
+export function useMseVideo(url, codec, enabled, videoRef) {
+  const [state, setState] = useState('idle'); // idle | connecting | playing | unsupported | failed
+  const [kbps, setKbps] = useState(null);
+
+  useEffect(() => {
+    const mime = codec && `video/mp4; codecs="${codec}"`;
+    if (!enabled || !mime) {
+      setState('idle');
+      return;
+    }
+    if (!window.MediaSource || !MediaSource.isTypeSupported(mime)) {
+      setState('unsupported');
+      return;
+    }
+    let closed = false;
+    let controller = null;
+    let retry = null;
+    let bytes = 0;
+    let failures = 0;
+
+    const connect = () => {
+      const video = videoRef.current;
+      if (closed || !video) return;
+      setState('connecting');
+      controller = new AbortController();
+      const mediaSource = new MediaSource();
+      const objectUrl = URL.createObjectURL(mediaSource);
+      const queue = [];
+      let sourceBuffer = null;
+
+      const reconnect = () => {
+        URL.revokeObjectURL(objectUrl);
+        if (closed) return;
+        if (++failures >= 3) {
+          setState('failed');
+          return;
+        }
+        retry = setTimeout(connect, RETRY_MS);
+      };
+
+      const pump = () => {
+        if (!sourceBuffer || sourceBuffer.updating) return;
+        const { buffered, currentTime } = video;
+        if (buffered.length) {
+          const liveEdge = buffered.end(buffered.length - 1);
+          if (liveEdge - currentTime > MAX_LAG_S) video.currentTime = liveEdge - 0.1;
+          if (currentTime - buffered.start(0) > KEEP_BEHIND_S) {
+            sourceBuffer.remove(buffered.start(0), currentTime - KEEP_BEHIND_S / 2);
+            return; // 'updateend' vuelve a llamar a pump
+          }
+        }
+        if (queue.length) sourceBuffer.appendBuffer(queue.shift());
+      };
+
+      mediaSource.addEventListener('sourceopen', async () => {
+        sourceBuffer = mediaSource.addSourceBuffer(mime);
+        sourceBuffer.mode = 'segments';
+        sourceBuffer.addEventListener('updateend', pump);
+        try {
+          const response = await fetch(url, { signal: controller.signal });
+          if (!response.ok) throw new Error(`HTTP ${response.status}`);
+          const reader = response.body.getReader();
+          for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            bytes += value.byteLength;
+            queue.push(value);
+            pump();
+            if (video.paused) video.play().catch(() => {});
+            failures = 0;
+            setState('playing');
+          }
+        } catch (e) {
+          if (closed) return;
+        }
+        reconnect();
+      }, { once: true });
+      video.src = objectUrl;
+    };
+
+    connect();
+    const interval = setInterval(() => {
+      setKbps(bytes ? (bytes * 8) / 1000 : null);
+      bytes = 0;
+    }, 1000);
+
+    return () => {
+      closed = true;
+      clearInterval(interval);
+      clearTimeout(retry);
+      if (controller) controller.abort();
+      const video = videoRef.current;
+      if (video) {
+        video.removeAttribute('src');
+        video.load();
+      }
+      setKbps(null);
+    };
+  }, [url, codec, enabled, videoRef]);
+
+  return { state, kbps };
+}
@@ -0,0 +1,100 @@
+import { useEffect, useRef, useState } from 'react';
+
+// Video por WebSocket (servidor ASGI, backend_asgi.py): cada mensaje binario trae
+// una cabecera fija de 24 bytes, un JSON con los metadatos del frame y la imagen.
+// Tras mostrar cada frame se responde {"ack": seq}: el servidor no envía más de
+// 2 frames sin confirmar, así que un cliente lento recibe menos frames en vez de
+// acumular retraso. Si el servidor no tiene WebSocket (python backend_server.py),
+// `state` pasa a 'failed' y el componente vuelve al MJPEG.
+
+const HEADER_BYTES = 24;
+const MIME_TYPES = ['image/jpeg', 'image/webp'];
+
+export function wsUrl(httpUrl) {
+  return httpUrl.replace(/^http/, 'ws') + '/ws';
+}
+
+const median = (values) => {
+  if (!values.length) return null;
+  const sorted = [...values].sort((a, b) => a - b);
+  return sorted[Math.floor(sorted.length / 2)];
+};
+
+export function useWsVideo(url, enabled, imgRef, onFrame) {
+  const [state, setState] = useState('idle'); // idle | connecting | open | closed | failed
+  const [latency, setLatency] = useState(null); // { glass_ms, server_ms } (medianas del último segundo)
+  const onFrameRef = useRef(onFrame);
+  onFrameRef.current = onFrame;
+
+  useEffect(() => {
+    if (!enabled) {
+      setState('idle');
+      return;
+    }
+    let closed = false;
+    let opened = false;
+    let pendingUrl = null; // Frame recibido que aún no ha cargado el <img>
+    let shownUrl = null;
+    let glass = [];
+    let server = [];
+    const decoder = new TextDecoder();
+    setState('connecting');
+    const ws = new WebSocket(url);
+    ws.binaryType = 'arraybuffer';
+    ws.onopen = () => {
+      opened = true;
+      setState('open');
+    };
+    ws.onclose = () => {
+      if (!closed) setState(opened ? 'closed' : 'failed');
+    };
+    ws.onmessage = (e) => {
+      const view = new DataView(e.data);
+      const jsonLength = view.getUint32(0);
+      const seq = view.getUint32(4);
+      const sendTs = view.getFloat64(8);
+      const format = view.getUint8(20);
+      const meta = JSON.parse(decoder.decode(new Uint8Array(e.data, HEADER_BYTES, jsonLength)));
+      const img = imgRef.current;
+      if (!img) {
+        ws.send(JSON.stringify({ ack: seq }));
+        return;
+      }
+      // Si el anterior aún no se mostró, se descarta: siempre se pinta el más reciente.
+      if (pendingUrl) URL.revokeObjectURL(pendingUrl);
+      const blob = new Blob([new Uint8Array(e.data, HEADER_BYTES + jsonLength)], { type: MIME_TYPES[format] });
+      const objectUrl = URL.createObjectURL(blob);
+      pendingUrl = objectUrl;
+      img.onload = () => {
+        if (closed || ws.readyState !== WebSocket.OPEN) return;
+        ws.send(JSON.stringify({ ack: seq }));
+        if (shownUrl) URL.revokeObjectURL(shownUrl);
+        shownUrl = objectUrl;
+        pendingUrl = null;
+        if (meta.capture_ts) {
+          // Captura -> pantalla (requiere relojes sincronizados por NTP) y la parte del servidor.
+          glass.push(Date.now() - meta.capture_ts * 1000);
+          server.push((sendTs - meta.capture_ts) * 1000);
+        }
+        if (onFrameRef.current) onFrameRef.current(meta);
+      };
+      img.src = objectUrl;
+    };
+    const interval = setInterval(() => {
+      if (glass.length) setLatency({ glass_ms: median(glass), server_ms: median(server) });
+      glass = [];
+      server = [];
+    }, 1000);
+
+    return () => {
+      closed = true;
+      clearInterval(interval);
+      ws.close();
+      if (pendingUrl) URL.revokeObjectURL(pendingUrl);
+      if (shownUrl) URL.revokeObjectURL(shownUrl);
+      setLatency(null);
+    };
+  }, [url, enabled, imgRef]);
+
+  return { state, latency };
+}
@@ -0,0 +1,125 @@
+# Benchmark de memoria de la ingesta de frames crudos de ffmpeg.
+#
+# Compara la ruta antigua (read -> frombuffer -> copy) con la ruta de FFmpegCapture
+# (readinto sobre un FramePool) usando un proceso que emite frames BGR sintéticos
+# por stdout, igual que ffmpeg con `-f rawvideo`. No necesita cámara ni ffmpeg.
+#
+# Uso (desde la raíz del proyecto):
+#   python tools/bench_capture_memory.py --frames 500 --width 640 --height 352
+
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend_apps.ptz.ffmpeg_capture import FFmpegCapture
+
+WRITER = (
+    "import sys\n"
+    "frame = bytes(range(256)) * ({size} // 256 + 1)\n"
+    "frame = frame[:{size}]\n"
+    "out = sys.stdout.buffer\n"
+    "for _ in range({frames}):\n"
+    "    out.write(frame)\n"
+    "out.flush()\n"
+)
+
+
+def writer_command(frames, frame_size):
+    return [sys.executable, '-c', WRITER.format(frames=frames, size=frame_size)]
+
+
+class SyntheticCapture(FFmpegCapture):
+    RECONNECT_MIN_DELAY = 60.0 # Al terminar el clip no se reconecta durante la medición
+    def __init__(self, frames, width, height):
+        super().__init__("synthetic://", width, height)
+        self.frames = frames
+        self.native_size = (width, height) # No hay nada que sondear
+
+    def build_command(self):
+        return writer_command(self.frames, self.frame_size)
+
+
+def gc_collections():
+    return sum(s["collections"] for s in gc.get_stats())
+
+
+def bench_legacy(frames, width, height):
+    frame_size = width * height * 3
+    proc = subprocess.Popen(writer_command(frames, frame_size), stdout=subprocess.PIPE)
+    allocated = 0
+    count = 0
+    published = None
+    gc0 = gc_collections()
+    t0 = time.perf_counter()
+    while True:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        raw_frame = proc.stdout.read(frame_size)
+        if len(raw_frame) < frame_size:
+            break
+        frame = np.frombuffer(raw_frame, np.uint8).reshape((height, width, 3))
+        processed_frame = frame.copy()
+        processed_frame[0, 0, 0] ^= 1 # "Dibujar" algo
+        published = processed_frame
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+        count += 1
+    elapsed = time.perf_counter() - t0
+    proc.wait()
+    return count, elapsed, allocated, gc_collections() - gc0, None
+
+
+def bench_pool(frames, width, height):
+    capture = SyntheticCapture(frames, width, height)
+    capture.start()
+    allocated = 0
+    count = 0
+    published = None
+    last_seq = 0
+    gc0 = gc_collections()
+    t0 = time.perf_counter()
+    while True:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        last_seq, frame = capture.buffer.acquire_latest(last_seq, timeout=1.0)
+        if frame is None:
+            break
+        frame[0, 0, 0] ^= 1 # "Dibujar" algo
+        published = frame
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+        count += 1
+    elapsed = time.perf_counter() - t0 - 1.0 # Descontar el timeout final
+    capture.stop()
+    return count, elapsed, allocated, gc_collections() - gc0, capture
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria de la ingesta de frames de ffmpeg")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=352)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    for name, bench in (("read+copy (antiguo)", bench_legacy), ("readinto+pool", bench_pool)):
+        count, elapsed, allocated, collections, capture = bench(args.frames, args.width, args.height)
+        per_frame = allocated / max(count, 1)
+        print(f"{name:22s} frames={count:5d}  {count / elapsed:8.1f} fps  "
+              f"alloc/frame={per_frame / 1024:9.1f} KiB  gc={collections}", end="")
+        if capture is not None:
+            print(f"  pool={len(capture.pool)} (creció {capture.pool.grown}, sueltos {capture.pool.overflow})  "
+                  f"descartados={capture.buffer.dropped}", end="")
+        print()
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Benchmark de variantes del detector YOLOv5 (backend x precisión) sobre un clip grabado.
+#
+# Cada variante corre en un proceso propio (memoria medida sin contaminación de
+# las demás) sobre los mismos frames. Informa:
+#   - acuerdo con la referencia (la primera variante, FP32): AP50 tomando sus
+#     detecciones como verdad (proxy de mAP), precisión/recall y IoU medio de los aciertos;
+#   - latencia por frame (p50 / p90 / p99) tras un calentamiento;
+#   - tiempo de carga, RSS pico del proceso y tamaño del fichero del modelo.
+#
+# Uso (desde la raíz del proyecto):
+#   python tools/bench_model_variants.py --clip linea.mp4 \
+#       --variants onnx:fp32 onnx:fp16 onnx:int8 openvino:fp32 openvino:int8 torch:fp32
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+from queue import Empty
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend_apps.ptz.config import get_camera_config
+from backend_apps.ptz.inference import create_detector, exported_model_path
+from backend_apps.ptz.tracker import iou_matrix
+from tools.export_yolov5 import read_clip
+
+
+def rss_mb():
+    # ru_maxrss viene en KiB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(config, frames, conf, iou, warmup, queue):
+    try:
+        t0 = time.perf_counter()
+        detector = create_detector(config)
+        detector.set_thresholds(conf=conf, iou=iou)
+        load_s = time.perf_counter() - t0
+        for f in frames[:warmup]:
+            detector.detect_batch([f])
+        detections, latencies = [], []
+        for f in frames:
+            t = time.perf_counter()
+            detections.append(detector.detect_batch([f])[0])
+            latencies.append((time.perf_counter() - t) * 1000)
+    except Exception as e:
+        queue.put({"error": str(e)})
+        return
+    queue.put({"detections": detections, "latencies": latencies, "load_s": load_s, "rss_mb": rss_mb()})
+
+
+def agreement(reference, candidate, iou_threshold=0.5):
+    """AP50, precisión, recall e IoU medio de `candidate` frente a `reference` (misma clase)."""
+    scored, n_ref, ious = [], 0, []
+    for ref, det in zip(reference, candidate):
+        n_ref += len(ref)
+        matched = set()
+        order = np.argsort(-det[:, 4]) if len(det) else []
+        overlaps = iou_matrix(det[:, :4], ref[:, :4]) if len(det) and len(ref) else None
+        for i in order:
+            hit = False
+            if overlaps is not None:
+                same = ref[:, 5].astype(int) == int(det[i, 5])
+                cand = np.where(same, overlaps[i], 0.0)
+                cand[list(matched)] = 0.0
+                j = int(cand.argmax())
+                if cand[j] >= iou_threshold:
+                    matched.add(j)
+                    ious.append(float(cand[j]))
+                    hit = True
+            scored.append((float(det[i, 4]), hit))
+    if not scored or not n_ref:
+        return {"ap50": 0.0, "precision": 0.0, "recall": 0.0, "mean_iou": 0.0}
+    scored.sort(key=lambda s: -s[0])
+    hits = np.array([h for _, h in scored], float)
+    tp = np.cumsum(hits)
+    precision = tp / np.arange(1, len(hits) + 1)
+    recall = tp / n_ref
+    # AP con interpolación en todos los puntos (como VOC/COCO)
+    envelope = np.maximum.accumulate(precision[::-1])[::-1]
+    ap = float(np.sum(np.diff(np.concatenate([[0.0], recall])) * envelope))
+    return {"ap50": ap, "precision": float(precision[-1]), "recall": float(recall[-1]),
+            "mean_iou": float(np.mean(ious)) if ious else 0.0}
+
+
+def model_size_mb(config):
+    backend = config["INFERENCE_BACKEND"]
+    if backend == "torch":
+        return None
+    path = exported_model_path(config, backend)
+    size = os.path.getsize(path)
+    if backend == "openvino":
+        size += os.path.getsize(os.path.splitext(path)[0] + ".bin")
+    return size / 2**20
+
+
+def wait_result(proc, queue, timeout):
+    """Resultado de la variante, o {"error": ...} si su proceso muere o no termina a tiempo."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return queue.get(timeout=1.0)
+        except Empty:
+            if not proc.is_alive(): # Murió sin enviar nada (OOM, segfault del runtime...)
+                try:
+                    return queue.get(timeout=1.0)
+                except Empty:
+                    return {"error": f"el proceso terminó sin resultado (exitcode {proc.exitcode})"}
+    proc.kill()
+    proc.join()
+    return {"error": f"sin resultado en {timeout:g}s (exitcode {proc.exitcode})"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara variantes del detector YOLOv5 sobre un clip.")
+    parser.add_argument("--clip", required=True)
+    parser.add_argument("--variants", nargs="+", default=["onnx:fp32", "onnx:fp16", "onnx:int8"],
+                        help="backend:precisión; la primera es la referencia")
+    parser.add_argument("--camera", default="default")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.45)
+    parser.add_argument("--timeout", type=float, default=1800.0, help="Segundos máximos por variante")
+    args = parser.parse_args()
+
+    base = get_camera_config(args.camera)
+    frames = read_clip(args.clip, base["FRAME_WIDTH"], base["FRAME_HEIGHT"], max_frames=args.frames)
+    print(f"[INFO] {len(frames)} frames de {args.clip} a {base['FRAME_WIDTH']}x{base['FRAME_HEIGHT']}")
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for variant in args.variants:
+        backend, precision = variant.split(":")
+        config = {**base, "INFERENCE_BACKEND": backend, "MODEL_PRECISION": precision}
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_variant, args=(config, frames, args.conf, args.iou, args.warmup, queue))
+        proc.start()
+        result = wait_result(proc, queue, args.timeout)
+        proc.join()
+        if "error" in result:
+            print(f"[ERR] {variant}: {result['error']}")
+            continue
+        try:
+            result["size_mb"] = model_size_mb(config)
+        except OSError:
+            result["size_mb"] = None
+        results[variant] = result
+        print(f"[OK] {variant} terminado")
+
+    if not results:
+        return
+    reference = next(iter(results.values()))["detections"]
+    header = f"{'variante':<16}{'AP50':>7}{'prec':>7}{'recall':>7}{'IoU':>6}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}" \
+             f"{'carga s':>9}{'RSS MB':>9}{'modelo MB':>11}"
+    print(header)
+    print("-" * len(header))
+    for variant, r in results.items():
+        a = agreement(reference, r["detections"])
+        p50, p90, p99 = np.percentile(r["latencies"], [50, 90, 99])
+        size = f"{r['size_mb']:.1f}" if r["size_mb"] is not None else "-"
+        print(f"{variant:<16}{a['ap50']:>7.3f}{a['precision']:>7.3f}{a['recall']:>7.3f}{a['mean_iou']:>6.2f}"
+              f"{p50:>9.1f}{p90:>9.1f}{p99:>9.1f}{r['load_s']:>9.1f}{r['rss_mb']:>9.0f}{size:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Exporta el YOLOv5 configurado para la PTZ a ONNX u OpenVINO IR, en FP32, FP16 o INT8.
+#
+# Se ejecuta una vez (usa la caché de tools/fetch_models.py o, si no, Torch Hub con red) y deja el modelo en MODEL_DIR con
+# el nombre que esperan INFERENCE_BACKEND y MODEL_PRECISION (ej. yolov5s.onnx,
+# yolov5s-fp16.onnx, yolov5s-int8.xml), más <modelo>.names.json con las clases.
+# Después el servidor arranca sin torch ni red con INFERENCE_BACKEND = "onnx" u "openvino".
+#
+# INT8: sin --calibration se hace cuantización dinámica (solo pesos, ONNX Runtime);
+# con un clip grabado de la línea se hace cuantización estática (pesos y
+# activaciones, formato QDQ), que es la que admite también OpenVINO.
+# FP16 con ONNX necesita el paquete onnxconverter-common.
+#
+# Uso (desde la raíz del proyecto):
+#   python tools/export_yolov5.py --format onnx
+#   python tools/export_yolov5.py --format onnx --precision fp32 fp16 int8 --calibration linea.mp4
+#   python tools/export_yolov5.py --format openvino --precision int8 --calibration linea.mp4 --camera linea2
+
+import argparse
+import json
+import os
+import sys
+
+import cv2
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend_apps.ptz.backends import letterbox_batch
+from backend_apps.ptz.config import get_camera_config
+from backend_apps.ptz.inference import PRECISIONS, exported_model_path, load_yolov5, names_path
+
+
+def read_clip(path, width, height, max_frames=None, step=1):
+    """Frames BGR de un vídeo grabado, escalados a la resolución de inferencia (como hace ffmpeg)."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"No se pudo abrir el clip {path}")
+    frames, index = [], 0
+    while max_frames is None or len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if index % step == 0:
+            frames.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+        index += 1
+    cap.release()
+    return frames
+
+
+def detection_model(model):
+    """AutoShape -> DetectMultiBackend -> DetectionModel (el nn.Module exportable)."""
+    import torch
+    inner = model
+    while hasattr(inner, "model") and not isinstance(inner.model, torch.nn.Sequential):
+        inner = inner.model
+    return inner
+
+
+def export_onnx(model, path, size, opset):
+    import torch
+    net = detection_model(model).float().eval().cpu()
+    for m in net.modules():
+        if type(m).__name__ == "Detect":
+            m.inplace = False
+            m.dynamic = True # Rejilla calculada con la forma real: admite tamaños y lotes variables
+            m.export = True # Solo la salida concatenada (N, anchors, 5 + clases)
+    dummy = torch.zeros(1, 3, size, size)
+    torch.onnx.export(net, dummy, path, opset_version=opset, do_constant_folding=True,
+                      input_names=["images"], output_names=["output0"],
+                      dynamic_axes={"images": {0: "batch", 2: "height", 3: "width"},
+                                    "output0": {0: "batch", 1: "anchors"}})
+    print(f"[OK] ONNX exportado: {path}")
+
+
+def convert_onnx_fp16(src, dst):
+    import onnx
+    from onnxconverter_common import float16
+    # Entrada y salida siguen en float32: el pre/postproceso no cambia.
+    onnx.save(float16.convert_float_to_float16(onnx.load(src), keep_io_types=True), dst)
+    print(f"[OK] ONNX FP16: {dst}")
+
+
+class _ClipCalibrationReader:
+    """Alimenta la calibración de la cuantización estática con frames del clip."""
+
+    def __init__(self, input_name, frames, size):
+        self._batches = iter([{input_name: letterbox_batch([f], size)[0]} for f in frames])
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+def quantize_onnx_int8(src, dst, calibration_frames, size):
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    if not calibration_frames:
+        quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+        print(f"[OK] ONNX INT8 dinámico: {dst}")
+        return
+    reader = _ClipCalibrationReader("images", calibration_frames, size)
+    quantize_static(src, dst, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    print(f"[OK] ONNX INT8 estático ({len(calibration_frames)} frames de calibración): {dst}")
+
+
+def export_openvino(onnx_path, path, fp16):
+    import openvino as ov
+    ov.save_model(ov.convert_model(onnx_path), path, compress_to_fp16=fp16)
+    print(f"[OK] OpenVINO IR exportado: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta YOLOv5 a ONNX / OpenVINO para el servicio PTZ.")
+    parser.add_argument("--format", choices=("onnx", "openvino"), default="onnx")
+    parser.add_argument("--precision", choices=PRECISIONS, nargs="+", default=["fp32"])
+    parser.add_argument("--calibration", help="Clip grabado para INT8 estático")
+    parser.add_argument("--calibration-frames", type=int, default=200)
+    parser.add_argument("--camera", default="default", help="Cámara de CAMERAS cuya config de modelo se usa")
+    parser.add_argument("--size", type=int, default=640, help="Tamaño del trazado (el modelo admite otros)")
+    parser.add_argument("--opset", type=int, default=13)
+    args = parser.parse_args()
+
+    config = get_camera_config(args.camera)
+    if args.format == "openvino" and "int8" in args.precision and not args.calibration:
+        parser.error("INT8 con OpenVINO necesita --calibration (cuantización estática)")
+    os.makedirs(config["MODEL_DIR"], exist_ok=True)
+    model, _ = load_yolov5(config['USE_CUSTOM_WEIGHTS'], config['WEIGHTS'], config['MODEL_NAME'],
+                           model_dir=config["MODEL_DIR"])
+
+    onnx_fp32 = exported_model_path(config, "onnx", "fp32")
+    export_onnx(model, onnx_fp32, args.size, args.opset)
+    with open(names_path(config), "w") as f:
+        json.dump({int(k): v for k, v in dict(model.names).items()}, f, indent=1)
+
+    calibration = []
+    if "int8" in args.precision and args.calibration:
+        calibration = read_clip(args.calibration, config["FRAME_WIDTH"], config["FRAME_HEIGHT"],
+                                max_frames=args.calibration_frames, step=5)
+
+    for precision in args.precision:
+        if precision == "int8":
+            onnx_int8 = exported_model_path(config, "onnx", "int8")
+            quantize_onnx_int8(onnx_fp32, onnx_int8, calibration, args.size)
+        if args.format == "onnx":
+            if precision == "fp16":
+                convert_onnx_fp16(onnx_fp32, exported_model_path(config, "onnx", "fp16"))
+        else:
+            # OpenVINO: FP16 comprimiendo los pesos; INT8 a partir del ONNX QDQ.
+            src = onnx_int8 if precision == "int8" else onnx_fp32
+            export_openvino(src, exported_model_path(config, "openvino", precision), fp16=precision == "fp16")
+    print(f"[INFO] Activa INFERENCE_BACKEND = \"{args.format}\" y MODEL_PRECISION en la config de la cámara.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# Rellena la caché local de modelos (MODEL_DIR) para arrancar el servicio PTZ sin red.
+#
+# Clona el código de YOLOv5 en la versión fijada en model_registry.YOLOV5_TAG,
+# descarga los pesos oficiales pedidos y guarda su SHA-256 en registry.json,
+# que se comprueba en cada carga. Los pesos propios (USE_CUSTOM_WEIGHTS) no se
+# descargan, pero también se cargan con el código local.
+#
+# Uso (desde la raíz del proyecto, con red):
+#   python tools/fetch_models.py
+#   python tools/fetch_models.py --models yolov5s yolov5n
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend_apps.ptz.config import CAMERAS, get_camera_config
+from backend_apps.ptz.model_registry import YOLOV5_TAG, fetch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Descarga YOLOv5 fijado a la caché local de modelos.")
+    parser.add_argument("--models", nargs="*", help="Pesos oficiales (por defecto, MODEL_NAME de cada cámara)")
+    args = parser.parse_args()
+
+    configs = [get_camera_config(camera_id) for camera_id in CAMERAS]
+    model_dir = configs[0]["MODEL_DIR"]
+    names = args.models or sorted({c["MODEL_NAME"] for c in configs if not c["USE_CUSTOM_WEIGHTS"]})
+    registry = fetch(model_dir, names)
+    print(f"[OK] Caché en {model_dir} (YOLOv5 {YOLOV5_TAG}):")
+    for name, entry in sorted(registry.items()):
+        print(f"  {name}  sha256={entry['sha256'][:16]}...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Prueba de carga del streaming MJPEG: abre cientos de espectadores simulados.
+#
+# Cada espectador es una corrutina con su propia conexión TCP que lee el stream
+# multipart y cuenta frames y bytes (sin decodificar JPEG: el cliente no debe ser
+# el cuello de botella). Se sube el número de espectadores por escalones y se
+# informa, para cada uno, fps por espectador (p5 / p50), fps y MB/s agregados,
+# tiempo hasta el primer frame y conexiones fallidas. El "techo" es el último
+# escalón en el que el p5 de fps por espectador sigue por encima de --min-fps.
+#
+# Con --slow-viewers se añaden espectadores que leen muy despacio (Wi-Fi mala):
+# los demás no deberían perder fps.
+#
+# Uso (desde la raíz del proyecto), con el servidor arrancado con cámara sintética:
+#   ANTARES_SYNTHETIC_CAMERA=1 python backend_asgi.py        (o python backend_server.py)
+#   python tools/load_test_stream.py --viewers 50 100 200 500 1000 --duration 20
+#   python tools/load_test_stream.py --url "http://127.0.0.1:5000/synthetic_feed?width=640&quality=70"
+
+import argparse
+import asyncio
+import resource
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+BOUNDARY = b'--frame\r\n'
+
+
+class Viewer:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.first_frame_s = None
+        self.error = None
+
+
+async def run_viewer(url, viewer, stop, slow=False):
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    t0 = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        status = await reader.readline()
+        if b" 200 " not in status:
+            viewer.error = status.decode(errors="replace").strip() or "sin respuesta"
+            return
+        await reader.readuntil(b"\r\n\r\n")
+        tail = b""
+        while not stop.is_set():
+            chunk = await reader.read(1 << 16)
+            if not chunk:
+                viewer.error = "conexión cerrada por el servidor"
+                return
+            viewer.bytes += len(chunk)
+            data = tail + chunk
+            found = data.count(BOUNDARY)
+            if found:
+                viewer.frames += found
+                if viewer.first_frame_s is None:
+                    viewer.first_frame_s = time.perf_counter() - t0
+            tail = data[-(len(BOUNDARY) - 1):] # Un separador partido entre dos lecturas
+            if slow:
+                await asyncio.sleep(1.0) # Lee 64 KiB por segundo: el socket se llena
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+        viewer.error = str(e) or type(e).__name__
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run_step(url, n, duration, ramp_rate, slow_viewers):
+    stop = asyncio.Event()
+    viewers = [Viewer() for _ in range(n)]
+    tasks = []
+    for i, viewer in enumerate(viewers):
+        tasks.append(asyncio.create_task(run_viewer(url, viewer, stop)))
+        if ramp_rate and i % ramp_rate == ramp_rate - 1:
+            await asyncio.sleep(1.0) # Conexiones escalonadas: ramp_rate por segundo
+    slow_tasks = [asyncio.create_task(run_viewer(url, Viewer(), stop, slow=True)) for _ in range(slow_viewers)]
+    # Se mide solo cuando todos han tenido tiempo de conectar.
+    await asyncio.sleep(2.0)
+    start = [(v.frames, v.bytes) for v in viewers]
+    t_start = time.perf_counter()
+    await asyncio.sleep(duration)
+    elapsed = time.perf_counter() - t_start
+    end = [(v.frames, v.bytes) for v in viewers]
+    stop.set()
+    for task in tasks + slow_tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, *slow_tasks, return_exceptions=True)
+
+    ok = [i for i, v in enumerate(viewers) if v.error is None]
+    fps = np.array([(end[i][0] - start[i][0]) / elapsed for i in ok]) if ok else np.zeros(1)
+    mbps = sum(end[i][1] - start[i][1] for i in ok) / elapsed / 2**20
+    first = [v.first_frame_s for v in viewers if v.first_frame_s is not None]
+    errors = {}
+    for v in viewers:
+        if v.error:
+            errors[v.error] = errors.get(v.error, 0) + 1
+    return {
+        "viewers": n, "ok": len(ok), "failed": n - len(ok),
+        "fps_p5": float(np.percentile(fps, 5)), "fps_p50": float(np.percentile(fps, 50)),
+        "fps_total": float(fps.sum()), "mbps": mbps,
+        "first_p50": float(np.percentile(first, 50)) if first else float("nan"),
+        "first_p95": float(np.percentile(first, 95)) if first else float("nan"),
+        "errors": errors,
+    }
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+async def main_async(args):
+    limit = raise_fd_limit()
+    if max(args.viewers) + args.slow_viewers > limit - 32:
+        print(f"[WARN] Límite de descriptores {limit}: no caben {max(args.viewers)} conexiones (ulimit -n).")
+    header = f"{'viewers':>8}{'ok':>7}{'fail':>6}{'fps p5':>8}{'fps p50':>9}{'fps total':>11}{'MB/s':>8}" \
+             f"{'1er frame p50':>15}{'p95':>7}"
+    print(header)
+    print("-" * len(header))
+    ceiling = None
+    for n in args.viewers:
+        r = await run_step(args.url, n, args.duration, args.ramp_rate, args.slow_viewers)
+        print(f"{r['viewers']:>8}{r['ok']:>7}{r['failed']:>6}{r['fps_p5']:>8.1f}{r['fps_p50']:>9.1f}"
+              f"{r['fps_total']:>11.0f}{r['mbps']:>8.1f}{r['first_p50']:>14.2f}s{r['first_p95']:>6.2f}s")
+        for error, count in r["errors"].items():
+            print(f"{'':>8}[ERR] {count} x {error}")
+        if r["failed"] == 0 and r["fps_p5"] >= args.min_fps:
+            ceiling = n
+        else:
+            break
+        await asyncio.sleep(args.pause)
+    if ceiling is None:
+        print(f"[WARN] Ni el primer escalón mantiene {args.min_fps} fps por espectador.")
+    else:
+        print(f"[OK] Techo: {ceiling} espectadores con p5 >= {args.min_fps} fps y sin fallos.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de los streams MJPEG.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/synthetic_feed")
+    parser.add_argument("--viewers", type=int, nargs="+", default=[50, 100, 200, 500])
+    parser.add_argument("--duration", type=float, default=15.0, help="Segundos medidos por escalón")
+    parser.add_argument("--ramp-rate", type=int, default=200, help="Conexiones nuevas por segundo (0 = todas de golpe)")
+    parser.add_argument("--min-fps", type=float, default=10.0, help="fps mínimos (p5) por espectador")
+    parser.add_argument("--slow-viewers", type=int, default=0, help="Espectadores extra que leen muy despacio")
+    parser.add_argument("--pause", type=float, default=3.0, help="Pausa entre escalones")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Perfil de tiempo de importación (python -X importtime) de los módulos del backend.
+#
+# Cada módulo se importa en un intérprete nuevo, así las medidas no se pisan.
+# Muestra el tiempo total y los paquetes de primer nivel que más tardan, lo que
+# permite comprobar que `import backend_server` ya no arrastra torch, mediapipe,
+# onvif/zeep ni pyaudio (se cargan al arrancar la aplicación PTZ).
+#
+# Uso (desde la raíz del proyecto):
+#   python tools/profile_imports.py
+#   python tools/profile_imports.py backend_server torch mediapipe --top 15
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_MODULES = ["backend_server", "backend_apps.ptz.ptz_service", "torch", "mediapipe", "onvif", "pyaudio"]
+HEAVY = ("torch", "mediapipe", "onvif", "zeep", "pyaudio", "tensorflow", "onnxruntime", "openvino")
+
+
+def _importtime(code):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        # La sangría (dos espacios por nivel) indica quién importó a quién.
+        level = (len(name) - len(name.lstrip())) // 2
+        rows.append((level, name.strip(), int(cumulative)))
+    return rows
+
+
+def profile(module, baseline):
+    """Devuelve (segundos de pared, total_us, [(cumulativo_us, paquete)]) o None si no se puede importar."""
+    t0 = time.perf_counter()
+    rows = _importtime(f"import {module}")
+    wall = time.perf_counter() - t0
+    if rows is None:
+        return None
+    total, top, pending = 0, {}, []
+    # importtime escribe los hijos antes que el padre: se acumulan hasta ver su raíz (nivel 0).
+    for level, name, cumulative in rows:
+        if level == 1:
+            pending.append((name, cumulative))
+        elif level == 0:
+            if name not in baseline:
+                total += cumulative
+                for child, us in pending:
+                    root = child.split(".")[0]
+                    top[root] = top.get(root, 0) + us
+            pending = []
+    return wall, total, sorted(((us, name) for name, us in top.items()), reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de los módulos del backend.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    baseline = {name for level, name, _ in _importtime("pass") if level == 0} # Arranque del intérprete
+    for module in args.modules:
+        result = profile(module, baseline)
+        if result is None:
+            print(f"{module:<32} (no instalado / error al importar)")
+            continue
+        wall, total, top = result
+        total_ms = total / 1000
+        heavy = sorted({name for _, name in top if name in HEAVY})
+        print(f"{module:<32} {total_ms:8.0f} ms importando  ({wall:.2f} s con arranque del intérprete)"
+              + (f"  pesados: {', '.join(heavy)}" if heavy else ""))
+        for us, name in top[:args.top]:
+            print(f"    {name:<28} {us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()